@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.PathGenerators import get_max_height_dynamic
+from pycam.PathGenerators.DropCutter import DropCutter
+from pycam.Toolpath import MOVE_STRAIGHT
+import pycam.Toolpath.MotionGrid
+import pycam.Utils.DiskCache
+import pycam.Utils.threading
+
+
+class AdaptiveDropCutterTest(unittest.TestCase):
+
+    def setUp(self):
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        pycam.Utils.threading.init_threading(number_of_processes=1)
+        self.model = ImportModel("samples/Sphere_cut.stl")
+        self.cutter = SphericalCutter(1.0)
+        self.positions = [(x / 2.0, 0.5) for x in range(-14, 15)]
+
+    def test_added_count(self):
+        model = self.model
+        points, added_count = get_max_height_dynamic(model, self.cutter,
+                self.positions, model.minz, model.maxz + 1)
+        self.assertTrue(added_count > 0)
+        self.assertEqual(len(points), len(self.positions) + added_count)
+        # the original positions are kept
+        for position in self.positions:
+            self.assertTrue(position in [point[:2] for point in points])
+
+    def test_tolerance(self):
+        model = self.model
+        counts = []
+        for tolerance in (0.1, 0.01, 0.001):
+            points, added_count = get_max_height_dynamic(model, self.cutter,
+                    self.positions, model.minz, model.maxz + 1,
+                    tolerance=tolerance)
+            counts.append(added_count)
+        self.assertTrue(counts[0] < counts[1] < counts[2])
+
+    def test_drop_cutter(self):
+        model = self.model
+        low = (model.minx, model.miny, model.minz)
+        high = (model.maxx, model.maxy, model.maxz)
+        def get_moves(tolerance):
+            grid = pycam.Toolpath.MotionGrid.get_fixed_grid((low, high),
+                    None, 1.0, step_width=0.5)
+            generator = DropCutter(tolerance=tolerance)
+            path = generator.GenerateToolPath(self.cutter, [model], grid,
+                    minz=model.minz, maxz=model.maxz + 1)
+            moves = [move for move, point in path if move == MOVE_STRAIGHT]
+            return len(moves), generator.added_count
+        coarse_moves, coarse_count = get_moves(0.1)
+        fine_moves, fine_count = get_moves(0.001)
+        self.assertTrue(coarse_count < fine_count)
+        self.assertEqual(fine_moves - coarse_moves, fine_count - coarse_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
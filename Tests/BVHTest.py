@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+import numpy
+
+from pycam.Geometry.BVH import BVH, IntervalIndex, GridIndex, \
+        get_overlapping_pairs, _get_segment_overlap
+
+
+def get_random_boxes(count, dimensions=3, seed=1):
+    random = numpy.random.RandomState(seed)
+    mins = random.uniform(-10, 10, (count, dimensions))
+    maxs = mins + random.uniform(0, 2, (count, dimensions))
+    return mins, maxs
+
+def get_overlapping(mins, maxs, low, high):
+    return numpy.nonzero((mins <= high).all(axis=1)
+            & (maxs >= low).all(axis=1))[0]
+
+
+class BVHTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mins, self.maxs = get_random_boxes(500)
+        self.tree = BVH(self.mins, self.maxs)
+        self.boxes = [((-1, -2, -3), (1, 2, 3)), ((5, 5, 5), (5, 5, 5)),
+                ((-20, -20, -20), (20, 20, 20)), ((30, 0, 0), (31, 1, 1))]
+
+    def test_query_box(self):
+        for low, high in self.boxes:
+            self.assertEqual(list(self.tree.query_box(low, high)),
+                    list(get_overlapping(self.mins, self.maxs, low, high)))
+        # unlimited dimensions
+        self.assertEqual(list(self.tree.query_box((0, 0, None),
+                (1, 1, None))), list(get_overlapping(self.mins, self.maxs,
+                    (0, 0, -numpy.inf), (1, 1, numpy.inf))))
+
+    def test_insert(self):
+        new_mins, new_maxs = get_random_boxes(300, seed=2)
+        self.tree.insert(new_mins, new_maxs)
+        mins = numpy.concatenate((self.mins, new_mins))
+        maxs = numpy.concatenate((self.maxs, new_maxs))
+        self.assertEqual(len(self.tree), 800)
+        for rebalance in (False, True):
+            if rebalance:
+                self.tree.rebalance()
+            for low, high in self.boxes:
+                self.assertEqual(list(self.tree.query_box(low, high)),
+                        list(get_overlapping(mins, maxs, low, high)))
+
+    def test_query_segment(self):
+        segments = [((-10, -10), (10, 10)), ((0, -12), (0, 12)),
+                ((3, 3), (3, 3))]
+        for p1, p2 in segments:
+            for radius, minz, maxz in ((0, None, None), (0.5, -2, 2)):
+                expected = numpy.nonzero(_get_segment_overlap(self.mins,
+                        self.maxs, numpy.array(p1, dtype=numpy.float64),
+                        numpy.array(p2, dtype=numpy.float64)
+                        - numpy.array(p1), radius,
+                        -numpy.inf if minz is None else minz,
+                        numpy.inf if maxz is None else maxz))[0]
+                result = self.tree.query_segment(p1, p2, radius=radius,
+                        minz=minz, maxz=maxz)
+                self.assertEqual(list(result), list(expected))
+
+    def test_query_segments(self):
+        segments = [((-12, y, 0), (12, y, 0)) for y in range(-10, 11)]
+        results = self.tree.query_segments(segments, radius=0.3, minz=-1,
+                maxz=1)
+        for (p1, p2), result in zip(segments, results):
+            self.assertEqual(list(result), list(self.tree.query_segment(p1,
+                    p2, radius=0.3, minz=-1, maxz=1)))
+
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        random = numpy.random.RandomState(1)
+        self.lows = random.uniform(-10, 10, 300)
+        self.highs = self.lows + random.exponential(1, 300)
+        # a few long intervals
+        self.highs[:5] += 20
+        self.index = IntervalIndex(self.lows, self.highs)
+        self.values = [-20, -10, -3.3, 0, 0.5, 7, 30]
+
+    def _get_expected(self, value):
+        return list(numpy.nonzero((self.lows <= value)
+                & (self.highs >= value))[0])
+
+    def test_query(self):
+        for value in self.values:
+            self.assertEqual(list(self.index.query(value)),
+                    self._get_expected(value))
+
+    def test_query_many(self):
+        for value, result in zip(self.values,
+                self.index.query_many(self.values)):
+            self.assertEqual(list(result), self._get_expected(value))
+
+    def test_query_pairs(self):
+        positions, items = self.index.query_pairs(self.values)
+        pairs = sorted(zip(positions, items))
+        expected = [(position, item)
+                for position, value in enumerate(self.values)
+                for item in self._get_expected(value)]
+        self.assertEqual(pairs, expected)
+
+    def test_empty(self):
+        index = IntervalIndex([], [])
+        self.assertEqual(len(index.query(1)), 0)
+        self.assertEqual([len(items) for items in index.query_many([1, 2])],
+                [0, 0])
+
+
+class GridIndexTest(unittest.TestCase):
+
+    def test_query_pairs(self):
+        mins, maxs = get_random_boxes(200, dimensions=2)
+        query_mins, query_maxs = get_random_boxes(50, dimensions=2, seed=2)
+        index = GridIndex(mins, maxs)
+        pairs = sorted(zip(*index.query_pairs(query_mins, query_maxs)))
+        expected = [(query, item) for query in range(len(query_mins))
+                for item in get_overlapping(mins, maxs, query_mins[query],
+                    query_maxs[query])]
+        self.assertEqual(pairs, expected)
+
+    def test_empty(self):
+        index = GridIndex(numpy.zeros((0, 2)), numpy.zeros((0, 2)))
+        pairs = index.query_pairs([(0, 0)], [(1, 1)])
+        self.assertEqual([len(item) for item in pairs], [0, 0])
+
+    def test_overlapping_pairs(self):
+        mins, maxs = get_random_boxes(200)
+        pairs = sorted(zip(*get_overlapping_pairs(mins, maxs)))
+        expected = [(first, second) for first in range(len(mins))
+                for second in get_overlapping(mins, maxs, mins[first],
+                    maxs[first]) if first < second]
+        self.assertEqual(pairs, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+sys.path.insert(0,'.')
+
+import math
+import unittest
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Geometry.Model import ContourModel
+from pycam.Geometry.Polygon import Polygon
+from pycam.Geometry.Line import Line
+from pycam.Geometry.Plane import Plane
+import pycam.Utils.DiskCache
+
+
+def get_pairwise_collisions(contour, callback=None, find_all_collisions=False):
+    """ compare all lines of all pairs of polygons with overlapping bounds
+    (the previous implementation of ContourModel.check_for_collisions)
+    """
+    def overlap(g1, g2):
+        return (g1.minx <= g2.maxx) and (g2.minx <= g1.maxx) \
+                and (g1.miny <= g2.maxy) and (g2.miny <= g1.maxy) \
+                and (g1.minz <= g2.maxz) and (g2.minz <= g1.maxz)
+    groups = contour.get_polygons()
+    intersections = []
+    for index1, group1 in enumerate(groups[:-1]):
+        for index2, group2 in enumerate(groups):
+            if (index2 <= index1) or not overlap(group1, group2):
+                continue
+            for line1 in group1.get_lines():
+                for line2 in group2.get_lines():
+                    intersection, factor = line1.get_intersection(line2)
+                    if intersection:
+                        if find_all_collisions:
+                            intersections.append((index1, index2))
+                        else:
+                            return intersection
+        if callback and callback():
+            return intersections if find_all_collisions else None
+    return intersections if find_all_collisions else False
+
+def get_circle(count, radius=1.0, center=(0, 0), z=0):
+    points = [(center[0] + radius * math.cos(2 * math.pi * index / count),
+            center[1] + radius * math.sin(2 * math.pi * index / count), z)
+            for index in range(count)]
+    polygon = Polygon()
+    for index in range(count):
+        polygon.append(Line(points[index - 1], points[index]))
+    return polygon
+
+
+class CallCounter(object):
+
+    def __init__(self, limit=None):
+        self.calls = 0
+        self.limit = limit
+
+    def __call__(self):
+        self.calls += 1
+        return (not self.limit is None) and (self.calls >= self.limit)
+
+
+class ContourCollisionTest(unittest.TestCase):
+
+    def _get_contour(self, polygons):
+        contour = ContourModel()
+        for polygon in polygons:
+            contour.append(polygon)
+        return contour
+
+    def _get_circles(self):
+        return self._get_contour([get_circle(80),
+                get_circle(60, radius=0.5),
+                get_circle(50, center=(1.5, 0)),
+                get_circle(40, center=(5, 5)),
+                get_circle(30, radius=0.8, center=(5.5, 5)),
+                get_circle(20, center=(-5, 0))])
+
+    def _get_sample_contour(self):
+        """ waterlines of different heights projected onto one plane """
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        model = ImportModel("samples/SampleScene.stl")
+        polygons = []
+        for index in range(1, 6):
+            z = model.minz + (model.maxz - model.minz) * index / 6.0
+            plane = Plane((0, 0, z), (0, 0, 1, 'v'))
+            for polygon in model.get_waterline_contour(plane).get_polygons():
+                projected = Polygon()
+                for line in polygon.get_lines():
+                    projected.append(Line((line.p1[0], line.p1[1], 0),
+                            (line.p2[0], line.p2[1], 0)))
+                polygons.append(projected)
+        return self._get_contour(polygons)
+
+    def _compare(self, contour):
+        expected = get_pairwise_collisions(contour)
+        self.assertEqual(contour.check_for_collisions(), expected)
+        all_expected = get_pairwise_collisions(contour,
+                find_all_collisions=True)
+        self.assertEqual(contour.check_for_collisions(
+                find_all_collisions=True), all_expected)
+        # the progress callback is called once per group
+        counter = CallCounter()
+        contour.check_for_collisions(callback=counter,
+                find_all_collisions=True)
+        self.assertEqual(counter.calls, len(contour.get_polygons()) - 1)
+        # interrupt the calculation
+        for limit in (1, 3):
+            for find_all in (False, True):
+                self.assertEqual(contour.check_for_collisions(
+                        callback=CallCounter(limit),
+                        find_all_collisions=find_all),
+                    get_pairwise_collisions(contour,
+                        callback=CallCounter(limit),
+                        find_all_collisions=find_all))
+        return all_expected
+
+    def test_circles(self):
+        collisions = self._compare(self._get_circles())
+        self.assertTrue(len(collisions) > 0)
+        self.assertTrue((0, 2) in collisions)
+        self.assertTrue((3, 4) in collisions)
+        # the inner circle does not touch the outer one
+        self.assertFalse((0, 1) in collisions)
+
+    def test_sample_model(self):
+        collisions = self._compare(self._get_sample_contour())
+        self.assertTrue(len(collisions) > 0)
+
+    def test_no_collisions(self):
+        contour = self._get_contour([get_circle(40),
+                get_circle(40, radius=0.5), get_circle(30, center=(3, 0))])
+        self.assertEqual(contour.check_for_collisions(), False)
+        self.assertEqual(contour.check_for_collisions(
+                find_all_collisions=True), [])
+        self.assertEqual(ContourModel().check_for_collisions(), False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+sys.path.insert(0,'.')
+
+import math
+import random
+import unittest
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Geometry.Model import ContourModel
+from pycam.Geometry.Polygon import Polygon
+from pycam.Geometry.Line import Line
+from pycam.Geometry.Plane import Plane
+import pycam.Utils.DiskCache
+
+
+def get_linear_chain(lines, allow_reverse=False):
+    """ combine lines into polygons by scanning all line groups (the
+    previous implementation of ContourModel.append)
+    """
+    groups = []
+    def merge(other, allow_reverse):
+        if other.is_closed:
+            return
+        connectors = (other.get_points()[0], other.get_points()[-1])
+        connectables = [group for group in groups if (not group is other)
+                and [c for c in connectors if group.is_connectable(c)]]
+        for group in connectables:
+            if not [c for c in connectors if group.is_connectable(c)]:
+                continue
+            if other.get_points()[-1] == group.get_points()[0]:
+                lines = group.get_lines()
+            elif other.get_points()[0] == group.get_points()[-1]:
+                lines = group.get_lines()
+                lines.reverse()
+            elif allow_reverse and \
+                    (other.get_points()[-1] == group.get_points()[-1]):
+                group.reverse_direction()
+                lines = group.get_lines()
+            elif allow_reverse and \
+                    (other.get_points()[0] == group.get_points()[0]):
+                group.reverse_direction()
+                lines = group.get_lines()
+                lines.reverse()
+            else:
+                continue
+            for line in lines:
+                if other.is_closed:
+                    return
+                other.append(line)
+            groups.remove(group)
+            if other.is_closed:
+                return
+    for line in lines:
+        candidates = [line]
+        if allow_reverse:
+            candidates.append(Line(line.p2, line.p1))
+        for group in reversed(groups):
+            connectable = [c for c in candidates if group.is_connectable(c)]
+            if connectable:
+                group.append(connectable[0])
+                merge(group, allow_reverse)
+                break
+        else:
+            group = Polygon()
+            group.append(line)
+            groups.append(group)
+    return groups
+
+def get_polygon_points(polygons):
+    return [(polygon.is_closed, [tuple(point[:3])
+            for point in polygon.get_points()]) for polygon in polygons]
+
+def get_circle_lines(count, radius=1.0, center=(0, 0), z=0):
+    points = [(center[0] + radius * math.cos(2 * math.pi * index / count),
+            center[1] + radius * math.sin(2 * math.pi * index / count), z)
+            for index in range(count)]
+    return [Line(points[index - 1], points[index])
+            for index in range(count)]
+
+
+class ContourModelTest(unittest.TestCase):
+
+    def _compare(self, lines, allow_reverse=False):
+        contour = ContourModel()
+        for line in lines:
+            contour.append(line, allow_reverse=allow_reverse)
+        expected = get_linear_chain(lines, allow_reverse=allow_reverse)
+        self.assertEqual(get_polygon_points(contour.get_polygons()),
+                get_polygon_points(expected))
+        return contour
+
+    def test_shuffled_circles(self):
+        rand = random.Random(1)
+        lines = get_circle_lines(60) + get_circle_lines(40, radius=0.5) \
+                + get_circle_lines(30, center=(3, 0))
+        # an open line
+        lines.extend(get_circle_lines(20, center=(0, 5))[:-3])
+        rand.shuffle(lines)
+        contour = self._compare(lines)
+        self.assertEqual(len(contour.get_polygons()), 4)
+        self.assertEqual(len([polygon for polygon in contour.get_polygons()
+                if polygon.is_closed]), 3)
+
+    def test_reversed_lines(self):
+        rand = random.Random(2)
+        lines = []
+        for line in get_circle_lines(50) + get_circle_lines(20, center=(4, 0)):
+            if rand.random() < 0.3:
+                line = Line(line.p2, line.p1)
+            lines.append(line)
+        rand.shuffle(lines)
+        self._compare(lines)
+        contour = self._compare(lines, allow_reverse=True)
+        self.assertEqual([polygon.is_closed
+                for polygon in contour.get_polygons()], [True, True])
+
+    def test_transformed(self):
+        """ the index of the end points is updated after a transformation """
+        lines = get_circle_lines(20)
+        contour = ContourModel()
+        for line in lines[:10]:
+            contour.append(line)
+        contour.shift(1, 2, 0)
+        for line in lines[10:]:
+            line = Line((line.p1[0] + 1, line.p1[1] + 2, line.p1[2]),
+                    (line.p2[0] + 1, line.p2[1] + 2, line.p2[2]))
+            contour.append(line)
+        self.assertEqual([polygon.is_closed
+                for polygon in contour.get_polygons()], [True])
+
+    def test_waterlines(self):
+        """ compare the waterlines of the sample models """
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        for filename in ("samples/SampleScene.stl", "samples/Sphere_cut.stl"):
+            model = ImportModel(filename)
+            for index in range(1, 8):
+                z = model.minz + (model.maxz - model.minz) * index / 8.0
+                plane = Plane((0, 0, z), (0, 0, 1, 'v'))
+                lines = []
+                for triangle in model.triangles():
+                    line = plane.intersect_triangle(triangle,
+                            counter_clockwise=True)
+                    if not line is None:
+                        lines.append(line)
+                self.assertTrue(len(lines) > 0)
+                self._compare(lines)
+                self.assertEqual(get_polygon_points(
+                        model.get_waterline_contour(plane).get_polygons()),
+                        get_polygon_points(get_linear_chain(lines)))
+
+
+if __name__ == "__main__":
+    unittest.main()
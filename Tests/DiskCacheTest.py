@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pycam.Utils.DiskCache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix="pycam-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def _get_files(self):
+        result = []
+        for directory, dirnames, filenames in os.walk(self.cache_dir):
+            result.extend(filenames)
+        return result
+
+    def _get_size(self):
+        size = 0
+        for directory, dirnames, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                size += os.path.getsize(os.path.join(directory, filename))
+        return size
+
+    def test_get_set(self):
+        cache = DiskCache(self.cache_dir)
+        self.assertEqual(cache.get("abcdef", "data"), None)
+        cache.set("abcdef", "data", [1, 2, 3])
+        self.assertEqual(cache.get("abcdef", "data"), [1, 2, 3])
+
+    def test_size_limit(self):
+        cache = DiskCache(self.cache_dir, max_size=20000)
+        # the first item is used again and again
+        cache.set("first", "data", "x" * 1000)
+        for index in range(100):
+            cache.set("key%03d" % index, "data", "x" * 1000)
+            # the modification time has a limited resolution
+            os.utime(os.path.join(self.cache_dir, "ke",
+                    "key%03d-data-v1.pickle" % index),
+                    (time.time() - 1000 + index, time.time() - 1000 + index))
+            self.assertNotEqual(cache.get("first", "data"), None)
+        cache.cleanup()
+        self.assertTrue(self._get_size() <= 20000)
+        self.assertNotEqual(cache.get("first", "data"), None)
+        self.assertEqual(cache.get("key000", "data"), None)
+        self.assertNotEqual(cache.get("key099", "data"), None)
+
+    def test_failed_write(self):
+        cache = DiskCache(self.cache_dir)
+        # functions can't be pickled
+        cache.set("abcdef", "data", lambda: None)
+        self.assertEqual(self._get_files(), [])
+        self.assertEqual(cache.get("abcdef", "data"), None)
+
+    def test_old_files(self):
+        cache = DiskCache(self.cache_dir)
+        cache.set("abcdef", "data", 1)
+        directory = os.path.join(self.cache_dir, "ab")
+        stale = os.path.join(directory, "stale.tmp")
+        old_version = os.path.join(directory, "abcdef-data-v0.pickle")
+        for filename in (stale, old_version):
+            open(filename, "wb").close()
+        os.utime(stale, (time.time() - 7200, time.time() - 7200))
+        cache.cleanup()
+        self.assertEqual(self._get_files(), ["abcdef-data-v1.pickle"])
+
+
+if __name__ == "__main__":
+    unittest.main()
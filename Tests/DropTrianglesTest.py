@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+import numpy
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Cutters.BaseCutter import BaseCutter
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+import pycam.Utils.DiskCache
+
+
+class DropTrianglesTest(unittest.TestCase):
+
+    def setUp(self):
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        self.models = [ImportModel("samples/SampleScene.stl"),
+                ImportModel("samples/Sphere_cut.stl")]
+
+    def _get_cutters(self):
+        cutters = []
+        for required_distance in (0, 0.1):
+            for cutter in (CylindricalCutter(1.0), SphericalCutter(1.0),
+                    ToroidalCutter(1.0, 0.25)):
+                cutter.set_required_distance(required_distance)
+                cutters.append(cutter)
+        return cutters
+
+    def _get_starts(self, model, steps=10):
+        for x in numpy.linspace(model.minx - 1, model.maxx + 1, steps):
+            for y in numpy.linspace(model.miny - 1, model.maxy + 1, steps):
+                yield (x, y, model.maxz + 5)
+
+    def test_drop_limit(self):
+        """ the drop limit is never below the actual cutter location """
+        for model in self.models:
+            triangles = model.triangles()
+            for cutter in self._get_cutters():
+                for start in self._get_starts(model):
+                    for triangle in triangles:
+                        cut = cutter.drop(triangle, start=start)
+                        if cut:
+                            self.assertTrue(cut[2] <= cutter.get_drop_limit(
+                                    triangle, start))
+
+    def test_early_exit(self):
+        """ compare with the highest location of all triangles """
+        for model in self.models:
+            triangles = model.triangles()
+            for cutter in self._get_cutters():
+                contacts = 0
+                for start in self._get_starts(model):
+                    heights = [cut[2] for cut in [cutter.drop(triangle,
+                            start=start) for triangle in triangles] if cut]
+                    # the scalar implementation (for all shapes)
+                    result = BaseCutter.drop_triangles(cutter, triangles,
+                            start=start)
+                    if heights:
+                        contacts += 1
+                        self.assertAlmostEqual(result[0], start[0])
+                        self.assertAlmostEqual(result[1], start[1])
+                        self.assertEqual(result[2], max(heights))
+                    else:
+                        self.assertEqual(result, None)
+                self.assertTrue(contacts > 0)
+
+    def test_skipped_triangles(self):
+        """ the early exit skips a part of the candidates """
+        model = self.models[0]
+        triangles = model.triangles()
+        for cutter in self._get_cutters():
+            counter = {"drop": 0, "drop_triangles": 0}
+            original = type(cutter).intersect
+            def intersect(*args, **kwargs):
+                counter[current] += 1
+                return original(cutter, *args, **kwargs)
+            cutter.intersect = intersect
+            try:
+                for start in self._get_starts(model):
+                    current = "drop"
+                    for triangle in triangles:
+                        cutter.drop(triangle, start=start)
+                    current = "drop_triangles"
+                    BaseCutter.drop_triangles(cutter, triangles, start=start)
+            finally:
+                del cutter.intersect
+            self.assertTrue(counter["drop_triangles"] < counter["drop"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import random
+import unittest
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.PathGenerators import get_max_heights_function
+from pycam.Physics.height_map import get_height_map
+from pycam.Gui.Settings import ToolpathSettings
+import pycam.Toolpath.Generator
+import pycam.Utils.DiskCache
+
+
+class HeightMapTest(unittest.TestCase):
+
+    def setUp(self):
+        # always calculate the rasters
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        self.model = ImportModel("samples/Sphere_cut.stl")
+        model = self.model
+        rand = random.Random(1)
+        self.positions = [(rand.uniform(model.minx - 1, model.maxx + 1),
+                rand.uniform(model.miny - 1, model.maxy + 1))
+                for i in range(1000)]
+        self.minz = model.minz
+        self.maxz = model.maxz + 1
+
+    def _compare(self, cutter, inverse_tool):
+        exact = get_max_heights_function(self.model, cutter, self.minz,
+                self.maxz)(self.positions)
+        height_map = get_height_map(self.model, cutter,
+                inverse_tool=inverse_tool)
+        result = height_map.get_max_heights(self.positions, self.minz,
+                self.maxz)
+        self.assertEqual(len(result), len(exact))
+        for point, exact_point in zip(result, exact):
+            self.assertEqual(point is None, exact_point is None)
+            if point is None:
+                continue
+            self.assertEqual(point[:2], exact_point[:2])
+            # the cutter may never be lowered into the model
+            self.assertTrue(point[2] >= exact_point[2] - height_map.tolerance)
+            self.assertTrue(point[2] <= exact_point[2] + height_map.tolerance)
+
+    def test_interpolated_spherical(self):
+        self._compare(SphericalCutter(1.0), False)
+
+    def test_interpolated_cylindrical(self):
+        self._compare(CylindricalCutter(1.0), False)
+
+    def test_inverse_tool_spherical(self):
+        self._compare(SphericalCutter(1.0), True)
+
+    def test_inverse_tool_cylindrical(self):
+        self._compare(CylindricalCutter(1.0), True)
+
+    def test_settings_backend(self):
+        settings = ToolpathSettings()
+        self.assertEqual(settings.get_calculation_backend(), None)
+        for backend in ("HeightMap", "InverseTool", "ODE"):
+            self.assertTrue(backend
+                    in pycam.Toolpath.Generator.CALCULATION_BACKENDS)
+            settings.set_calculation_backend(backend)
+            self.assertEqual(settings.get_calculation_backend(), backend)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+import numpy
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Geometry.Model import Model, ContourModel
+from pycam.Geometry.Plane import Plane
+import pycam.Utils.DiskCache
+
+
+def get_triangles_at_height(triangles, z):
+    return [index for index, t in enumerate(triangles)
+            if t.minz <= z <= t.maxz]
+
+def get_contour_points(contour):
+    return sorted([[tuple(point[:3]) for point in polygon.get_points()]
+            for polygon in contour.get_polygons()])
+
+
+class ModelSliceTest(unittest.TestCase):
+
+    def setUp(self):
+        # always calculate the waterlines
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        self.models = [ImportModel("samples/SampleScene.stl"),
+                ImportModel("samples/Sphere_cut.stl")]
+
+    def _get_heights(self, model):
+        heights = list(numpy.linspace(model.minz - 1, model.maxz + 1, 23))
+        # the heights of the vertices are the limits of the z ranges
+        for triangle in model.triangles():
+            heights.extend([triangle.minz, triangle.maxz])
+        return sorted(set(heights))
+
+    def _get_plain_model(self, model, use_kdtree=True):
+        result = Model(use_kdtree=use_kdtree)
+        for triangle in model.triangles():
+            result.append(triangle)
+        return result
+
+    def _compare_indices(self, model):
+        triangles = model.triangles()
+        heights = self._get_heights(model)
+        for z in heights:
+            self.assertEqual(list(model.get_triangle_indices_at_height(z)),
+                    get_triangles_at_height(triangles, z))
+            self.assertEqual([t.id for t in model.triangles_at_height(z)],
+                    [triangles[index].id for index
+                        in get_triangles_at_height(triangles, z)])
+        # many heights (in random order) at once
+        shuffled = list(heights)
+        numpy.random.RandomState(1).shuffle(shuffled)
+        for z, indices in zip(shuffled,
+                model.get_triangle_indices_at_heights(shuffled)):
+            self.assertEqual(list(indices),
+                    get_triangles_at_height(triangles, z))
+
+    def test_indices(self):
+        for model in self.models:
+            self._compare_indices(model)
+            self._compare_indices(self._get_plain_model(model))
+            self._compare_indices(self._get_plain_model(model,
+                    use_kdtree=False))
+
+    def test_modified_model(self):
+        """ the index follows the changes of the model """
+        for model in self.models:
+            plain = self._get_plain_model(model)
+            for current in (model, plain):
+                current.get_triangle_indices_at_height(0)
+                current.shift(0, 0, 1.5)
+                self._compare_indices(current)
+            # add triangles to an existing index
+            plain += self.models[0]
+            self._compare_indices(plain)
+
+    def test_waterline_contour(self):
+        """ compare the slices with the intersection of all triangles """
+        for model in self.models:
+            for z in numpy.linspace(model.minz, model.maxz, 9):
+                plane = Plane((0, 0, z), (0, 0, 1, 'v'))
+                expected = ContourModel(plane=plane)
+                for triangle in model.triangles():
+                    line = plane.intersect_triangle(triangle,
+                            counter_clockwise=True)
+                    if not line is None:
+                        expected.append(line)
+                self.assertEqual(
+                        get_contour_points(model.get_waterline_contour(plane)),
+                        get_contour_points(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
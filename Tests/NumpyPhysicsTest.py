@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import random
+import unittest
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+from pycam.Geometry.Model import Model
+from pycam.PathGenerators import get_max_height_triangles
+from pycam.Physics.numpy_physics import generate_physics
+from pycam.Geometry.utils import epsilon
+import pycam.Utils.DiskCache
+
+
+class NumpyPhysicsTest(unittest.TestCase):
+
+    def setUp(self):
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        self.models = [ImportModel("samples/SampleScene.stl"),
+                ImportModel("samples/Sphere_cut.stl")]
+
+    def _get_positions(self, model, count=300):
+        rand = random.Random(1)
+        positions = [(rand.uniform(model.minx - 1, model.maxx + 1),
+                rand.uniform(model.miny - 1, model.maxy + 1))
+                for i in range(count)]
+        # include a regular grid line (as used by DropCutter)
+        y = (model.miny + model.maxy) / 2.0
+        steps = 100
+        positions.extend([(model.minx - 1
+                + (model.maxx - model.minx + 2) * i / float(steps), y)
+                for i in range(steps + 1)])
+        return positions
+
+    def _compare(self, model, cutter, physics, minz, maxz):
+        positions = self._get_positions(model)
+        result = physics.get_max_heights(positions, minz, maxz)
+        self.assertEqual(len(result), len(positions))
+        for (x, y), point in zip(positions, result):
+            exact = get_max_height_triangles(model, cutter, x, y, minz, maxz)
+            self.assertEqual(point is None, exact is None)
+            if point is None:
+                continue
+            self.assertAlmostEqual(point[0], exact[0])
+            self.assertAlmostEqual(point[1], exact[1])
+            self.assertTrue(abs(point[2] - exact[2]) < epsilon,
+                    "%s != %s" % (point, exact))
+
+    def _compare_cutter(self, cutter):
+        for model in self.models:
+            minz = model.minz
+            for maxz in (model.maxz + 1, (model.minz + model.maxz) / 2.0):
+                physics = generate_physics(model, cutter)
+                self._compare(model, cutter, physics, minz, maxz)
+
+    def test_cylindrical(self):
+        self._compare_cutter(CylindricalCutter(1.0))
+
+    def test_spherical(self):
+        self._compare_cutter(SphericalCutter(1.0))
+
+    def test_toroidal(self):
+        self._compare_cutter(ToroidalCutter(1.0, 0.25))
+
+    def test_triangle_objects(self):
+        """ the triangles of a plain model are packed by "add_mesh" """
+        cutter = SphericalCutter(0.5)
+        for model in self.models:
+            plain = Model(use_kdtree=False)
+            for triangle in model.triangles():
+                plain.append(triangle)
+            physics = generate_physics(plain, cutter)
+            self._compare(model, cutter, physics, model.minz,
+                    model.maxz + 1)
+
+    def test_subset(self):
+        cutter = CylindricalCutter(1.5)
+        model = self.models[0]
+        physics = generate_physics(model, cutter)
+        midx = (model.minx + model.maxx) / 2.0
+        subset = physics.get_subset(model.minx - 1, midx, model.miny - 1,
+                model.maxy + 1)
+        # the positions of the left half are not affected by the subset
+        positions = [(x, y) for x, y in self._get_positions(model)
+                if x < midx - cutter.radius]
+        minz, maxz = model.minz, model.maxz + 1
+        self.assertEqual(subset.get_max_heights(positions, minz, maxz),
+                physics.get_max_heights(positions, minz, maxz))
+
+
+if __name__ == "__main__":
+    unittest.main()
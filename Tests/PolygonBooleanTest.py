@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+from pycam.Geometry.Line import Line
+from pycam.Geometry.Polygon import Polygon
+from pycam.Geometry.PolygonBoolean import PreparedPolygons, \
+        get_union_polygons, get_intersection_polygons, \
+        get_difference_polygons, get_xor_polygons
+
+
+def get_polygon(points):
+    polygon = Polygon()
+    for index, point in enumerate(points):
+        next_point = points[(index + 1) % len(points)]
+        polygon.append(Line((point[0], point[1], 0), (next_point[0],
+                next_point[1], 0)))
+    return polygon
+
+def get_square(x1, y1, x2, y2):
+    return get_polygon(((x1, y1), (x2, y1), (x2, y2), (x1, y2)))
+
+
+def get_areas(polygons):
+    return sorted([round(polygon.get_area(), 6) for polygon in polygons])
+
+
+class BooleanPolygonsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.square = get_square(0, 0, 10, 10)
+
+    def test_union_overlapping(self):
+        result = get_union_polygons([self.square, get_square(5, 5, 15, 15)])
+        self.assertEqual(get_areas(result), [175])
+        self.assertEqual(len(result[0].get_points()), 8)
+
+    def test_union_touching(self):
+        result = get_union_polygons([self.square, get_square(10, 0, 20, 10)])
+        self.assertEqual(get_areas(result), [200])
+
+    def test_union_separate(self):
+        result = get_union_polygons([self.square, get_square(20, 0, 30, 10)])
+        self.assertEqual(get_areas(result), [100, 100])
+
+    def test_union_contained(self):
+        result = get_union_polygons([self.square, get_square(2, 2, 8, 8)])
+        self.assertEqual(get_areas(result), [100])
+
+    def test_union_method(self):
+        result = self.square.union(get_square(5, 5, 15, 15))
+        self.assertEqual(get_areas(result), [175])
+
+    def test_other_operations(self):
+        other = get_square(5, 5, 15, 15)
+        self.assertEqual(get_areas(get_intersection_polygons([self.square],
+                [other])), [25])
+        self.assertEqual(get_areas(get_difference_polygons([self.square],
+                [other])), [75])
+        self.assertEqual(get_areas(get_xor_polygons([self.square],
+                [other])), [75, 75])
+        # a hole in the middle
+        self.assertEqual(get_areas(get_difference_polygons([self.square],
+                [get_square(2, 2, 8, 8)])), [-36, 100])
+        self.assertEqual(get_intersection_polygons([self.square],
+                [get_square(20, 0, 30, 10)]), [])
+
+    def test_containment(self):
+        inner = get_square(2, 2, 8, 8)
+        self.assertTrue(self.square.is_polygon_inside(inner))
+        self.assertFalse(inner.is_polygon_inside(self.square))
+        self.assertFalse(self.square.is_polygon_inside(
+                get_square(5, 5, 15, 15)))
+        self.assertTrue(self.square.is_point_inside((5, 5, 0)))
+        self.assertFalse(self.square.is_point_inside((15, 5, 0)))
+
+
+class PreparedPolygonsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.square = PreparedPolygons([get_square(0, 0, 10, 10)])
+
+    def test_points_inside(self):
+        self.assertTrue(self.square.is_point_inside((5, 5)))
+        self.assertFalse(self.square.is_point_inside((11, 5)))
+        self.assertFalse(self.square.is_point_inside((5, -1)))
+
+    def test_points_on_outline(self):
+        outline = [(5, 0), (5, 10), (0, 5), (10, 5), (0, 0), (10, 0),
+                (10, 10), (0, 10)]
+        self.assertTrue(self.square.get_points_inside(outline).all())
+        self.assertFalse(self.square.get_points_inside(
+                [(5, 10.01), (-0.01, 10), (10.01, 0)]).any())
+
+    def test_points_on_hole_outline(self):
+        polygons = [get_square(0, 0, 10, 10),
+                get_polygon(((4, 4), (4, 6), (6, 6), (6, 4)))]
+        prepared = PreparedPolygons(polygons)
+        self.assertFalse(prepared.is_point_inside((5, 5)))
+        self.assertTrue(prepared.get_points_inside(
+                [(5, 4), (5, 6), (4, 6), (6, 6)]).all())
+
+    def test_split_lines(self):
+        lines = [Line((-5, 5, 0), (15, 5, 0)), Line((-5, 10, 0), (15, 10, 0)),
+                Line((0, 2, 0), (0, 8, 0)), Line((12, 0, 0), (12, 10, 0))]
+        result = self.square.split_lines(lines)
+        ends = lambda lines: [(line.p1[:2], line.p2[:2]) for line in lines]
+        self.assertEqual(ends(result[0][0]), [((0, 5), (10, 5))])
+        self.assertEqual(ends(result[0][1]),
+                [((-5, 5), (0, 5)), ((10, 5), (15, 5))])
+        # moves along the edges are inside
+        self.assertEqual(ends(result[1][0]), [((0, 10), (10, 10))])
+        self.assertEqual(ends(result[2][0]), [((0, 2), (0, 8))])
+        self.assertEqual(result[2][1], [])
+        self.assertEqual(result[3][0], [])
+        self.assertEqual(len(result[3][1]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
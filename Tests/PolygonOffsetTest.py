@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+from pycam.Geometry.Line import Line
+from pycam.Geometry.Polygon import Polygon
+from pycam.Geometry.PolygonOffset import get_offset_polygons
+
+
+def get_polygon(points):
+    polygon = Polygon()
+    for index, point in enumerate(points):
+        next_point = points[(index + 1) % len(points)]
+        polygon.append(Line((point[0], point[1], 0), (next_point[0],
+                next_point[1], 0)))
+    return polygon
+
+def get_corners(polygon):
+    return sorted([(round(point[0], 6), round(point[1], 6))
+            for point in polygon.get_points()])
+
+
+class PolygonOffsetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.square = get_polygon(((0, 0), (10, 0), (10, 10), (0, 10)))
+        self.l_shape = get_polygon(((0, 0), (10, 0), (10, 4), (4, 4),
+                (4, 10), (0, 10)))
+
+    def test_square_grow(self):
+        result = get_offset_polygons([self.square], 1)
+        self.assertEqual(len(result), 1)
+        self.assertAlmostEqual(result[0].get_area(), 144)
+        self.assertEqual(get_corners(result[0]),
+                [(-1, -1), (-1, 11), (11, -1), (11, 11)])
+
+    def test_square_shrink(self):
+        result = get_offset_polygons([self.square], -1)
+        self.assertEqual(len(result), 1)
+        self.assertAlmostEqual(result[0].get_area(), 64)
+        self.assertEqual(get_corners(result[0]),
+                [(1, 1), (1, 9), (9, 1), (9, 9)])
+
+    def test_square_collapse(self):
+        self.assertEqual(len(get_offset_polygons([self.square], -4.9)), 1)
+        self.assertEqual(get_offset_polygons([self.square], -5), [])
+        self.assertEqual(get_offset_polygons([self.square], -6), [])
+
+    def test_l_shape(self):
+        grown = get_offset_polygons([self.l_shape], 1)
+        self.assertEqual(len(grown), 1)
+        self.assertAlmostEqual(grown[0].get_area(), 108)
+        self.assertEqual(get_corners(grown[0]),
+                [(-1, -1), (-1, 11), (5, 5), (5, 11), (11, -1), (11, 5)])
+        shrunk = get_offset_polygons([self.l_shape], -1)
+        self.assertEqual(len(shrunk), 1)
+        self.assertAlmostEqual(shrunk[0].get_area(), 28)
+        self.assertEqual(get_corners(shrunk[0]),
+                [(1, 1), (1, 9), (3, 3), (3, 9), (9, 1), (9, 3)])
+        # the arms of the L are four units wide
+        self.assertEqual(get_offset_polygons([self.l_shape], -2), [])
+
+    def test_hole(self):
+        hole = get_polygon(((4, 4), (4, 6), (6, 6), (6, 4)))
+        shrunk = get_offset_polygons([self.square, hole], -0.5)
+        areas = sorted([polygon.get_area() for polygon in shrunk])
+        self.assertEqual(len(areas), 2)
+        self.assertAlmostEqual(areas[0], -9)
+        self.assertAlmostEqual(areas[1], 81)
+        # the hole vanishes
+        grown = get_offset_polygons([self.square, hole], 1)
+        self.assertEqual(len(grown), 1)
+        self.assertAlmostEqual(grown[0].get_area(), 144)
+
+    def test_overlapping_squares(self):
+        other = get_polygon(((8, 0), (20, 0), (20, 10), (8, 10)))
+        result = get_offset_polygons([self.square, other], 1)
+        self.assertEqual(len(result), 1)
+        self.assertAlmostEqual(result[0].get_area(), 22 * 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import StringIO
+import unittest
+
+from pycam.Importers import STLImporter
+from pycam.Geometry.PointUtils import pdot, pcross, psub
+
+
+FACET = """  facet normal %s
+    outer loop
+      vertex 0 0 0
+      vertex 1 0 0
+      vertex 0 1 %s
+    endloop
+  endfacet
+"""
+
+def get_stream(normal="0 0 1", z="0"):
+    return StringIO.StringIO("solid test\n" + FACET % (normal, z)
+            + FACET % (normal, "0.5") + "endsolid test\n")
+
+
+class STLImporterAsciiTest(unittest.TestCase):
+
+    def test_sample_with_comma_normals(self):
+        """ "Sphere_cut.stl" contains normals like "-0,774597" """
+        model = STLImporter.ImportModel("samples/Sphere_cut.stl")
+        self.assertNotEqual(model, None)
+        self.assertEqual(len(model), 60)
+        for triangle in model.triangles():
+            self.assertAlmostEqual(pdot(triangle.normal, triangle.normal), 1)
+            # the vertices are stored in clockwise order
+            cross = pcross(psub(triangle.p3, triangle.p1),
+                    psub(triangle.p2, triangle.p1))
+            self.assertTrue(pdot(cross, triangle.normal) > 0)
+
+    def test_invalid_normal(self):
+        model = STLImporter.ImportModel(get_stream(normal="0 0,5 1"))
+        self.assertEqual(len(model), 2)
+        for triangle in model.triangles():
+            self.assertTrue(triangle.normal[2] > 0)
+
+    def test_invalid_vertex(self):
+        self.assertEqual(STLImporter.ImportModel(get_stream(z="0,5")), None)
+        # a parse error is not reported as a cancelled operation
+        stream = get_stream(z="0,5")
+        self.assertRaises(ValueError, STLImporter._read_ascii_facets, stream,
+                len(stream.getvalue()), "test")
+
+    def test_cancel(self):
+        stream = get_stream()
+        self.assertEqual(STLImporter._read_ascii_facets(stream,
+                len(stream.getvalue()), "test",
+                callback=lambda percent=None: True), None)
+
+    def test_valid_stream(self):
+        model = STLImporter.ImportModel(get_stream())
+        self.assertEqual(len(model), 2)
+        self.assertEqual(model.name, "test")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+sys.path.insert(0,'.')
+
+import StringIO
+import os
+import struct
+import tempfile
+import unittest
+
+from pycam.Importers import STLImporter
+from pycam.Geometry.PointUtils import pdot, pcross, psub
+
+
+def get_binary_data(facets, header="binary test"):
+    """ create the content of a binary STL file from a list of facets
+    (normal, p1, p2, p3)
+    """
+    data = [header.ljust(80, " "), struct.pack("<I", len(facets))]
+    for facet in facets:
+        values = []
+        for point in facet:
+            values.extend(point[:3])
+        data.append(struct.pack("<12fH", *(values + [0])))
+    return "".join(data)
+
+def get_points(model, places=4):
+    """ the sorted vertices of all triangles - rounded for float32 data """
+    result = []
+    for triangle in model.triangles():
+        points = [tuple([round(value, places) for value in point[:3]])
+                for point in (triangle.p1, triangle.p2, triangle.p3)]
+        # start with the smallest point - keep the order of the vertices
+        first = points.index(min(points))
+        result.append(tuple(points[first:] + points[:first]))
+    result.sort()
+    return result
+
+
+class STLImporterBinaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filenames = []
+
+    def tearDown(self):
+        for filename in self.filenames:
+            os.remove(filename)
+
+    def _get_file(self, data):
+        handle, filename = tempfile.mkstemp(suffix=".stl")
+        os.write(handle, data)
+        os.close(handle)
+        self.filenames.append(filename)
+        return filename
+
+    def _get_sample_data(self, reverse=False):
+        model = STLImporter.ImportModel("samples/SampleScene.stl")
+        facets = []
+        for triangle in model.triangles():
+            points = [triangle.p1, triangle.p2, triangle.p3]
+            if reverse:
+                # counter-clockwise order (as required by the STL format)
+                points.reverse()
+            facets.append([triangle.normal] + points)
+        return model, get_binary_data(facets)
+
+    def _assert_models_equal(self, model, expected):
+        self.assertNotEqual(model, None)
+        self.assertEqual(len(model), len(expected))
+        self.assertEqual(get_points(model), get_points(expected))
+        for attr in ("minx", "miny", "minz", "maxx", "maxy", "maxz"):
+            self.assertAlmostEqual(getattr(model, attr),
+                    getattr(expected, attr), places=4)
+        for triangle in model.triangles():
+            self.assertAlmostEqual(pdot(triangle.normal, triangle.normal), 1,
+                    places=5)
+            # the vertices are stored in clockwise order
+            cross = pcross(psub(triangle.p3, triangle.p1),
+                    psub(triangle.p2, triangle.p1))
+            self.assertTrue(pdot(cross, triangle.normal) > 0)
+
+    def test_sample_file(self):
+        """ a memory-mapped file equals the ASCII source """
+        for reverse in (False, True):
+            expected, data = self._get_sample_data(reverse=reverse)
+            model = STLImporter.ImportModel(self._get_file(data))
+            self._assert_models_equal(model, expected)
+            # the vertices are shared between the triangles
+            self.assertEqual(len(model.vertices), len(expected.vertices))
+
+    def test_sample_stream(self):
+        """ a stream (no memory mapping) is read like a local file """
+        expected, data = self._get_sample_data()
+        stream_model = STLImporter.ImportModel(StringIO.StringIO(data))
+        self._assert_models_equal(stream_model, expected)
+        file_model = STLImporter.ImportModel(self._get_file(data))
+        self.assertEqual(stream_model.vertices.tolist(),
+                file_model.vertices.tolist())
+        self.assertEqual(stream_model.faces.tolist(),
+                file_model.faces.tolist())
+        self.assertEqual(stream_model.normals.tolist(),
+                file_model.normals.tolist())
+
+    def test_read_binary_facets(self):
+        expected, data = self._get_sample_data()
+        facets = STLImporter.numpy.frombuffer(data[84:],
+                dtype=STLImporter.BINARY_FACET_DTYPE)
+        normals, corners = STLImporter._read_binary_facets(facets)
+        self.assertEqual(normals.shape, (len(expected), 3))
+        self.assertEqual(corners.shape, (len(expected), 3, 3))
+        # compare with a plain unpacking of each facet
+        for index in range(len(expected)):
+            offset = 84 + 50 * index
+            values = struct.unpack("<12f", data[offset:offset + 48])
+            self.assertEqual(tuple(normals[index]), values[:3])
+            self.assertEqual(tuple(corners[index].flatten()), values[3:])
+
+    def test_missing_normal(self):
+        facets = [((0, 0, 0), (0, 0, 0), (1, 0, 0), (0, 1, 0.5)),
+                ((0, 0, 0), (0, 0, 0), (0, 1, 0.5), (1, 0, 0))]
+        model = STLImporter.ImportModel(self._get_file(
+                get_binary_data(facets)))
+        self.assertEqual(len(model), 2)
+        for triangle in model.triangles():
+            # facets without a normal are oriented upwards
+            self.assertTrue(triangle.normal[2] > 0)
+
+    def test_empty_file(self):
+        # a model without triangles is not valid
+        self.assertEqual(STLImporter.ImportModel(self._get_file(
+                get_binary_data([]))), None)
+
+    def test_cancel(self):
+        expected, data = self._get_sample_data()
+        self.assertEqual(STLImporter.ImportModel(self._get_file(data),
+                callback=lambda percent=None: True), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import glob
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Geometry.Model import TriangleMesh
+import pycam.Utils.DiskCache
+import pycam.Utils.threading
+
+
+class Item(object):
+
+    def __init__(self, value):
+        self.uuid = value
+        self.value = value
+
+
+def describe_task(args):
+    return [(type(arg).__name__, sorted([item.value for item in arg])
+            if isinstance(arg, (tuple, set)) else getattr(arg, "value", arg))
+            for arg in args]
+
+def get_cutter_location(args):
+    cutter, shared = args
+    return cutter.location
+
+def describe_model(args):
+    model, index = args
+    return (isinstance(model.vertices, numpy.memmap), len(model),
+            model.get_triangle_indices(model.minx, model.miny, model.minz,
+                    model.maxx, model.maxy, model.maxz).tolist())
+
+def get_worker_items(args):
+    return sorted(pycam.Utils.threading.__worker_items.keys())
+
+def get_mesh(count, shift=0):
+    vertices = []
+    for x in range(count):
+        vertices.extend([(x + shift, 0, 0), (x + shift, 1, 0),
+                (x + shift + 0.5, 0, 1)])
+    return TriangleMesh(vertices, numpy.arange(3 * count).reshape((-1, 3)))
+
+
+class LocalPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        pycam.Utils.threading.init_threading(number_of_processes=2)
+
+    def tearDown(self):
+        pycam.Utils.threading.cleanup()
+
+    def _get_published_files(self):
+        return set(glob.glob(os.path.join(tempfile.gettempdir(),
+                "pycam-*.data")))
+
+    def _run(self, func, args):
+        return list(pycam.Utils.threading.run_in_parallel_local(func, args))
+
+    def test_argument_types(self):
+        shared = Item(1)
+        args = [(shared, (shared, Item(2)), set([Item(3)]), 4),
+                [shared, (Item(5), ), set([shared]), 6]]
+        result = self._run(describe_task, args)
+        self.assertEqual(result, [
+                [("Item", 1), ("tuple", [1, 2]), ("set", [3]), ("int", 4)],
+                [("Item", 1), ("tuple", [5]), ("set", [1]), ("int", 6)]])
+
+    def test_job_files_removed(self):
+        before = self._get_published_files()
+        shared = Item(1)
+        self._run(describe_task, [(shared, ), (shared, )])
+        self.assertEqual(self._get_published_files(), before)
+
+    def test_moved_cutter(self):
+        # the uuid of a cutter does not change along with its location
+        cutter = SphericalCutter(1, location=(0, 0, 0))
+        for x in range(3):
+            cutter.moveto((x, 0, 0))
+            args = [(cutter, Item(index)) for index in range(4)]
+            self.assertEqual(self._run(get_cutter_location, args),
+                    [(x, 0, 0)] * 4)
+
+    def test_shared_model(self):
+        model = get_mesh(500)
+        args = [(model, index) for index in range(4)]
+        before = self._get_published_files()
+        self.assertEqual(self._run(describe_model, args),
+                [(True, 500, range(500))] * 4)
+        # the model is kept for the next job
+        published = self._get_published_files() - before
+        self.assertEqual(len(published), 1)
+        self.assertEqual(self._run(describe_model, args),
+                [(True, 500, range(500))] * 4)
+        self.assertEqual(self._get_published_files() - before, published)
+        # a different model replaces the previous one
+        other = get_mesh(200, shift=1)
+        self.assertEqual(self._run(describe_model,
+                [(other, index) for index in range(4)]),
+                [(True, 200, range(200))] * 4)
+        self.assertEqual(len(self._get_published_files() - before), 1)
+        self.assertFalse(published & self._get_published_files())
+        pycam.Utils.threading.cleanup()
+        self.assertEqual(self._get_published_files(), before)
+
+    def test_stale_worker_items(self):
+        first = Item(1)
+        keys = self._run(get_worker_items, [(first, ), (first, )])
+        second = Item(2)
+        for items in self._run(get_worker_items, [(second, ), (second, )]):
+            # the items of the first job were dropped
+            self.assertTrue(len(items) <= 1)
+            self.assertFalse(set(items) & set(keys[0] + keys[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+import numpy
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+from pycam.Cutters.BaseCutter import BaseCutter
+from pycam.Geometry.Line import Line
+from pycam.Geometry.Triangle import Triangle
+from pycam.Geometry.intersection import drop_torus_points, drop_torus_edges
+from pycam.Geometry.utils import INFINITE, epsilon
+import pycam.Utils.DiskCache
+
+
+# number of samples along an edge for the reference distance
+REFERENCE_SAMPLES = 20001
+# maximum deviation of the vectorized solver from the reference
+TOLERANCE = 1e-6
+
+
+def get_reference_distance(cutter, edge):
+    """ the drop distance of the torus onto an edge (dense sampling) """
+    factors = numpy.linspace(0, 1, REFERENCE_SAMPLES)
+    start = numpy.array(edge.p1[:3], dtype=numpy.float64)
+    vector = numpy.array(edge.p2[:3], dtype=numpy.float64) - start
+    points = start + factors[:, numpy.newaxis] * vector
+    return drop_torus_points(numpy.array(cutter.center[:3]),
+            cutter.distance_majorradius, cutter.distance_minorradius,
+            points)[0].min()
+
+
+class TorusDropTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cutter = ToroidalCutter(1.0, 0.25)
+        self.cutter.moveto((0.1, -0.2, 5))
+        self.center = numpy.array(self.cutter.center[:3])
+        self.random = numpy.random.RandomState(1)
+
+    def _drop_edges(self, edges):
+        starts = numpy.array([edge.p1[:3] for edge in edges])
+        ends = numpy.array([edge.p2[:3] for edge in edges])
+        return drop_torus_edges(self.center, self.cutter.distance_majorradius,
+                self.cutter.distance_minorradius, starts, ends)
+
+    def test_points(self):
+        """ compare the vertex contacts with the scalar solver """
+        points = self.random.uniform((-1.5, -1.5, -1), (1.5, 1.5, 1),
+                (500, 3))
+        dist, valid = drop_torus_points(self.center,
+                self.cutter.distance_majorradius,
+                self.cutter.distance_minorradius, points)
+        self.assertTrue(valid.any())
+        self.assertFalse(valid.all())
+        for point, d, is_valid in zip(points, dist, valid):
+            cl, ccp, cp, l = self.cutter.intersect_torus_point(
+                    BaseCutter.vertical, tuple(point))
+            self.assertEqual(is_valid, not cl is None)
+            if is_valid:
+                self.assertAlmostEqual(d, l)
+            else:
+                self.assertEqual(d, INFINITE)
+
+    def test_edges(self):
+        """ compare the edge contacts with the reference and the scalar
+        solver
+        """
+        starts = self.random.uniform((-2, -2, -1), (2, 2, 1), (200, 3))
+        ends = self.random.uniform((-2, -2, -1), (2, 2, 1), (200, 3))
+        edges = [Line(tuple(start), tuple(end))
+                for start, end in zip(starts, ends)]
+        dist, factors, valid = self._drop_edges(edges)
+        self.assertTrue(valid.any())
+        for edge, d, factor, is_valid in zip(edges, dist, factors, valid):
+            reference = get_reference_distance(self.cutter, edge)
+            self.assertEqual(is_valid, reference < INFINITE)
+            old = self.cutter.intersect_torus_edge(BaseCutter.vertical,
+                    edge)[1]
+            if not is_valid:
+                self.assertEqual(d, INFINITE)
+                self.assertEqual(old, INFINITE)
+                continue
+            self.assertTrue(abs(d - reference) < TOLERANCE)
+            # the scalar solver never finds a higher contact
+            self.assertTrue(d <= old + epsilon)
+            # the factor belongs to the contact point
+            point = edge.point_with_length_multiply(factor)
+            self.assertAlmostEqual(self.cutter.intersect_torus_point(
+                    BaseCutter.vertical, point)[3], d)
+
+    def test_missed_contact(self):
+        """ The edge touches the torus only between two samples of the
+        scalar solver (half of the minor radius apart).
+        """
+        center = self.cutter.center
+        y = center[1] + self.cutter.distance_majorradius \
+                + self.cutter.distance_minorradius - 0.001
+        edge = Line((center[0] - 5.0625, y, 0), (center[0] + 4.9375, y, 0))
+        self.assertEqual(self.cutter.intersect_torus_edge(
+                BaseCutter.vertical, edge)[1], INFINITE)
+        dist, factors, valid = self._drop_edges([edge])
+        self.assertTrue(valid[0])
+        self.assertTrue(abs(dist[0] - get_reference_distance(self.cutter,
+                edge)) < TOLERANCE)
+        # a triangle touching the cutter only with this edge
+        triangle = Triangle(edge.p1, (edge.p1[0], y + 0.0005, 0), edge.p2)
+        location = self.cutter.location
+        self.assertEqual(self.cutter.drop(triangle), None)
+        cut = self.cutter.drop_triangles([triangle])
+        self.assertNotEqual(cut, None)
+        self.assertAlmostEqual(cut[2], location[2] - dist[0])
+
+    def test_sample_model(self):
+        """ compare the vectorized drop with the scalar drop """
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        model = ImportModel("samples/SampleScene.stl")
+        triangles = model.triangles()
+        cutter = ToroidalCutter(1.0, 0.25)
+        contacts = 0
+        for x in numpy.linspace(model.minx - 1, model.maxx + 1, 15):
+            for y in numpy.linspace(model.miny - 1, model.maxy + 1, 15):
+                start = (x, y, model.maxz + 5)
+                cut = cutter.drop_triangles(triangles, start=start)
+                heights = [c[2] for c in [cutter.drop(triangle, start=start)
+                        for triangle in triangles] if c]
+                if not heights:
+                    self.assertEqual(cut, None)
+                    continue
+                contacts += 1
+                # the sampling of the scalar solver may lower the cutter
+                self.assertTrue(cut[2] >= max(heights) - epsilon)
+                self.assertTrue(cut[2] <= max(heights) + 0.002)
+        self.assertTrue(contacts > 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
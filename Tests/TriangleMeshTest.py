@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import unittest
+
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Geometry.Model import Model, TriangleMesh
+from pycam.Geometry.Triangle import Triangle
+import pycam.Utils.DiskCache
+
+
+class TriangleMeshTest(unittest.TestCase):
+
+    def setUp(self):
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        self.meshes = [ImportModel("samples/SampleScene.stl"),
+                ImportModel("samples/Sphere_cut.stl")]
+
+    def _get_plain_triangles(self, mesh):
+        """ create independent Triangle objects for all faces of a mesh """
+        result = []
+        for points, normal in zip(mesh.get_triangle_points(), mesh.normals):
+            p1, p2, p3 = [tuple([float(value) for value in point])
+                    for point in points]
+            normal = tuple([float(value) for value in normal])
+            result.append(Triangle(p1, p2, p3, normal))
+        return result
+
+    def _assert_points_equal(self, point1, point2):
+        self.assertEqual(len(point1), len(point2))
+        for value1, value2 in zip(point1, point2):
+            self.assertAlmostEqual(value1, value2)
+
+    def _assert_triangles_equal(self, view, triangle):
+        for attr in ("p1", "p2", "p3", "middle"):
+            self._assert_points_equal(getattr(view, attr)[:3],
+                    getattr(triangle, attr)[:3])
+        self._assert_points_equal(view.normal[:3], triangle.normal[:3])
+        for attr in ("minx", "miny", "minz", "maxx", "maxy", "maxz",
+                "radius", "radiussq"):
+            self.assertAlmostEqual(getattr(view, attr),
+                    getattr(triangle, attr))
+
+    def _assert_mesh_equal(self, mesh, triangles):
+        self.assertEqual(len(mesh), len(triangles))
+        for index, triangle in enumerate(triangles):
+            self._assert_triangles_equal(mesh.get_triangle(index), triangle)
+            self._assert_points_equal(mesh.bounds[index],
+                    (triangle.minx, triangle.miny, triangle.minz,
+                        triangle.maxx, triangle.maxy, triangle.maxz))
+            self._assert_points_equal(mesh.middles[index], triangle.middle)
+            self.assertAlmostEqual(mesh.radii[index], triangle.radius)
+        for attr in ("minx", "miny", "minz", "maxx", "maxy", "maxz"):
+            self.assertAlmostEqual(getattr(mesh, attr),
+                    min([getattr(t, attr) for t in triangles])
+                    if attr.startswith("min")
+                    else max([getattr(t, attr) for t in triangles]))
+
+    def test_views(self):
+        for mesh in self.meshes:
+            self.assertTrue(isinstance(mesh, TriangleMesh))
+            self._assert_mesh_equal(mesh, self._get_plain_triangles(mesh))
+            # the views are cached
+            self.assertTrue(mesh.get_triangle(0) is mesh.get_triangle(0))
+            self.assertEqual(list(mesh.next()),
+                    [mesh.get_triangle(index) for index in range(len(mesh))])
+
+    def test_calculated_normals(self):
+        for mesh in self.meshes:
+            result = TriangleMesh(mesh.vertices, mesh.faces)
+            triangles = [Triangle(t.p1, t.p2, t.p3)
+                    for t in self._get_plain_triangles(mesh)]
+            self._assert_mesh_equal(result, triangles)
+
+    def test_append(self):
+        for mesh in self.meshes:
+            triangles = self._get_plain_triangles(mesh)
+            result = TriangleMesh()
+            for triangle in triangles:
+                result.append(triangle)
+            self._assert_mesh_equal(result, triangles)
+            # the appended triangles are used as views
+            self.assertTrue(result.get_triangle(0) is triangles[0])
+            # add a mesh and plain triangles
+            result += mesh
+            result.append(triangles[0])
+            self._assert_mesh_equal(result,
+                    triangles + triangles + [triangles[0]])
+
+    def test_sub_model(self):
+        for mesh in self.meshes:
+            plain = Model()
+            for triangle in self._get_plain_triangles(mesh):
+                plain.append(triangle)
+            minx = (mesh.minx + mesh.maxx) / 2.0
+            maxy = (mesh.miny + mesh.maxy) / 2.0
+            box = (minx, mesh.miny - 1, mesh.minz, mesh.maxx + 1, maxy,
+                    mesh.maxz)
+            sub_mesh = mesh.get_sub_model(*box)
+            self.assertTrue(isinstance(sub_mesh, TriangleMesh))
+            get_points = lambda t: (t.p1[:3], t.p2[:3], t.p3[:3])
+            expected = sorted([get_points(t) for t in plain.triangles(*box)])
+            self.assertTrue(len(expected) > 0)
+            self.assertTrue(len(expected) < len(mesh))
+            self.assertEqual(sorted([get_points(t)
+                    for t in sub_mesh.triangles()]), expected)
+            self.assertEqual(sorted([get_points(t)
+                    for t in mesh.triangles(*box)]), expected)
+
+    def test_transform(self):
+        for mesh in self.meshes:
+            triangles = self._get_plain_triangles(mesh)
+            plain = Model(use_kdtree=False)
+            for triangle in triangles:
+                plain.append(triangle)
+            for model in (mesh, plain):
+                model.shift(1.5, -2, 0.25)
+                model.scale(2, 0.5, 3)
+                model.transform_by_template("x_swap_y")
+                model.transform_by_template("xy_rotate_90")
+            self._assert_mesh_equal(mesh, triangles)
+
+    def test_copy(self):
+        mesh = self.meshes[0]
+        triangles = self._get_plain_triangles(mesh)
+        copied = mesh.copy()
+        copied.shift(1, 0, 0)
+        self._assert_mesh_equal(mesh, triangles)
+        self.assertEqual(len(copied), len(mesh))
+        self.assertAlmostEqual(copied.minx, mesh.minx + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
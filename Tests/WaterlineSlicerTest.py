@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+sys.path.insert(0,'.')
+
+import os
+import unittest
+
+import numpy
+
+from pycam.PathGenerators.WaterlineSlicer import WaterlineSlicer, \
+        get_tolerance
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Geometry.Model import Model
+from pycam.Importers.STLImporter import ImportModel
+from pycam.Toolpath.SupportGrid import _add_aligned_cuboid_to_model
+import pycam.Utils.DiskCache
+import pycam.Utils.threading
+
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "samples")
+
+# the slices miss tiny parts of the triangles near the vertices and edges
+# between them
+MARGIN = 0.001
+
+
+def get_distance_to_box(point, (minx, maxx, miny, maxy)):
+    dx = max(minx - point[0], 0, point[0] - maxx)
+    dy = max(miny - point[1], 0, point[1] - maxy)
+    return (dx ** 2 + dy ** 2) ** 0.5
+
+def get_distance_to_segments(point, p1, p2):
+    direction = p2 - p1
+    factors = numpy.clip(((point - p1) * direction).sum(axis=1)
+            / (direction ** 2).sum(axis=1), 0, 1)
+    return numpy.sqrt(((p1 + factors[:, None] * direction - point) ** 2).sum(
+            axis=1))
+
+def get_distance_to_model(point, model):
+    """ the exact distance between a point and the triangles of a model """
+    points = numpy.array([(t.p1[:3], t.p2[:3], t.p3[:3])
+            for t in model.triangles()], dtype=numpy.float64)
+    point = numpy.array(point, dtype=numpy.float64)
+    p1, p2, p3 = points[:, 0], points[:, 1], points[:, 2]
+    normals = numpy.cross(p2 - p1, p3 - p1)
+    normals /= numpy.sqrt((normals ** 2).sum(axis=1))[:, None]
+    heights = ((point - p1) * normals).sum(axis=1)
+    projected = point - heights[:, None] * normals
+    inside = numpy.ones(len(points), dtype=bool)
+    for start, end in ((p1, p2), (p2, p3), (p3, p1)):
+        inside &= (numpy.cross(end - start, projected - start)
+                * normals).sum(axis=1) >= 0
+    distances = numpy.minimum(numpy.minimum(
+            get_distance_to_segments(point, p1, p2),
+            get_distance_to_segments(point, p2, p3)),
+            get_distance_to_segments(point, p3, p1))
+    return numpy.where(inside, abs(heights), distances).min()
+
+def get_waterline(model, cutter, z, tolerance=None):
+    grid = [[[(0, 0, z), (1, 0, z)]]]
+    return [point for move, point in WaterlineSlicer(
+            tolerance=tolerance).GenerateToolPath(cutter, [model], grid)
+            if point]
+
+
+class WaterlineSlicerTest(unittest.TestCase):
+
+    def setUp(self):
+        pycam.Utils.DiskCache.get_cache().cache_dir = None
+        pycam.Utils.threading.init_threading(number_of_processes=1)
+        self.cutter = CylindricalCutter(0.5)
+        self.box = (0, 4, 0, 4)
+        self.bridge = (-2, 6, 1, 3)
+
+    def get_model(self, with_bridge=True):
+        model = Model()
+        cuboids = [self.box + (0, 2)]
+        if with_bridge:
+            cuboids.append(self.bridge + (3, 4))
+        for cuboid in cuboids:
+            for triangle in _add_aligned_cuboid_to_model(*cuboid).triangles():
+                model.append(triangle)
+        return model
+
+    def test_box(self):
+        points = get_waterline(self.get_model(with_bridge=False),
+                self.cutter, 0.5)
+        self.assertTrue(points)
+        # the corners are approximated by polygons around the circles
+        for point in points:
+            distance = get_distance_to_box(point, self.box)
+            self.assertTrue(0.5 - 1e-3 < distance < 0.51)
+
+    def test_overhang(self):
+        """ the shaft of the cutter must not pass through the bridge """
+        points = get_waterline(self.get_model(), self.cutter, 0.5)
+        self.assertTrue(points)
+        for point in points:
+            self.assertTrue(get_distance_to_box(point, self.bridge)
+                    > 0.5 - 1e-3)
+            self.assertTrue(get_distance_to_box(point, self.box) > 0.5 - 1e-3)
+        # the waterline goes around the bridge
+        self.assertTrue(min([point[0] for point in points]) < -2.4)
+        self.assertTrue(max([point[0] for point in points]) > 6.4)
+
+    def _get_ball_distances(self, model, cutter, tolerance):
+        distances = []
+        for index in range(1, 8):
+            z = model.minz + (model.maxz - model.minz) * index / 8.0
+            for point in get_waterline(model, cutter, z, tolerance):
+                center = (point[0], point[1], point[2] + cutter.radius)
+                distances.append(get_distance_to_model(center, model))
+        self.assertTrue(distances)
+        return distances
+
+    def test_ball_curved(self):
+        """ the spherical cutter along the sloped faces of a sphere """
+        model = ImportModel(os.path.join(SAMPLES_DIR, "Sphere_cut.stl"))
+        cutter = SphericalCutter(1)
+        for tolerance in (None, 0.01):
+            tolerance = get_tolerance(cutter, tolerance)
+            for distance in self._get_ball_distances(model, cutter,
+                    tolerance):
+                self.assertTrue(1 - MARGIN < distance)
+                self.assertTrue(distance < 1 + tolerance + MARGIN)
+
+    def test_ball_edges(self):
+        """ the vertices and edges between the slices must not be gouged
+        (e.g. the tips of the octahedron pointing sideways)
+        """
+        model = ImportModel(os.path.join(SAMPLES_DIR, "SampleScene.stl"))
+        cutter = SphericalCutter(1)
+        for tolerance in (None, 0.1):
+            for distance in self._get_ball_distances(model, cutter,
+                    tolerance):
+                self.assertTrue(1 - MARGIN < distance)
+
+
+if __name__ == "__main__":
+    unittest.main()
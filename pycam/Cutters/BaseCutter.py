@@ -24,7 +24,7 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 
 from pycam.Geometry import IDGenerator
 from pycam.Geometry.PointUtils import *
-from pycam.Geometry.utils import number, INFINITE, epsilon
+from pycam.Geometry.utils import number, INFINITE, epsilon, sqrt
 from pycam.Geometry.intersection import intersect_cylinder_point, \
         intersect_cylinder_line
 import uuid
@@ -111,28 +111,85 @@ class BaseCutter(IDGenerator):
         raise NotImplementedError("Inherited class of BaseCutter does not " \
                 + "implement the required function 'intersect'.")
 
-    def drop(self, triangle, start=None):
-        if start is None:
-            start = self.location
+    def is_drop_candidate(self, triangle, start):
+        """ check if the cutter dropped at "start" could touch the triangle
+        """
         # check bounding box collision
         if self.get_minx(start) > triangle.maxx + epsilon:
-            return None
+            return False
         if self.get_maxx(start) < triangle.minx - epsilon:
-            return None
+            return False
         if self.get_miny(start) > triangle.maxy + epsilon:
-            return None
+            return False
         if self.get_maxy(start) < triangle.miny - epsilon:
-            return None
+            return False
 
         # check bounding circle collision
         c = triangle.middle
         if (c[0] - start[0]) ** 2 + (c[1] - start[1]) ** 2 \
                 > (self.distance_radiussq + 2 * self.distance_radius \
                     * triangle.radius + triangle.radiussq) + epsilon:
-            return None
+            return False
+        return True
+
+    def get_profile_height(self, distance):
+        """ Returns the height of the lowest point of the cutter surface at
+        the given horizontal distance from the axis (relative to the tip of
+        the cutter). The height never decreases with the distance.
+        The default (the lowest point of the enlarged cutter) is valid for
+        all shapes - derived classes may return a tighter value.
+        """
+        return -self.get_required_distance()
 
+    def get_drop_limit(self, triangle, start):
+        """ Returns the highest possible cutter location (z) of the cutter
+        dropped at "start" onto the triangle. No point of the triangle is
+        closer to the axis of the cutter than its bounding box.
+        """
+        dx = max(triangle.minx - start[0], start[0] - triangle.maxx, 0)
+        dy = max(triangle.miny - start[1], start[1] - triangle.maxy, 0)
+        return triangle.maxz \
+                - self.get_profile_height(sqrt(dx * dx + dy * dy)) + epsilon
+
+    def drop(self, triangle, start=None):
+        if start is None:
+            start = self.location
+        if not self.is_drop_candidate(triangle, start):
+            return None
         return self.intersect(BaseCutter.vertical, triangle, start=start)[0]
 
+    def drop_triangles(self, triangles, start=None):
+        """ drop the cutter onto a set of triangles
+        The triangles are visited in the order of their drop limit. The
+        remaining triangles are skipped as soon as they can't raise the
+        cutter above the current result.
+        Returns the highest cutter location (or None).
+        """
+        if start is None:
+            start = self.location
+        candidates = self.get_drop_candidates(triangles, start)
+        result = None
+        for limit, triangle in candidates:
+            if result and (limit <= result[2]):
+                # the remaining triangles can't raise the cutter
+                break
+            cut = self.intersect(BaseCutter.vertical, triangle,
+                    start=start)[0]
+            if cut and ((result is None) or (cut[2] > result[2])):
+                result = cut
+        return result
+
+    def get_drop_candidates(self, triangles, start):
+        """ Returns the triangles (see "is_drop_candidate") together with
+        their drop limit (see "get_drop_limit"). The highest limit comes
+        first.
+        """
+        candidates = [(self.get_drop_limit(triangle, start), triangle)
+                for triangle in triangles
+                if self.is_drop_candidate(triangle, start)]
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return candidates
+
     def intersect_circle_triangle(self, direction, triangle, start=None):
         (cl, ccp, cp, d) = self.intersect_circle_plane(direction, triangle,
                 start=start)
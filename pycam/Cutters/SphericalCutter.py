@@ -143,6 +143,12 @@ class SphericalCutter(BaseCutter):
         BaseCutter.moveto(self, location, **kwargs)
         self.center = (location[0], location[1], location[2] + self.radius)
 
+    def get_profile_height(self, distance):
+        # the lower half of the (enlarged) sphere
+        if distance >= self.distance_radius:
+            return self.radius
+        return self.radius - sqrt(self.distance_radiussq - distance ** 2)
+
     def intersect_sphere_plane(self, direction, triangle, start=None):
         if start is None:
             start = self.location
@@ -196,7 +202,7 @@ class SphericalCutter(BaseCutter):
                 start=start)
         if cp:
             # check if the contact point is between the endpoints
-            d = psub(edge.p2, edge.p1)
+            d = edge.vector
             m = pdot(psub(cp, edge.p1), d)
             if (m < -epsilon) or (m > pnormsq(d) + epsilon):
                 return (None, INFINITE, None)
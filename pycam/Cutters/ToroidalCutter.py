@@ -22,11 +22,13 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from pycam.Geometry.PointUtils import *
-from pycam.Geometry.utils import INFINITE, number, epsilon
+from pycam.Geometry.utils import INFINITE, number, epsilon, sqrt
 from pycam.Geometry.intersection import intersect_torus_plane, \
         intersect_torus_point, intersect_circle_plane, intersect_circle_point, \
-        intersect_cylinder_point, intersect_cylinder_line, intersect_circle_line
+        intersect_cylinder_point, intersect_cylinder_line, \
+        intersect_circle_line, drop_torus_points, drop_torus_edges
 from pycam.Cutters.BaseCutter import BaseCutter
+import numpy
 
 
 try:
@@ -115,6 +117,15 @@ class ToroidalCutter(BaseCutter):
         BaseCutter.moveto(self, location, **kwargs)
         self.center = (location[0], location[1], location[2]+self.minorradius)
 
+    def get_profile_height(self, distance):
+        # the outer lower quarter of the (enlarged) torus - the disk and
+        # the inner part of the torus are above its lowest point
+        distance = max(0, distance - self.distance_majorradius)
+        if distance >= self.distance_minorradius:
+            return self.minorradius
+        return self.minorradius \
+                - sqrt(self.distance_minorradiussq - distance ** 2)
+
     def intersect_torus_plane(self, direction, triangle, start=None):
         if start is None:
             start = self.location
@@ -259,7 +270,58 @@ class ToroidalCutter(BaseCutter):
             return (cl, ccp, cp, l)
         return (None, None, None, INFINITE)
 
-    def intersect(self, direction, triangle, start=None):
+    def drop_triangles(self, triangles, start=None):
+        """ drop the cutter onto a set of triangles
+        The contacts of the torus with the edges and vertices of all
+        triangles are calculated at once.
+        Returns the highest cutter location (or None).
+        """
+        if start is None:
+            start = self.location
+        candidates = self.get_drop_candidates(triangles, start)
+        if not candidates:
+            return None
+        triangles = [triangle for limit, triangle in candidates]
+        center = numpy.array(padd(psub(start, self.location), self.center),
+                dtype=numpy.float64)
+        points = numpy.array([(t.p1[:3], t.p2[:3], t.p3[:3])
+                for t in triangles], dtype=numpy.float64)
+        ends = numpy.roll(points, -1, axis=1)
+        edge_dist, edge_factors = drop_torus_edges(center,
+                self.distance_majorradius, self.distance_minorradius,
+                points.reshape(-1, 3), ends.reshape(-1, 3))[:2]
+        vertex_dist = drop_torus_points(center, self.distance_majorradius,
+                self.distance_minorradius, points.reshape(-1, 3))[0]
+        # the order of "intersect": edges first, then vertices
+        dist = numpy.hstack((edge_dist.reshape(-1, 3),
+                vertex_dist.reshape(-1, 3)))
+        contacts = numpy.concatenate((points + edge_factors.reshape(-1, 3,
+                1) * (ends - points), points), axis=1)
+        best = dist.argmin(axis=1)
+        result = None
+        for index, (limit, triangle) in enumerate(candidates):
+            if result and (limit <= result[2]):
+                # the remaining triangles can't raise the cutter
+                break
+            d = float(dist[index, best[index]])
+            if d < INFINITE:
+                cl = (start[0], start[1], start[2] - d)
+                cp = tuple([float(value)
+                        for value in contacts[index, best[index]]])
+                torus_contact = (cl, d, cp)
+            else:
+                torus_contact = (None, INFINITE, None)
+            cut = self.intersect(BaseCutter.vertical, triangle, start=start,
+                    torus_contact=torus_contact)[0]
+            if cut and ((result is None) or (cut[2] > result[2])):
+                result = cut
+        return result
+
+    def intersect(self, direction, triangle, start=None, torus_contact=None):
+        """ "torus_contact" is the precalculated nearest contact (cl, d, cp)
+        of the torus with the edges and vertices of the triangle (see
+        "drop_triangles").
+        """
         (cl_t, d_t, cp_t) = self.intersect_torus_triangle(direction, triangle,
                 start=start)
         d = INFINITE
@@ -269,42 +331,49 @@ class ToroidalCutter(BaseCutter):
             d = d_t
             cl = cl_t
             cp = cp_t
-        (cl_e1, d_e1, cp_e1) = self.intersect_torus_edge(direction, triangle.e1,
-                start=start)
-        (cl_e2, d_e2, cp_e2) = self.intersect_torus_edge(direction, triangle.e2,
-                start=start)
-        (cl_e3, d_e3, cp_e3) = self.intersect_torus_edge(direction, triangle.e3,
-                start=start)
-        if d_e1 < d:
-            d = d_e1
-            cl = cl_e1
-            cp = cp_e1
-        if d_e2 < d:
-            d = d_e2
-            cl = cl_e2
-            cp = cp_e2
-        if d_e3 < d:
-            d = d_e3
-            cl = cl_e3
-            cp = cp_e3
-        (cl_p1, d_p1, cp_p1) = self.intersect_torus_vertex(direction,
-                triangle.p1, start=start)
-        (cl_p2, d_p2, cp_p2) = self.intersect_torus_vertex(direction,
-                triangle.p2, start=start)
-        (cl_p3, d_p3, cp_p3) = self.intersect_torus_vertex(direction,
-                triangle.p3, start=start)
-        if d_p1 < d:
-            d = d_p1
-            cl = cl_p1
-            cp = cp_p1
-        if d_p2 < d:
-            d = d_p2
-            cl = cl_p2
-            cp = cp_p2
-        if d_p3 < d:
-            d = d_p3
-            cl = cl_p3
-            cp = cp_p3
+        if torus_contact:
+            (cl_f, d_f, cp_f) = torus_contact
+            if d_f < d:
+                d = d_f
+                cl = cl_f
+                cp = cp_f
+        else:
+            (cl_e1, d_e1, cp_e1) = self.intersect_torus_edge(direction,
+                    triangle.e1, start=start)
+            (cl_e2, d_e2, cp_e2) = self.intersect_torus_edge(direction,
+                    triangle.e2, start=start)
+            (cl_e3, d_e3, cp_e3) = self.intersect_torus_edge(direction,
+                    triangle.e3, start=start)
+            if d_e1 < d:
+                d = d_e1
+                cl = cl_e1
+                cp = cp_e1
+            if d_e2 < d:
+                d = d_e2
+                cl = cl_e2
+                cp = cp_e2
+            if d_e3 < d:
+                d = d_e3
+                cl = cl_e3
+                cp = cp_e3
+            (cl_p1, d_p1, cp_p1) = self.intersect_torus_vertex(direction,
+                    triangle.p1, start=start)
+            (cl_p2, d_p2, cp_p2) = self.intersect_torus_vertex(direction,
+                    triangle.p2, start=start)
+            (cl_p3, d_p3, cp_p3) = self.intersect_torus_vertex(direction,
+                    triangle.p3, start=start)
+            if d_p1 < d:
+                d = d_p1
+                cl = cl_p1
+                cp = cp_p1
+            if d_p2 < d:
+                d = d_p2
+                cl = cl_p2
+                cp = cp_p2
+            if d_p3 < d:
+                d = d_p3
+                cl = cl_p3
+                cp = cp_p3
         (cl_t, d_t, cp_t) = self.intersect_circle_triangle(direction, triangle,
                 start=start)
         if d_t < d:
@@ -0,0 +1,544 @@
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy
+
+
+# Rebuild the tree, if the number of items inserted after the last build
+# exceeds this fraction of the indexed items (see "needs_rebalance") ...
+REBALANCE_FACTOR = 0.25
+# ... but never for less than this number of items.
+REBALANCE_MIN_ITEMS = 1024
+
+
+class BVH(object):
+    """ bounding volume hierarchy of axis aligned boxes
+
+    The nodes are stored in flat arrays. The children of an inner node are
+    located next to each other (at "first_child" and "first_child + 1").
+    The items of a leaf are a range ("start", "count") of "order".
+    Queries process the tree level by level (all nodes of a level at once)
+    and return arrays of item indices.
+    Items added via "insert" are not part of the tree. They are checked
+    one by one (vectorized) until the tree is rebuilt via "rebalance".
+    """
+
+    def __init__(self, mins, maxs, leaf_size=16):
+        """
+        @param mins: array (items x 3) of the lower corners of the items
+        @param maxs: array (items x 3) of the upper corners of the items
+        """
+        self._mins_buffer = numpy.array(mins, dtype=numpy.float64).reshape(
+                (-1, 3))
+        self._maxs_buffer = numpy.array(maxs, dtype=numpy.float64).reshape(
+                (-1, 3))
+        self._count = len(self._mins_buffer)
+        self.item_mins = self._mins_buffer
+        self.item_maxs = self._maxs_buffer
+        self.leaf_size = max(1, leaf_size)
+        self._build()
+
+    def __len__(self):
+        return self._count
+
+    def insert(self, mins, maxs):
+        """ add items without rebuilding the tree
+        The indices of the new items continue the existing ones.
+        """
+        mins = numpy.asarray(mins, dtype=numpy.float64).reshape((-1, 3))
+        maxs = numpy.asarray(maxs, dtype=numpy.float64).reshape((-1, 3))
+        new_count = self._count + len(mins)
+        if new_count > len(self._mins_buffer):
+            # grow the buffers exponentially to keep repeated inserts cheap
+            capacity = max(new_count, 2 * len(self._mins_buffer))
+            for name in ("_mins_buffer", "_maxs_buffer"):
+                old_buffer = getattr(self, name)
+                new_buffer = numpy.empty((capacity, 3), dtype=numpy.float64)
+                new_buffer[:self._count] = old_buffer[:self._count]
+                setattr(self, name, new_buffer)
+        self._mins_buffer[self._count:new_count] = mins
+        self._maxs_buffer[self._count:new_count] = maxs
+        self._count = new_count
+        self.item_mins = self._mins_buffer[:new_count]
+        self.item_maxs = self._maxs_buffer[:new_count]
+
+    def needs_rebalance(self):
+        unindexed = self._count - self.indexed_count
+        return unindexed > max(REBALANCE_MIN_ITEMS,
+                REBALANCE_FACTOR * self.indexed_count)
+
+    def rebalance(self):
+        """ rebuild the tree including all inserted items """
+        self._build()
+
+    def _build(self):
+        count = self._count
+        order = numpy.arange(count)
+        centers = (self.item_mins + self.item_maxs) / 2
+        mins, maxs, first_child, starts, counts = [], [], [], [], []
+        def add_node():
+            mins.append(None)
+            maxs.append(None)
+            first_child.append(-1)
+            starts.append(0)
+            counts.append(0)
+            return len(mins) - 1
+        if count > 0:
+            pending = [(add_node(), 0, count)]
+        else:
+            pending = []
+        while pending:
+            node, start, end = pending.pop()
+            items = order[start:end]
+            mins[node] = self.item_mins[items].min(axis=0)
+            maxs[node] = self.item_maxs[items].max(axis=0)
+            item_centers = centers[items]
+            spread = item_centers.max(axis=0) - item_centers.min(axis=0)
+            if (end - start <= self.leaf_size) or (spread.max() <= 0):
+                starts[node] = start
+                counts[node] = end - start
+                continue
+            # median split along the axis with the largest spread
+            axis = spread.argmax()
+            middle = (end - start) // 2
+            partition = numpy.argpartition(item_centers[:, axis], middle)
+            order[start:end] = items[partition]
+            left = add_node()
+            add_node()
+            first_child[node] = left
+            pending.append((left, start, start + middle))
+            pending.append((left + 1, start + middle, end))
+        self.indexed_count = count
+        self.order = order
+        self.node_mins = numpy.array(mins, dtype=numpy.float64).reshape(
+                (-1, 3))
+        self.node_maxs = numpy.array(maxs, dtype=numpy.float64).reshape(
+                (-1, 3))
+        self.first_child = numpy.array(first_child, dtype=numpy.intp)
+        self.starts = numpy.array(starts, dtype=numpy.intp)
+        self.counts = numpy.array(counts, dtype=numpy.intp)
+
+    def _traverse(self, node_test, item_test):
+        """ collect the items of all leaves accepted by "node_test" and
+        filter them with "item_test"
+        Both functions receive an array of node or item indices and return a
+        boolean array.
+        """
+        leaves = [numpy.zeros(0, dtype=numpy.intp)]
+        if len(self.node_mins) > 0:
+            current = numpy.zeros(1, dtype=numpy.intp)
+        else:
+            current = numpy.zeros(0, dtype=numpy.intp)
+        while len(current) > 0:
+            current = current[node_test(current)]
+            children = self.first_child[current]
+            is_leaf = children < 0
+            leaves.append(current[is_leaf])
+            children = children[numpy.logical_not(is_leaf)]
+            current = numpy.concatenate((children, children + 1))
+        leaves = numpy.concatenate(leaves)
+        # expand the item ranges of all leaves
+        counts = self.counts[leaves]
+        offsets = numpy.repeat(self.starts[leaves] - numpy.cumsum(counts)
+                + counts, counts)
+        items = self.order[offsets + numpy.arange(counts.sum())]
+        # add the items that were inserted after building the tree
+        items = numpy.concatenate((items,
+                numpy.arange(self.indexed_count, self._count)))
+        items = items[item_test(items)]
+        items.sort()
+        return items
+
+    def query_box(self, low, high):
+        """ return the indices of all items overlapping the box
+        Use "None" for an unlimited dimension.
+        """
+        low = numpy.array([(-numpy.inf if value is None else value)
+                for value in low], dtype=numpy.float64)
+        high = numpy.array([(numpy.inf if value is None else value)
+                for value in high], dtype=numpy.float64)
+        def get_test(box_mins, box_maxs):
+            return lambda indices: (box_mins[indices] <= high).all(axis=1) \
+                    & (box_maxs[indices] >= low).all(axis=1)
+        return self._traverse(get_test(self.node_mins, self.node_maxs),
+                get_test(self.item_mins, self.item_maxs))
+
+    def query_segment(self, p1, p2, radius=0, minz=None, maxz=None):
+        """ return the indices of all items that may be touched by a circle
+        with the given radius moving along the line from p1 to p2
+
+        The test is done in the xy plane. The boxes are extended by the
+        radius. Optionally the items are limited to a range of z values.
+        """
+        start = numpy.array(p1[:2], dtype=numpy.float64)
+        direction = numpy.array(p2[:2], dtype=numpy.float64) - start
+        minz = -numpy.inf if minz is None else minz
+        maxz = numpy.inf if maxz is None else maxz
+        def get_test(box_mins, box_maxs):
+            return lambda indices: _get_segment_overlap(box_mins[indices],
+                    box_maxs[indices], start, direction, radius, minz, maxz)
+        return self._traverse(get_test(self.node_mins, self.node_maxs),
+                get_test(self.item_mins, self.item_maxs))
+
+    def query_segments(self, segments, radius=0, minz=None, maxz=None):
+        """ return the result of "query_segment" for each of the segments
+
+        Parallel segments (e.g. the scanlines of a PushCutter layer) are
+        handled by a sweep instead of a tree traversal for each segment:
+        the segments are sorted by their position across the common
+        direction and every item is assigned to the range of segments
+        covered by its (extended) box. Only these pairs are checked.
+        "minz" and "maxz" may be sequences (one value for each segment).
+        """
+        count = len(segments)
+        if count == 0:
+            return []
+        starts = numpy.array([p1[:2] for p1, p2 in segments],
+                dtype=numpy.float64).reshape((-1, 2))
+        directions = numpy.array([p2[:2] for p1, p2 in segments],
+                dtype=numpy.float64).reshape((-1, 2)) - starts
+        minz = numpy.zeros(count) + (-numpy.inf if minz is None else minz)
+        maxz = numpy.zeros(count) + (numpy.inf if maxz is None else maxz)
+        normal = _get_common_normal(directions)
+        if (normal is None) or (count == 1):
+            return [self.query_segment(p1, p2, radius=radius, minz=low,
+                    maxz=high) for (p1, p2), low, high in zip(segments,
+                            minz, maxz)]
+        # position of the segments and the items across the direction
+        positions = (starts * normal).sum(axis=1)
+        order = positions.argsort()
+        positions = positions[order]
+        centers = (self.item_mins[:, :2] + self.item_maxs[:, :2]) / 2
+        # the boxes are extended by the radius along both axes
+        extents = (self.item_maxs[:, :2] - self.item_mins[:, :2]) / 2 + radius
+        item_positions = (centers * normal).sum(axis=1)
+        item_extents = (extents * abs(normal)).sum(axis=1)
+        first = positions.searchsorted(item_positions - item_extents,
+                side="left")
+        last = positions.searchsorted(item_positions + item_extents,
+                side="right")
+        # expand the ranges to pairs of (segment, item)
+        counts = numpy.maximum(last - first, 0)
+        items = numpy.repeat(numpy.arange(self._count), counts)
+        offsets = numpy.arange(counts.sum()) \
+                - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        lines = order[numpy.repeat(first, counts) + offsets]
+        valid = _get_segment_overlap(self.item_mins[items],
+                self.item_maxs[items], starts[lines], directions[lines],
+                radius, minz[lines], maxz[lines])
+        items, lines = items[valid], lines[valid]
+        # group the items by segment (ascending item indices)
+        sort_order = numpy.lexsort((items, lines))
+        items, lines = items[sort_order], lines[sort_order]
+        bounds = lines.searchsorted(numpy.arange(count + 1))
+        return [items[bounds[index]:bounds[index + 1]]
+                for index in range(count)]
+
+
+def _get_common_normal(directions):
+    """ Returns the (normalized) normal of the xy directions or None, if the
+    directions are not parallel.
+    """
+    lengths = numpy.sqrt((directions ** 2).sum(axis=1))
+    longest = lengths.argmax()
+    if lengths[longest] == 0:
+        return None
+    unit = directions[longest] / lengths[longest]
+    # the cross product is the distance from the common direction
+    cross = directions[:, 0] * unit[1] - directions[:, 1] * unit[0]
+    if (abs(cross) > 1e-9 * numpy.maximum(lengths, 1)).any():
+        return None
+    return numpy.array((-unit[1], unit[0]))
+
+def _get_segment_overlap(box_mins, box_maxs, start, direction, radius, minz,
+        maxz):
+    """ check which boxes (extended by radius) are touched by the segments
+    in the xy plane and overlap with the z range
+    The segments are given by start and direction (one for all boxes or one
+    for each box).
+    """
+    lower = box_mins[:, :2] - radius
+    upper = box_maxs[:, :2] + radius
+    # slab test: division by zero results in infinite factors
+    old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+    try:
+        inverse = 1.0 / direction
+        factor1 = (lower - start) * inverse
+        factor2 = (upper - start) * inverse
+    finally:
+        numpy.seterr(**old_settings)
+    enter = numpy.minimum(factor1, factor2)
+    leave = numpy.maximum(factor1, factor2)
+    # lines parallel to an axis: check the position instead
+    parallel = direction == 0
+    inside = (lower <= start) & (start <= upper)
+    enter = numpy.where(parallel, numpy.where(inside, -numpy.inf,
+            numpy.inf), enter)
+    leave = numpy.where(parallel, numpy.where(inside, numpy.inf,
+            -numpy.inf), leave)
+    enter = numpy.maximum(enter.max(axis=1), 0)
+    leave = numpy.minimum(leave.min(axis=1), 1)
+    return (enter <= leave) & (box_mins[:, 2] <= maxz) \
+            & (box_maxs[:, 2] >= minz)
+
+
+# Intervals overlapping more buckets than this are not registered in the
+# buckets. They are checked one by one (vectorized) for every query instead.
+INTERVAL_MAX_BUCKETS = 16
+
+
+class IntervalIndex(object):
+    """ index of one-dimensional intervals (e.g. the z range of triangles)
+
+    The range of all values is split into buckets of equal size. Every
+    interval is registered in all buckets that it overlaps. A query for a
+    single value checks only the intervals of one bucket.
+    """
+
+    def __init__(self, lows, highs):
+        self.lows = numpy.array(lows, dtype=numpy.float64).ravel()
+        self.highs = numpy.array(highs, dtype=numpy.float64).ravel()
+        count = len(self.lows)
+        if count == 0:
+            self.start, self.bucket_size = 0.0, 1.0
+            self.items = self.long_items = numpy.zeros(0, dtype=numpy.intp)
+            self.bucket_starts = numpy.zeros(1, dtype=numpy.intp)
+            return
+        self.start = self.lows.min()
+        total = self.highs.max() - self.start
+        # a typical interval should overlap only a few buckets
+        self.bucket_size = max(numpy.median(self.highs - self.lows),
+                float(total) / count, 1e-9)
+        first = self._get_bucket(self.lows)
+        last = self._get_bucket(self.highs)
+        counts = last - first + 1
+        is_long = counts > INTERVAL_MAX_BUCKETS
+        self.long_items = numpy.nonzero(is_long)[0]
+        counts[is_long] = 0
+        # expand the ranges to pairs of (bucket, item)
+        items = numpy.repeat(numpy.arange(count), counts)
+        offsets = numpy.arange(counts.sum()) \
+                - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        buckets = numpy.repeat(first, counts) + offsets
+        # a stable sort keeps the items of a bucket in ascending order
+        order = buckets.argsort(kind="mergesort")
+        self.items = items[order]
+        self.bucket_starts = buckets[order].searchsorted(
+                numpy.arange(last.max() + 2))
+
+    def __len__(self):
+        return len(self.lows)
+
+    def _get_bucket(self, values):
+        return numpy.floor((numpy.asarray(values) - self.start)
+                / self.bucket_size).astype(numpy.intp)
+
+    def query(self, value):
+        """ return the (ascending) indices of all intervals containing the
+        value
+        """
+        bucket = int(self._get_bucket(value))
+        if 0 <= bucket < len(self.bucket_starts) - 1:
+            candidates = self.items[self.bucket_starts[bucket]:
+                    self.bucket_starts[bucket + 1]]
+            if len(self.long_items) > 0:
+                candidates = numpy.union1d(candidates, self.long_items)
+        else:
+            candidates = self.long_items
+        return candidates[(self.lows[candidates] <= value)
+                & (self.highs[candidates] >= value)]
+
+    def query_pairs(self, values):
+        """ return two arrays: the indices of the values and the indices of
+        the intervals containing them (all pairs, grouped by interval)
+
+        Each interval is visited only for the values that it contains: the
+        values are sorted and every interval is assigned to the range of
+        values between its bounds.
+        """
+        values = numpy.asarray(values, dtype=numpy.float64).ravel()
+        order = values.argsort()
+        sorted_values = values[order]
+        first = sorted_values.searchsorted(self.lows, side="left")
+        last = sorted_values.searchsorted(self.highs, side="right")
+        counts = numpy.maximum(last - first, 0)
+        items = numpy.repeat(numpy.arange(len(self)), counts)
+        offsets = numpy.arange(counts.sum()) \
+                - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        return order[numpy.repeat(first, counts) + offsets], items
+
+    def query_many(self, values):
+        """ return the result of "query" for each of the values """
+        count = len(numpy.ravel(values))
+        if count == 0:
+            return []
+        positions, items = self.query_pairs(values)
+        # group the items by value (ascending item indices)
+        sort_order = numpy.lexsort((items, positions))
+        positions, items = positions[sort_order], items[sort_order]
+        bounds = positions.searchsorted(numpy.arange(count + 1))
+        return [items[bounds[index]:bounds[index + 1]]
+                for index in range(count)]
+
+
+def _get_grid_cell_size(mins, maxs):
+    """ Every box should cover only a few cells. Large boxes may not cover
+    more cells than there are boxes.
+    """
+    extents = (maxs[:, :2] - mins[:, :2]).max(axis=1)
+    span = (maxs[:, :2].max(axis=0) - mins[:, :2].min(axis=0)).max()
+    return max(numpy.median(extents), span / numpy.sqrt(len(mins)), 1e-9)
+
+def _get_grid_cells(mins, maxs, low, cell_size):
+    """ Returns the keys of the grid cells (xy plane) covered by the boxes
+    and the index of the box for each key.
+    """
+    first = numpy.floor((mins[:, :2] - low) / cell_size).astype(numpy.int64)
+    last = numpy.floor((maxs[:, :2] - low) / cell_size).astype(numpy.int64)
+    sizes = last - first + 1
+    counts = sizes[:, 0] * sizes[:, 1]
+    items = numpy.repeat(numpy.arange(len(mins)), counts)
+    offsets = numpy.arange(counts.sum()) \
+            - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    x = first[items, 0] + offsets % sizes[items, 0]
+    y = first[items, 1] + offsets // sizes[items, 0]
+    # the cell keys are only compared - their range is not relevant
+    return y * (2 ** 31) + x, items
+
+def _get_overlap(mins1, maxs1, mins2, maxs2):
+    return (mins1 <= maxs2).all(axis=1) & (mins2 <= maxs1).all(axis=1)
+
+def get_overlapping_pairs(mins, maxs, cell_size=None):
+    """ Returns two arrays of item indices: all pairs (first < second) of
+    overlapping boxes.
+
+    The boxes are registered in the cells of a uniform grid in the xy plane.
+    Only boxes sharing a cell are compared.
+    @param mins: array (items x dimensions) of the lower corners of the boxes
+        (at least two dimensions)
+    @param maxs: array (items x dimensions) of the upper corners of the boxes
+    """
+    mins = numpy.asarray(mins, dtype=numpy.float64)
+    maxs = numpy.asarray(maxs, dtype=numpy.float64)
+    count = len(mins)
+    if count < 2:
+        empty = numpy.zeros(0, dtype=numpy.intp)
+        return empty, empty
+    if cell_size is None:
+        cell_size = _get_grid_cell_size(mins, maxs)
+    keys, items = _get_grid_cells(mins, maxs, mins[:, :2].min(axis=0),
+            cell_size)
+    order = numpy.lexsort((items, keys))
+    keys, items = keys[order], items[order]
+    # pair every entry with the following entries of the same cell
+    group_ends = keys.searchsorted(keys, side="right")
+    counts = group_ends - numpy.arange(len(keys)) - 1
+    offsets = numpy.arange(counts.sum()) \
+            - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    pairs1 = numpy.repeat(items, counts)
+    pairs2 = items[numpy.repeat(numpy.arange(len(keys)), counts) + 1
+            + offsets]
+    # remove the duplicates (boxes sharing more than one cell)
+    pair_keys = numpy.unique(pairs1 * count + pairs2)
+    pairs1, pairs2 = pair_keys // count, pair_keys % count
+    overlap = _get_overlap(mins[pairs1], maxs[pairs1], mins[pairs2],
+            maxs[pairs2])
+    return pairs1[overlap], pairs2[overlap]
+
+def get_overlapping_pairs_between(mins1, maxs1, mins2, maxs2,
+        cell_size=None):
+    """ Returns two arrays of item indices: all pairs of overlapping boxes
+    (one box of the first set and one box of the second set).
+    See "get_overlapping_pairs" for details.
+    """
+    mins1 = numpy.asarray(mins1, dtype=numpy.float64)
+    maxs1 = numpy.asarray(maxs1, dtype=numpy.float64)
+    mins2 = numpy.asarray(mins2, dtype=numpy.float64)
+    maxs2 = numpy.asarray(maxs2, dtype=numpy.float64)
+    if (len(mins1) == 0) or (len(mins2) == 0):
+        empty = numpy.zeros(0, dtype=numpy.intp)
+        return empty, empty
+    if cell_size is None:
+        cell_size = _get_grid_cell_size(numpy.concatenate((mins1, mins2)),
+                numpy.concatenate((maxs1, maxs2)))
+    return GridIndex(mins2, maxs2, cell_size=cell_size).query_pairs(mins1,
+            maxs1)
+
+
+class GridIndex(object):
+    """ index of boxes (e.g. the edges of polygons) in a uniform grid
+
+    Every box is registered in all cells (xy plane) that it covers. A query
+    for another box checks only the boxes of the cells covered by it.
+    """
+
+    def __init__(self, mins, maxs, cell_size=None):
+        self.mins = numpy.asarray(mins, dtype=numpy.float64)
+        self.maxs = numpy.asarray(maxs, dtype=numpy.float64)
+        if len(self.mins) == 0:
+            self.low, self.high, self.cell_size = numpy.zeros(2), \
+                    numpy.zeros(2, dtype=numpy.int64), 1.0
+            self.keys = self.items = numpy.zeros(0, dtype=numpy.intp)
+            return
+        if cell_size is None:
+            cell_size = _get_grid_cell_size(self.mins, self.maxs)
+        self.cell_size = cell_size
+        self.low = self.mins[:, :2].min(axis=0)
+        # the index of the last cell in each direction
+        self.high = numpy.floor((self.maxs[:, :2].max(axis=0) - self.low)
+                / cell_size).astype(numpy.int64)
+        keys, items = _get_grid_cells(self.mins, self.maxs, self.low,
+                cell_size)
+        order = keys.argsort(kind="mergesort")
+        self.keys, self.items = keys[order], items[order]
+
+    def __len__(self):
+        return len(self.mins)
+
+    def query_pairs(self, mins, maxs):
+        """ Returns two arrays: the indices of the given boxes and the
+        indices of the registered boxes overlapping them (all pairs).
+        """
+        mins = numpy.asarray(mins, dtype=numpy.float64)
+        maxs = numpy.asarray(maxs, dtype=numpy.float64)
+        if (len(mins) == 0) or (len(self) == 0):
+            empty = numpy.zeros(0, dtype=numpy.intp)
+            return empty, empty
+        # only the cells within the grid are relevant
+        cell_mins = numpy.maximum(mins[:, :2], self.low)
+        cell_maxs = numpy.minimum(maxs[:, :2], self.low + self.cell_size
+                * (self.high + 1))
+        inside = (cell_mins <= cell_maxs).all(axis=1)
+        query_items = numpy.nonzero(inside)[0]
+        keys, positions = _get_grid_cells(cell_mins[inside],
+                cell_maxs[inside], self.low, self.cell_size)
+        positions = query_items[positions]
+        first = self.keys.searchsorted(keys, side="left")
+        counts = self.keys.searchsorted(keys, side="right") - first
+        offsets = numpy.arange(counts.sum()) \
+                - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        pairs1 = numpy.repeat(positions, counts)
+        pairs2 = self.items[numpy.repeat(first, counts) + offsets]
+        # remove the duplicates (boxes sharing more than one cell)
+        pair_keys = numpy.unique(pairs1 * len(self) + pairs2)
+        pairs1, pairs2 = pair_keys // len(self), pair_keys % len(self)
+        overlap = _get_overlap(mins[pairs1], maxs[pairs1], self.mins[pairs2],
+                self.maxs[pairs2])
+        return pairs1[overlap], pairs2[overlap]
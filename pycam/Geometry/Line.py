@@ -38,8 +38,8 @@ except ImportError:
 
 class Line(IDGenerator, TransformableContainer):
 
-    __slots__ = ["id", "p1", "p2", "_vector", "_minx", "_maxx", "_miny",
-            "_maxy", "_minz", "_maxz"]
+    __slots__ = ["id", "p1", "p2", "_vector", "_dir", "_len", "_minx",
+            "_maxx", "_miny", "_maxy", "_minz", "_maxz"]
 
     def __init__(self, p1, p2):
         super(Line, self).__init__()
@@ -58,11 +58,15 @@ class Line(IDGenerator, TransformableContainer):
 
     @property
     def dir(self):
-        return pnormalized(self.vector)
+        if self._dir is None:
+            self._dir = pnormalized(self.vector)
+        return self._dir
 
     @property
     def len(self):
-        return pnorm(self.vector)
+        if self._len is None:
+            self._len = pnorm(self.vector)
+        return self._len
 
     @property
     def minx(self):
@@ -130,6 +134,8 @@ class Line(IDGenerator, TransformableContainer):
 
     def reset_cache(self):
         self._vector = None
+        self._dir = None
+        self._len = None
         self._minx = None
         self._maxx = None
         self._miny = None
@@ -21,8 +21,9 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import uuid
+import hashlib
 import math
+import numpy
 
 
 import pycam.Exporters.STLExporter
@@ -31,13 +32,18 @@ from pycam.Geometry.Triangle import Triangle
 from pycam.Geometry.Line import Line
 from pycam.Geometry.Plane import Plane
 from pycam.Geometry.Polygon import Polygon
+from pycam.Geometry.PolygonBoolean import is_polygon_supported, \
+        get_union_polygons
+from pycam.Geometry.PolygonOffset import is_offset_supported, \
+        get_offset_polygons
 from pycam.Geometry.PointUtils import *
-from pycam.Geometry.TriangleKdtree import TriangleKdtree
+from pycam.Geometry.BVH import BVH, IntervalIndex, get_overlapping_pairs
 from pycam.Geometry.Matrix import TRANSFORMATIONS
 from pycam.Toolpath import Bounds
 from pycam.Geometry.utils import INFINITE, epsilon
 from pycam.Geometry import TransformableContainer, IDGenerator
 from pycam.Utils import ProgressCounter
+import pycam.Utils.DiskCache
 import pycam.Utils.log
 
 
@@ -50,6 +56,9 @@ except ImportError:
 
 log = pycam.Utils.log.get_logger()
 
+# smaller models are faster processed than loaded from the disk cache
+DISK_CACHE_MIN_TRIANGLES = 1000
+
 
 def get_combined_bounds(models):
     low = [None, None, None]
@@ -98,10 +107,15 @@ class BaseModel(IDGenerator, TransformableContainer):
     def __add__(self, other_model):
         """ combine two models """
         result = self.copy()
-        for item in other_model.next():
-            result.append(item.copy())
+        result += other_model
         return result
 
+    def __iadd__(self, other_model):
+        """ add (copies of) the items of another model to this model """
+        for item in other_model.next():
+            self.append(item.copy())
+        return self
+
     def __len__(self):
         """ Return the number of available items in the model.
         This is mainly useful for evaluating an empty model as False.
@@ -225,13 +239,20 @@ class Model(BaseModel):
         self._triangles = []
         self._item_groups.append(self._triangles)
         self._export_function = pycam.Exporters.STLExporter.STLExporter
-        # marker for state of kdtree and uuid
+        # marker for the state of the cached flat areas
         self._dirty = True
-        # enable/disable kdtree
+        # enable/disable the spatial index of the triangles
         self._use_kdtree = use_kdtree
-        self._t_kdtree = None
+        self._t_index = None
+        # index of the z ranges of the triangles (for slicing the model)
+        self._z_index = None
+        # the spatial index is not rebalanced during bulk updates
+        self._bulk_update_level = 0
         self.__flat_groups_cache = {}
-        self.__uuid = None
+        # the content hash is updated with the triangles added since the
+        # last request
+        self.__content_hash = None
+        self.__hashed_count = 0
         
     def __len__(self):
         """ Return the number of available items in the model.
@@ -245,49 +266,264 @@ class Model(BaseModel):
             result.append(triangle.copy())
         return result
 
+    def __getstate__(self):
+        # hash objects can't be pickled - the hash is calculated again
+        state = self.__dict__.copy()
+        state["_Model__content_hash"] = None
+        return state
+
     @property
     def uuid(self):
-        if (self.__uuid is None) or self._dirty:
+        # the content hash identifies the model (e.g. for the disk cache)
+        if self._dirty:
             self._update_caches()
-        return self.__uuid
+        return self._get_content_hash()
+
+    def __iadd__(self, other_model):
+        self.begin_bulk_update()
+        try:
+            return super(Model, self).__iadd__(other_model)
+        finally:
+            self.end_bulk_update()
 
     def append(self, item):
         super(Model, self).append(item)
         if isinstance(item, Triangle):
             self._triangles.append(item)
-            # we assume, that the kdtree needs to be rebuilt again
+            # new triangles are added to the spatial index on demand
             self._dirty = True
 
+    def begin_bulk_update(self):
+        """ Announce that many triangles will be added to the model.
+        New triangles are added to the spatial index without rebalancing it
+        until the matching call of "end_bulk_update". Queries in between are
+        allowed.
+        """
+        self._bulk_update_level += 1
+
+    def end_bulk_update(self):
+        self._bulk_update_level = max(0, self._bulk_update_level - 1)
+        if (self._bulk_update_level == 0) and not self._t_index is None:
+            self._update_index()
+
     def reset_cache(self):
         super(Model, self).reset_cache()
-        # the triangle kdtree needs to be reset after transforming the model
+        # the spatial index needs to be rebuilt after transforming the model
+        self._t_index = None
+        self._z_index = None
+        self._reset_content_hash()
         self._update_caches()
 
     def _update_caches(self):
-        if self._use_kdtree:
-            self._t_kdtree = TriangleKdtree(self.triangles())
-        self.__uuid = str(uuid.uuid4())
         self.__flat_groups_cache = {}
-        # the kdtree is up-to-date again
         self._dirty = False
 
+    def _update_index(self):
+        """ Build the spatial index or add new triangles to it. The index is
+        rebuilt, if too many triangles were added since the last build.
+        """
+        if self._t_index is None:
+            self._t_index = self._get_cached_data("triangle_index")
+            if self._t_index is None:
+                bounds = self._get_triangle_bounds()
+                self._t_index = BVH(bounds[:, :3], bounds[:, 3:])
+                self._set_cached_data("triangle_index", self._t_index)
+        elif len(self._t_index) < len(self):
+            bounds = self._get_triangle_bounds(start=len(self._t_index))
+            self._t_index.insert(bounds[:, :3], bounds[:, 3:])
+        if (self._bulk_update_level == 0) and self._t_index.needs_rebalance():
+            self._t_index.rebalance()
+
+    def build_indices(self):
+        """ Build the spatial index and the z index of the triangles now
+        (instead of on demand) - e.g. before sharing the model with other
+        processes.
+        """
+        if self._use_kdtree:
+            self._update_index()
+        self._update_z_index()
+
+    def _update_z_index(self):
+        """ Build the index of the z ranges of the triangles. It is rebuilt
+        completely, if triangles were added since the last build.
+        """
+        if (self._z_index is None) or (len(self._z_index) != len(self)):
+            bounds = self._get_triangle_bounds()
+            self._z_index = IntervalIndex(bounds[:, 2], bounds[:, 5])
+
+    def _get_triangle_data(self, start=0):
+        """ Returns an array containing the vertices and the normal of each
+        triangle (p1, p2, p3, normal) beginning with the index "start".
+        """
+        return numpy.array([t.p1[:3] + t.p2[:3] + t.p3[:3] + t.normal[:3]
+                for t in self._triangles[start:]],
+                dtype=numpy.float64).reshape((-1, 12))
+
+    def _get_content_hash(self):
+        """ Returns the hash of the triangle data. Only the triangles added
+        since the last call are processed.
+        """
+        if self.__content_hash is None:
+            self.__content_hash = hashlib.sha1()
+            self.__hashed_count = 0
+        if self.__hashed_count < len(self):
+            data = numpy.ascontiguousarray(self._get_triangle_data(
+                    start=self.__hashed_count), dtype=numpy.float64)
+            self.__content_hash.update(data.tostring())
+            self.__hashed_count = len(self)
+        return self.__content_hash.hexdigest()
+
+    def _reset_content_hash(self):
+        """ The content hash is calculated again for all triangles - e.g.
+        after a transformation.
+        """
+        self.__content_hash = None
+
+    def _get_cached_data(self, name):
+        """ Returns data stored in the disk cache for the current content of
+        the model (or None).
+        """
+        if len(self) < DISK_CACHE_MIN_TRIANGLES:
+            return None
+        return pycam.Utils.DiskCache.get_cache().get(self.uuid, name)
+
+    def _set_cached_data(self, name, value):
+        if len(self) < DISK_CACHE_MIN_TRIANGLES:
+            return
+        pycam.Utils.DiskCache.get_cache().set(self.uuid, name, value)
+
+    def _get_triangle_bounds(self, start=0):
+        """ Returns an array containing the bounds (minx, miny, minz, maxx,
+        maxy, maxz) of each triangle (beginning with the index "start").
+        """
+        return numpy.array([(t.minx, t.miny, t.minz, t.maxx, t.maxy, t.maxz)
+                for t in self._triangles[start:]],
+                dtype=numpy.float64).reshape((-1, 6))
+
+    def _get_triangles_by_index(self, indices):
+        return [self._triangles[index] for index in indices]
+
+    def get_triangle_indices(self, minx=-INFINITE, miny=-INFINITE,
+            minz=-INFINITE, maxx=+INFINITE, maxy=+INFINITE, maxz=+INFINITE):
+        """ Returns an array of the indices of all triangles overlapping
+        with the given box (or all triangles, if the spatial index is
+        disabled).
+        """
+        if (minx == miny == minz == -INFINITE) \
+                and (maxx == maxy == maxz == +INFINITE):
+            return numpy.arange(len(self))
+        if self._use_kdtree:
+            # update the index, if new triangles were added meanwhile
+            self._update_index()
+            return self._t_index.query_box((minx, miny, minz),
+                    (maxx, maxy, maxz))
+        return numpy.arange(len(self))
+
+    def get_triangle_indices_along_line(self, p1, p2, radius=0,
+            minz=-INFINITE, maxz=+INFINITE):
+        """ Returns an array of the indices of all triangles that may be
+        touched by a circle (in the xy plane) moving from p1 to p2. Only
+        triangles overlapping the range between minz and maxz are returned.
+        """
+        if self._use_kdtree:
+            self._update_index()
+            return self._t_index.query_segment(p1, p2, radius=radius,
+                    minz=minz, maxz=maxz)
+        return numpy.arange(len(self))
+
+    def get_triangle_indices_along_lines(self, lines, radius=0,
+            minz=-INFINITE, maxz=+INFINITE):
+        """ Returns a list of index arrays (see
+        "get_triangle_indices_along_line") for a list of (p1, p2) tuples.
+        "minz" and "maxz" may be sequences (one value for each line).
+        Parallel lines are processed at once.
+        """
+        if self._use_kdtree:
+            self._update_index()
+            return self._t_index.query_segments(lines, radius=radius,
+                    minz=minz, maxz=maxz)
+        return [numpy.arange(len(self)) for line in lines]
+
+    def get_triangle_indices_at_height(self, z):
+        """ Returns an array of the indices of all triangles whose z range
+        contains the given height.
+        """
+        self._update_z_index()
+        return self._z_index.query(z)
+
+    def get_triangle_indices_at_heights(self, heights):
+        """ Returns a list of index arrays (see
+        "get_triangle_indices_at_height") for a sequence of heights.
+        Every triangle is visited only for the heights crossing it.
+        """
+        self._update_z_index()
+        return self._z_index.query_many(heights)
+
+    def triangles_at_height(self, z):
+        return self._get_triangles_by_index(
+                self.get_triangle_indices_at_height(z))
+
+    def triangles_at_heights(self, heights):
+        return [self._get_triangles_by_index(indices) for indices
+                in self.get_triangle_indices_at_heights(heights)]
+
     def triangles(self, minx=-INFINITE, miny=-INFINITE, minz=-INFINITE,
             maxx=+INFINITE, maxy=+INFINITE, maxz=+INFINITE):
         if (minx == miny == minz == -INFINITE) \
                 and (maxx == maxy == maxz == +INFINITE):
             return self._triangles
-        if self._use_kdtree:
-            # update the kdtree, if new triangles were added meanwhile
-            if self._dirty:
-                self._update_caches()
-            return self._t_kdtree.Search(minx, maxx, miny, maxy)
-        return self._triangles
+        return self._get_triangles_by_index(self.get_triangle_indices(minx,
+                miny, minz, maxx, maxy, maxz))
+
+    def triangles_along_line(self, p1, p2, radius=0, minz=-INFINITE,
+            maxz=+INFINITE):
+        return self._get_triangles_by_index(
+                self.get_triangle_indices_along_line(p1, p2, radius=radius,
+                        minz=minz, maxz=maxz))
+
+    def triangles_along_lines(self, lines, radius=0, minz=-INFINITE,
+            maxz=+INFINITE):
+        return [self._get_triangles_by_index(indices)
+                for indices in self.get_triangle_indices_along_lines(lines,
+                        radius=radius, minz=minz, maxz=maxz)]
+
+    def get_sub_model(self, minx=-INFINITE, miny=-INFINITE, minz=-INFINITE,
+            maxx=+INFINITE, maxy=+INFINITE, maxz=+INFINITE):
+        """ Returns a new model containing only the triangles overlapping
+        with the given box. The triangles are shared with this model.
+        """
+        result = self.__class__(use_kdtree=self._use_kdtree)
+        result.begin_bulk_update()
+        for triangle in self.triangles(minx, miny, minz, maxx, maxy, maxz):
+            result.append(triangle)
+        result.end_bulk_update()
+        return result
 
     def get_waterline_contour(self, plane, callback=None):
+        if self._dirty:
+            self._update_caches()
+        cache_name = "waterline-%s" % hashlib.sha1(repr((plane.p[:3],
+                plane.n[:3]))).hexdigest()
+        cached_polygons = self._get_cached_data(cache_name)
+        if not cached_polygons is None:
+            contour = ContourModel(plane=plane)
+            for points, is_closed in cached_polygons:
+                polygon = Polygon(plane=plane)
+                if is_closed:
+                    points = points + points[:1]
+                for index in range(len(points) - 1):
+                    polygon.append(Line(points[index], points[index + 1]))
+                contour.append(polygon)
+            return contour
+        if (plane.n[0] == plane.n[1] == 0) and (plane.n[2] != 0):
+            # only the triangles crossing a horizontal plane are relevant
+            triangles = self.triangles_at_height(plane.p[2])
+        else:
+            triangles = self.triangles()
         collision_lines = []
-        progress_max = 2 * len(self._triangles)
+        progress_max = 2 * len(triangles)
         counter = 0
-        for t in self._triangles:
+        for t in triangles:
             if callback and callback(percent=100.0 * counter / progress_max):
                 return
             collision_line = plane.intersect_triangle(t, counter_clockwise=True)
@@ -306,51 +542,304 @@ class Model(BaseModel):
         log.debug("Waterline: %f - %d - %s" % (plane.p[2],
                 len(contour.get_polygons()),
                 [len(p.get_lines()) for p in contour.get_polygons()]))
+        self._set_cached_data(cache_name, [(polygon.get_points(),
+                polygon.is_closed) for polygon in contour.get_polygons()])
         return contour
 
     def get_flat_areas(self, min_area=None):
         """ Find plane areas (combinations of triangles) bigger than 'min_area'
         and ignore vertical planes. The result is cached.
         """
+        if self._dirty:
+            self._update_caches()
         if not self.__flat_groups_cache.has_key(min_area):
-            def has_shared_edge(t1, t2):
-                count = 0
-                for p in (t1.p1, t1.p2, t1.p3):
-                    if p in (t2.p1, t2.p2, t2.p3):
-                        count += 1
-                return count >= 2
-            groups = []
-            for t in self.triangles():
-                # Find all groups with the same direction (see 'normal') that
-                # share at least one edge with the current triangle.
-                touch_groups = []
-                if t.normal[2] == 0:
-                    # ignore vertical triangles
-                    continue
-                for group_index, group in enumerate(groups):
-                    if t.normal == group[0].normal:
-                        for group_t in group:
-                            if has_shared_edge(t, group_t):
-                                touch_groups.append(group_index)
-                                break
-                if len(touch_groups) > 1:
-                    # combine multiple areas with this new triangle
-                    touch_groups.reverse()
-                    combined = [t]
-                    for touch_group_index in touch_groups:
-                        combined.extend(groups.pop(touch_group_index))
-                    groups.append(combined)
-                elif len(touch_groups) == 1:
-                    groups[touch_groups[0]].append(t)
-                else:
-                    groups.append([t])
-            # check the size of each area
-            if not min_area is None:
-                groups = [group for group in groups
-                        if sum([t.get_area() for t in group]) >= min_area]
-            self.__flat_groups_cache[min_area] = groups
+            triangles = self.triangles()
+            cache_name = "flat_areas-%s" % repr(min_area)
+            index_groups = self._get_cached_data(cache_name)
+            if index_groups is None:
+                index_groups = self._get_flat_area_indices(triangles,
+                        min_area)
+                self._set_cached_data(cache_name, index_groups)
+            self.__flat_groups_cache[min_area] = [
+                    [triangles[index] for index in group]
+                    for group in index_groups]
         return self.__flat_groups_cache[min_area]
 
+    @staticmethod
+    def _get_flat_area_indices(triangles, min_area):
+        def has_shared_edge(t1, t2):
+            count = 0
+            for p in (t1.p1, t1.p2, t1.p3):
+                if p in (t2.p1, t2.p2, t2.p3):
+                    count += 1
+            return count >= 2
+        groups = []
+        for index, t in enumerate(triangles):
+            # Find all groups with the same direction (see 'normal') that
+            # share at least one edge with the current triangle.
+            touch_groups = []
+            if t.normal[2] == 0:
+                # ignore vertical triangles
+                continue
+            for group_index, group in enumerate(groups):
+                if t.normal == triangles[group[0]].normal:
+                    for group_t_index in group:
+                        if has_shared_edge(t, triangles[group_t_index]):
+                            touch_groups.append(group_index)
+                            break
+            if len(touch_groups) > 1:
+                # combine multiple areas with this new triangle
+                touch_groups.reverse()
+                combined = [index]
+                for touch_group_index in touch_groups:
+                    combined.extend(groups.pop(touch_group_index))
+                groups.append(combined)
+            elif len(touch_groups) == 1:
+                groups[touch_groups[0]].append(index)
+            else:
+                groups.append([index])
+        # check the size of each area
+        if not min_area is None:
+            groups = [group for group in groups
+                    if sum([triangles[index].get_area()
+                        for index in group]) >= min_area]
+        return groups
+
+
+class TriangleMesh(Model):
+    """ A triangle model based on contiguous arrays
+
+    The vertices, faces, normals, bounds and circumcircles of all triangles
+    are stored in numpy arrays. Triangle objects are created on demand (only
+    for code that still needs them) and cached until the next modification.
+    The faces refer to the vertices in clockwise order (see Triangle).
+    """
+
+    def __init__(self, vertices=None, faces=None, normals=None,
+            use_kdtree=True):
+        super(TriangleMesh, self).__init__(use_kdtree=use_kdtree)
+        self._vertices = numpy.zeros((0, 3), dtype=numpy.float64)
+        self._faces = numpy.zeros((0, 3), dtype=numpy.intp)
+        self._normals = numpy.zeros((0, 3), dtype=numpy.float64)
+        self._bounds = numpy.zeros((0, 6), dtype=numpy.float64)
+        self._middles = numpy.zeros((0, 3), dtype=numpy.float64)
+        self._radii = numpy.zeros(0, dtype=numpy.float64)
+        # triangles added via "append" (merged into the arrays on demand)
+        self._pending_triangles = []
+        self._triangle_views = {}
+        if not vertices is None:
+            self.append_arrays(vertices, faces, normals=normals)
+
+    def __len__(self):
+        return len(self._faces) + len(self._pending_triangles)
+
+    def copy(self):
+        self._merge_pending_triangles()
+        return self.__class__(self._vertices.copy(), self._faces.copy(),
+                normals=self._normals.copy(), use_kdtree=self._use_kdtree)
+
+    def __iadd__(self, other_model):
+        if isinstance(other_model, TriangleMesh):
+            self.append_arrays(other_model.vertices, other_model.faces,
+                    normals=other_model.normals)
+            return self
+        else:
+            return super(TriangleMesh, self).__iadd__(other_model)
+
+    def next(self):
+        for index in range(len(self)):
+            yield self.get_triangle(index)
+
+    def get_children_count(self):
+        # see Triangle.get_children_count
+        return 7 * len(self)
+
+    def append(self, item):
+        if isinstance(item, Triangle):
+            self._pending_triangles.append(item)
+            self._update_limits(item)
+            self._dirty = True
+
+    def append_arrays(self, vertices, faces, normals=None):
+        """ add triangles to the mesh
+
+        @param vertices: array (or list) of points (x, y, z)
+        @param faces: array (or list) of vertex index triples (clockwise)
+        @param normals: array (or list) of the normals of the faces - they
+            are calculated from the vertices if they are not given
+        """
+        self._merge_pending_triangles()
+        vertices = numpy.array(vertices, dtype=numpy.float64).reshape((-1, 3))
+        faces = numpy.array(faces, dtype=numpy.intp).reshape((-1, 3))
+        if normals is None:
+            normals = self._calculate_normals(vertices, faces)
+        else:
+            normals = numpy.array(normals,
+                    dtype=numpy.float64).reshape((-1, 3))
+        start = len(self._faces)
+        self._faces = numpy.concatenate((self._faces,
+                faces + len(self._vertices)))
+        self._vertices = numpy.concatenate((self._vertices, vertices))
+        self._normals = numpy.concatenate((self._normals, normals))
+        self._update_triangle_data(start=start)
+
+    def _merge_pending_triangles(self):
+        if not self._pending_triangles:
+            return
+        triangles = self._pending_triangles
+        self._pending_triangles = []
+        vertices = numpy.array([t.p1[:3] + t.p2[:3] + t.p3[:3]
+                for t in triangles], dtype=numpy.float64).reshape((-1, 3))
+        faces = numpy.arange(len(vertices)).reshape((-1, 3))
+        normals = [t.normal[:3] for t in triangles]
+        start_index = len(self._faces)
+        self.append_arrays(vertices, faces, normals=normals)
+        # the appended triangles are valid views of the new faces
+        for index, triangle in enumerate(triangles):
+            self._triangle_views[start_index + index] = triangle
+
+    @staticmethod
+    def _calculate_normals(vertices, faces):
+        """ see Triangle.reset_cache """
+        points = vertices[faces]
+        normals = numpy.cross(points[:, 2] - points[:, 0],
+                points[:, 1] - points[:, 0])
+        lengths = numpy.sqrt((normals * normals).sum(axis=1))
+        lengths[lengths == 0] = 1
+        return normals / lengths[:, numpy.newaxis]
+
+    def _update_triangle_data(self, start=0):
+        """ calculate the bounds and the circumcircles of all triangles
+        beginning with the index "start" (see Triangle.reset_cache)
+        """
+        points = self._vertices[self._faces[start:]]
+        p1, p2, p3 = points[:, 0], points[:, 1], points[:, 2]
+        bounds = numpy.hstack((points.min(axis=1), points.max(axis=1)))
+        dist_sq = lambda a, b: ((a - b) ** 2).sum(axis=1)
+        dot = lambda a, b: (a * b).sum(axis=1)
+        cross = numpy.cross(p2 - p1, p3 - p2)
+        denom = numpy.sqrt((cross * cross).sum(axis=1))
+        old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+        try:
+            radii = numpy.sqrt(dist_sq(p2, p1) * dist_sq(p3, p2)
+                    * dist_sq(p3, p1)) / (2 * denom)
+            denom2 = 2 * denom * denom
+            alpha = dist_sq(p3, p2) * dot(p1 - p2, p1 - p3) / denom2
+            beta = dist_sq(p1, p3) * dot(p2 - p1, p2 - p3) / denom2
+            gamma = dist_sq(p1, p2) * dot(p3 - p1, p3 - p2) / denom2
+        finally:
+            numpy.seterr(**old_settings)
+        middles = p1 * alpha[:, numpy.newaxis] \
+                + p2 * beta[:, numpy.newaxis] + p3 * gamma[:, numpy.newaxis]
+        self._bounds = numpy.concatenate((self._bounds[:start], bounds))
+        self._radii = numpy.concatenate((self._radii[:start], radii))
+        self._middles = numpy.concatenate((self._middles[:start], middles))
+        if start == 0:
+            # all triangles were changed
+            self._triangle_views = {}
+            self._t_index = None
+            self._z_index = None
+        self._update_limits_from_arrays(start=start)
+        self._dirty = True
+
+    def _update_limits_from_arrays(self, start=0):
+        if len(self._faces) == 0:
+            self.minx = self.miny = self.minz = None
+            self.maxx = self.maxy = self.maxz = None
+        elif (start > 0) and not self.minx is None:
+            # only the new triangles can extend the current limits
+            bounds = self._bounds[start:]
+            if len(bounds) > 0:
+                self.minx, self.miny, self.minz = [float(value) for value in
+                        numpy.minimum(bounds[:, :3].min(axis=0),
+                            (self.minx, self.miny, self.minz))]
+                self.maxx, self.maxy, self.maxz = [float(value) for value in
+                        numpy.maximum(bounds[:, 3:].max(axis=0),
+                            (self.maxx, self.maxy, self.maxz))]
+        else:
+            self.minx, self.miny, self.minz = [float(value)
+                    for value in self._bounds[:, :3].min(axis=0)]
+            self.maxx, self.maxy, self.maxz = [float(value)
+                    for value in self._bounds[:, 3:].max(axis=0)]
+
+    def _get_array(name):
+        def get_array(self):
+            self._merge_pending_triangles()
+            return getattr(self, name)
+        return property(get_array)
+
+    vertices = _get_array("_vertices")
+    faces = _get_array("_faces")
+    normals = _get_array("_normals")
+    bounds = _get_array("_bounds")
+    middles = _get_array("_middles")
+    radii = _get_array("_radii")
+    del _get_array
+
+    def get_triangle_points(self):
+        """ Returns an array (faces x 3 x 3) containing the three vertices of
+        each triangle.
+        """
+        return self.vertices[self.faces]
+
+    def get_triangle(self, index):
+        """ return a Triangle object for a face of the mesh """
+        self._merge_pending_triangles()
+        if not index in self._triangle_views:
+            p1, p2, p3 = [tuple([float(value) for value in point])
+                    for point in self._vertices[self._faces[index]]]
+            normal = tuple([float(value) for value in self._normals[index]])
+            self._triangle_views[index] = Triangle(p1, p2, p3, normal)
+        return self._triangle_views[index]
+
+    def _get_triangle_bounds(self, start=0):
+        return self.bounds[start:]
+
+    def _get_triangle_data(self, start=0):
+        self._merge_pending_triangles()
+        return numpy.concatenate((self._vertices[self._faces[start:]].reshape(
+                (-1, 9)), self._normals[start:]), axis=1)
+
+    def _get_triangles_by_index(self, indices):
+        return [self.get_triangle(index) for index in indices]
+
+    def get_sub_model(self, minx=-INFINITE, miny=-INFINITE, minz=-INFINITE,
+            maxx=+INFINITE, maxy=+INFINITE, maxz=+INFINITE):
+        indices = self.get_triangle_indices(minx, miny, minz, maxx, maxy,
+                maxz)
+        # keep only the vertices used by the selected faces
+        used_vertices, faces = numpy.unique(self._faces[indices],
+                return_inverse=True)
+        return self.__class__(self._vertices[used_vertices],
+                faces.reshape((-1, 3)), normals=self._normals[indices],
+                use_kdtree=self._use_kdtree)
+
+    def triangles(self, minx=-INFINITE, miny=-INFINITE, minz=-INFINITE,
+            maxx=+INFINITE, maxy=+INFINITE, maxz=+INFINITE):
+        return self._get_triangles_by_index(self.get_triangle_indices(minx,
+                miny, minz, maxx, maxy, maxz))
+
+    def transform_by_matrix(self, matrix, transformed_list=None,
+            callback=None):
+        self._merge_pending_triangles()
+        # accept 3x4 matrices as well as 3x3 matrices (see
+        # ptransform_by_matrix)
+        rotation = numpy.array([column[:3] for column in matrix[:3]],
+                dtype=numpy.float64)
+        offsets = numpy.array([(column[3] if len(column) > 3 else 0)
+                for column in matrix[:3]], dtype=numpy.float64)
+        self._vertices = numpy.dot(self._vertices, rotation.T) + offsets
+        # normals are vectors - they are not shifted
+        self._normals = numpy.dot(self._normals, rotation.T)
+        if callback:
+            callback()
+        self.reset_cache()
+
+    def reset_cache(self):
+        self._update_triangle_data()
+        self._reset_content_hash()
+        self._update_caches()
+
 
 class ContourModel(BaseModel):
 
@@ -367,6 +856,12 @@ class ContourModel(BaseModel):
         self._plane_groups = [self._plane]
         self._item_groups.append(self._plane_groups)
         self._cached_offset_models = {}
+        # The open line groups are indexed by the keys of their end points.
+        # The serial numbers reflect the order of the line groups.
+        self._endpoint_index = None
+        self._group_keys = {}
+        self._group_serials = {}
+        self._next_group_serial = 0
         self._export_function = \
                 pycam.Exporters.SVGExporter.SVGExporterContourModel
 
@@ -386,6 +881,73 @@ class ContourModel(BaseModel):
         super(ContourModel, self).reset_cache()
         # reset the offset model cache
         self._cached_offset_models = {}
+        # the points of the line groups may have changed
+        self._endpoint_index = None
+
+    def _get_point_key(self, point):
+        """ Equal points always share the same key. """
+        return tuple([int(round(value / epsilon)) for value in point[:3]])
+
+    def _get_endpoint_index(self):
+        if self._endpoint_index is None:
+            self._endpoint_index = {}
+            self._group_keys = {}
+            self._group_serials = {}
+            for line_group in self._line_groups:
+                self._add_to_endpoint_index(line_group)
+        return self._endpoint_index
+
+    def _add_to_endpoint_index(self, line_group):
+        self._group_serials[id(line_group)] = self._next_group_serial
+        self._next_group_serial += 1
+        self._group_keys[id(line_group)] = ()
+        self._update_endpoint_index(line_group)
+
+    def _update_endpoint_index(self, line_group):
+        """ register the current end points of a line group """
+        index = self._get_endpoint_index()
+        for key in self._group_keys[id(line_group)]:
+            index[key].remove(line_group)
+            if not index[key]:
+                del index[key]
+        if line_group.is_closed:
+            keys = ()
+        elif len(line_group) == 0:
+            # empty line groups are connectable with any line
+            keys = (None,)
+        else:
+            points = line_group.get_end_points()
+            keys = set([self._get_point_key(point) for point in points])
+        for key in keys:
+            index.setdefault(key, []).append(line_group)
+        self._group_keys[id(line_group)] = keys
+
+    def _add_line_group(self, line_group):
+        self._get_endpoint_index()
+        self._line_groups.append(line_group)
+        self._add_to_endpoint_index(line_group)
+
+    def _remove_line_group(self, line_group):
+        index = self._get_endpoint_index()
+        self._line_groups.remove(line_group)
+        for key in self._group_keys.pop(id(line_group)):
+            index[key].remove(line_group)
+            if not index[key]:
+                del index[key]
+        del self._group_serials[id(line_group)]
+
+    def _get_line_groups_at_points(self, points):
+        """ Returns the open line groups with an end point matching one of
+        the given points - in the order of the model.
+        """
+        index = self._get_endpoint_index()
+        result = {}
+        keys = [self._get_point_key(point) for point in points] + [None]
+        for key in keys:
+            for line_group in index.get(key, ()):
+                result[id(line_group)] = line_group
+        return sorted(result.values(),
+                key=lambda line_group: self._group_serials[id(line_group)])
 
     def _merge_polygon_if_possible(self, other_polygon, allow_reverse=False):
         """ Check if the given 'other_polygon' can be connected to another
@@ -393,14 +955,20 @@ class ContourModel(BaseModel):
         This function should be called after any "append" event, if the lines to
         be added are given in a random order (e.g. by the "waterline" function).
         """
+        try:
+            self._merge_polygon_with_connectables(other_polygon,
+                    allow_reverse=allow_reverse)
+        finally:
+            self._update_endpoint_index(other_polygon)
+
+    def _merge_polygon_with_connectables(self, other_polygon,
+            allow_reverse=False):
         if other_polygon.is_closed:
             return
-        connectors = []
-        connectors.append(other_polygon.get_points()[0])
-        connectors.append(other_polygon.get_points()[-1])
+        connectors = other_polygon.get_end_points()
         # filter all polygons that can be combined with 'other_polygon'
         connectables = []
-        for lg in self._line_groups:
+        for lg in self._get_line_groups_at_points(connectors):
             if lg is other_polygon:
                 continue
             for connector in connectors:
@@ -421,7 +989,7 @@ class ContourModel(BaseModel):
                     if other_polygon.is_closed:
                         return
                     other_polygon.append(line)
-                self._line_groups.remove(polygon)
+                self._remove_line_group(polygon)
             elif other_polygon.get_points()[0] == polygon.get_points()[-1]:
                 lines = polygon.get_lines()
                 lines.reverse()
@@ -429,7 +997,7 @@ class ContourModel(BaseModel):
                     if other_polygon.is_closed:
                         return
                     other_polygon.append(line)
-                self._line_groups.remove(polygon)
+                self._remove_line_group(polygon)
             elif allow_reverse:
                 if other_polygon.get_points()[-1] == polygon.get_points()[-1]:
                     polygon.reverse_direction()
@@ -437,7 +1005,7 @@ class ContourModel(BaseModel):
                         if other_polygon.is_closed:
                             return
                         other_polygon.append(line)
-                    self._line_groups.remove(polygon)
+                    self._remove_line_group(polygon)
                 elif other_polygon.get_points()[0] == polygon.get_points()[0]:
                     polygon.reverse_direction()
                     lines = polygon.get_lines()
@@ -446,7 +1014,7 @@ class ContourModel(BaseModel):
                         if other_polygon.is_closed:
                             return
                         other_polygon.append(line)
-                    self._line_groups.remove(polygon)
+                    self._remove_line_group(polygon)
                 else:
                     pass
             else:
@@ -464,9 +1032,9 @@ class ContourModel(BaseModel):
             found = False
             # Going back from the end to start. The last line_group always has
             # the highest chance of being suitable for the next line.
-            line_group_indexes = xrange(len(self._line_groups) - 1, -1, -1)
-            for line_group_index in line_group_indexes:
-                line_group = self._line_groups[line_group_index]
+            line_groups = self._get_line_groups_at_points((item.p1, item.p2))
+            line_groups.reverse()
+            for line_group in line_groups:
                 for candidate in item_list:
                     if line_group.is_connectable(candidate):
                         line_group.append(candidate)
@@ -480,58 +1048,39 @@ class ContourModel(BaseModel):
                 # add a single line as part of a new group
                 new_line_group = Polygon(plane=self._plane)
                 new_line_group.append(item)
-                self._line_groups.append(new_line_group)
+                self._add_line_group(new_line_group)
         elif isinstance(item, Polygon):
             if not unify_overlaps or (len(self._line_groups) == 0):
-                self._line_groups.append(item)
+                self._add_line_group(item)
+                for subitem in item.next():
+                    self._update_limits(subitem)
+            elif not is_polygon_supported(item):
+                # only closed horizontal polygons can be combined
+                self._add_line_group(item)
                 for subitem in item.next():
                     self._update_limits(subitem)
             else:
-                # go through all polygons and check if they can be combined
+                # Unite the new polygon with all polygons of the same
+                # direction. Inner polygons are handled as areas, too.
                 is_outer = item.is_outer()
-                new_queue = [item]
-                processed_polygons = []
-                queue = self.get_polygons()
-                while len(queue) > 0:
-                    polygon = queue.pop()
-                    if polygon.is_outer() != is_outer:
-                        processed_polygons.append(polygon)
+                areas = []
+                others = []
+                for polygon in self._line_groups + [item]:
+                    if (polygon.is_outer() == is_outer) \
+                            and is_polygon_supported(polygon):
+                        if not is_outer:
+                            polygon = polygon.copy()
+                            polygon.reverse_direction()
+                        areas.append(polygon)
                     else:
-                        processed = []
-                        while len(new_queue) > 0:
-                            new = new_queue.pop()
-                            if new.is_polygon_inside(polygon):
-                                # "polygon" is obsoleted by "new"
-                                processed.extend(new_queue)
-                                break
-                            elif polygon.is_polygon_inside(new):
-                                # "new" is obsoleted by "polygon"
-                                continue
-                            elif not new.is_overlap(polygon):
-                                processed.append(new)
-                                continue
-                            else:
-                                union = polygon.union(new)
-                                if union:
-                                    for p in union:
-                                        if p.is_outer() == is_outer:
-                                            new_queue.append(p)
-                                        else:
-                                            processed_polygons.append(p)
-                                else:
-                                    processed.append(new)
-                                break
-                        else:
-                            processed_polygons.append(polygon)
-                        new_queue = processed
+                        others.append(polygon)
+                united = get_union_polygons(areas)
+                if not is_outer:
+                    for polygon in united:
+                        polygon.reverse_direction()
                 while len(self._line_groups) > 0:
                     self._line_groups.pop()
-                print "Processed polygons: %s" % str([len(p.get_lines())
-                        for p in processed_polygons])
-                print "New queue: %s" % str([len(p.get_lines())
-                        for p in new_queue])
-                for processed_polygon in processed_polygons + new_queue:
-                    self._line_groups.append(processed_polygon)
+                self._line_groups.extend(others + united)
                 # TODO: this is quite expensive - can we do it differently?
                 self.reset_cache()
         else:
@@ -569,7 +1118,7 @@ class ContourModel(BaseModel):
             progress_callback = None
         # try to connect all open polygons
         for poly in open_polygons:
-            self._line_groups.remove(poly)
+            self._remove_line_group(poly)
         poly_open_before = len(open_polygons)
         for poly in open_polygons:
             for line in poly.get_lines():
@@ -686,8 +1235,22 @@ class ContourModel(BaseModel):
         return result
 
     def get_offset_model(self, offset, callback=None):
+        """ Shift all polygons of the model. Closed polygons in horizontal
+        planes are combined: overlapping results are united and holes are
+        respected (see pycam.Geometry.PolygonOffset).
+        """
         result = ContourModel(plane=self._plane)
+        combined = [group for group in self.get_polygons()
+                if is_offset_supported(group)]
+        if combined:
+            new_groups = get_offset_polygons(combined, offset,
+                    callback=callback)
+            if new_groups is None:
+                return None
+            result.extend(new_groups)
         for group in self.get_polygons():
+            if is_offset_supported(group):
+                continue
             new_groups = group.get_offset_polygons(offset, callback=callback)
             result.extend(new_groups)
             if callback and callback():
@@ -709,43 +1272,53 @@ class ContourModel(BaseModel):
         interrupted the operation).
         Otherwise it returns False if no intersections were found.
         """
-        def check_bounds_of_groups(g1, g2):
-            if (g1.minx <= g2.minx <= g1.maxx) \
-                    or (g1.minx <= g2.maxx <= g1.maxx) \
-                    or (g2.minx <= g1.minx <= g2.maxx) \
-                    or (g2.minx <= g1.maxx <= g2.maxx):
-                # the x boundaries overlap
-                if (g1.miny <= g2.miny <= g1.maxy) \
-                        or (g1.miny <= g2.maxy <= g1.maxy) \
-                        or (g2.miny <= g1.miny <= g2.maxy) \
-                        or (g2.miny <= g1.maxy <= g2.maxy):
-                    # also the y boundaries overlap
-                    if (g1.minz <= g2.minz <= g1.maxz) \
-                            or (g1.minz <= g2.maxz <= g1.maxz) \
-                            or (g2.minz <= g1.minz <= g2.maxz) \
-                            or (g2.minz <= g1.maxz <= g2.maxz):
-                        # z overlaps as well
-                        return True
-            return False
-        # check each pair of line groups for intersections
+        lines = []
+        line_groups = []
+        for index, group in enumerate(self._line_groups):
+            for line in group.get_lines():
+                lines.append(line)
+                line_groups.append(index)
+        if lines:
+            points = numpy.array([(line.p1[:3], line.p2[:3])
+                    for line in lines], dtype=numpy.float64)
+            # "get_intersection" tolerates small deviations
+            lengths = numpy.sqrt(((points[:, 1] - points[:, 0]) ** 2).sum(
+                    axis=1))
+            margins = numpy.maximum(lengths, 1)[:, numpy.newaxis] * epsilon
+            first, second = get_overlapping_pairs(
+                    points.min(axis=1) - margins, points.max(axis=1) + margins)
+            line_groups = numpy.array(line_groups)
+            group1, group2 = line_groups[first], line_groups[second]
+            # only lines of different groups with overlapping bounds collide
+            group_mins = numpy.array([(group.minx, group.miny, group.minz)
+                    for group in self._line_groups], dtype=numpy.float64)
+            group_maxs = numpy.array([(group.maxx, group.maxy, group.maxz)
+                    for group in self._line_groups], dtype=numpy.float64)
+            valid = (group1 != group2) \
+                    & (group_mins[group1] <= group_maxs[group2]).all(axis=1) \
+                    & (group_mins[group2] <= group_maxs[group1]).all(axis=1)
+            first, second = first[valid], second[valid]
+            group1, group2 = group1[valid], group2[valid]
+            # check the pairs in the order of the groups and their lines
+            order = numpy.lexsort((second, first, group2, group1))
+            group1 = group1[order]
+            pairs = zip(group2[order], first[order], second[order])
+            bounds = group1.searchsorted(numpy.arange(len(self._line_groups)))
+        else:
+            pairs = []
+            bounds = numpy.zeros(len(self._line_groups), dtype=numpy.intp)
         intersections = []
-        for index1, group1 in enumerate(self._line_groups[:-1]):
-            for index2, group2 in enumerate(self._line_groups):
-                if index2 <= index1:
-                    # avoid double-checks
-                    continue
-                # check if both groups overlap - otherwise skip this pair
-                if check_bounds_of_groups(group1, group2):
-                    # check each pair of lines for intersections
-                    for line1 in group1.get_lines():
-                        for line2 in group2.get_lines():
-                            intersection, factor = line1.get_intersection(line2)
-                            if intersection:
-                                if find_all_collisions:
-                                    intersections.append((index1, index2))
-                                else:
-                                    # return just the place of intersection
-                                    return intersection
+        for index1 in range(len(self._line_groups) - 1):
+            for index2, line1, line2 in pairs[bounds[index1]:
+                    bounds[index1 + 1]]:
+                intersection, factor = lines[line1].get_intersection(
+                        lines[line2])
+                if intersection:
+                    if find_all_collisions:
+                        intersections.append((index1, int(index2)))
+                    else:
+                        # return just the place of intersection
+                        return intersection
             # update the progress visualization and quit if requested
             if callback and callback():
                 if find_all_collisions:
@@ -776,13 +1349,17 @@ class ContourModel(BaseModel):
                     children.append(poly)
                     break
         model = Model()
-        for poly, children in outer_polygons:
-            if callback and callback():
-                return None
-            group = PolygonGroup(poly, children, callback=callback)
-            new_model = group.extrude(func=func, stepping=stepping)
-            if new_model:
-                model += new_model
+        model.begin_bulk_update()
+        try:
+            for poly, children in outer_polygons:
+                if callback and callback():
+                    return None
+                group = PolygonGroup(poly, children, callback=callback)
+                new_model = group.extrude(func=func, stepping=stepping)
+                if new_model:
+                    model += new_model
+        finally:
+            model.end_bulk_update()
         return model
 
     def get_flat_projection(self, plane):
@@ -30,7 +30,7 @@ from pycam.Geometry.PointUtils import *
 
 class Plane(IDGenerator, TransformableContainer):
 
-    __slots__ = ["id", "p", "n"]
+    __slots__ = ["id", "p", "n", "_offset"]
 
     def __init__(self, point, normal=None):
         super(Plane, self).__init__()
@@ -40,6 +40,8 @@ class Plane(IDGenerator, TransformableContainer):
         self.n = normal
         if not len(self.n) > 3:
             self.n = (self.n[0], self.n[1], self.n[2], 'v')
+        # the distance of the plane from the origin (along the normal)
+        self._offset = None
 
     def __repr__(self):
         return "Plane<%s,%s>" % (self.p, self.n)
@@ -69,6 +71,7 @@ class Plane(IDGenerator, TransformableContainer):
         norm = pnormalized(self.n)
         if norm:
             self.n = norm
+        self._offset = None
 
     def intersect_point(self, direction, point):
         if (not direction is None) and (pnorm(direction) != 1):
@@ -79,7 +82,9 @@ class Plane(IDGenerator, TransformableContainer):
         denom = pdot(self.n, direction)
         if denom == 0:
             return (None, INFINITE)
-        l = -(pdot(self.n, point) - pdot(self.n, self.p)) / denom
+        if self._offset is None:
+            self._offset = pdot(self.n, self.p)
+        l = -(pdot(self.n, point) - self._offset) / denom
         cp = padd(point, pmul(direction, l))
         return (cp, l)
 
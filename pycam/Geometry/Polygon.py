@@ -228,6 +228,7 @@ class Polygon(TransformableContainer):
         self.minz = None
         self._lines_cache = None
         self._area_cache = None
+        self._prepared_cache = None
         self._cached_offset_polygons = {}
 
     def copy(self):
@@ -261,7 +262,7 @@ class Polygon(TransformableContainer):
                 else:
                     self.is_closed = True
                 # take care that the line_cache is flushed
-                self.reset_cache()
+                self._reset_shape_cache()
             else:
                 # the new Line can be added to the beginning of the polygon
                 if (len(self._points) > 1) and (line.dir == pnormalized(psub(self._points[1], self._points[0]))):
@@ -273,7 +274,7 @@ class Polygon(TransformableContainer):
                 else:
                     self.is_closed = True
                 # take care that the line_cache is flushed
-                self.reset_cache()
+                self._reset_shape_cache()
 
     def __len__(self):
         return len(self._points)
@@ -445,10 +446,16 @@ class Polygon(TransformableContainer):
                 (self.miny > polygon.maxy) or (self.maxy < polygon.miny) or \
                 (self.minz > polygon.maxz) or (self.maxz < polygon.minz):
             return False
-        for point in polygon._points:
-            if not self.is_point_inside(point):
-                return False
-        return True
+        # all points are within the boundary of this polygon
+        if not (pis_inside((polygon.minx, polygon.miny, polygon.minz),
+                    self.minx, self.maxx, self.miny, self.maxy, self.minz,
+                    self.maxz)
+                and pis_inside((polygon.maxx, polygon.maxy, polygon.maxz),
+                    self.minx, self.maxx, self.miny, self.maxy, self.minz,
+                    self.maxz)):
+            return False
+        return bool(self._get_prepared().get_points_inside(
+                polygon._points).all())
 
     def is_point_on_outline(self, p):
         for line in self.get_lines():
@@ -466,46 +473,17 @@ class Polygon(TransformableContainer):
         if not pis_inside(p, self.minx, self.maxx, self.miny, self.maxy, self.minz, self.maxz):
             # the point is outside the rectangle boundary
             return False
-        # see http://www.alienryderflex.com/polygon/
-        # Count the number of intersections of a ray along the x axis through
-        # all polygon lines.
-        # Odd number -> point is inside
-        intersection_count_left = 0
-        intersection_count_right = 0
-        for index in range(len(self._points)):
-            p1 = self._points[index]
-            p2 = self._points[(index + 1) % len(self._points)]
-            # Only count intersections with lines that are partly below
-            # the y level of the point. This solves the problem of intersections
-            # through shared vertices or lines that go along the y level of the
-            # point.
-            if ((p1[1] < p[1]) and (p[1] <= p2[1])) \
-                    or ((p2[1] < p[1]) and (p[1] <= p1[1])):
-                part_y = (p[1] - p1[1]) / (p2[1] - p1[1])
-                intersection_x = p1[0] + part_y * (p2[0] - p1[0])
-                if intersection_x < p[0] + epsilon:
-                    # count intersections to the left
-                    intersection_count_left += 1
-                if intersection_x > p[0] - epsilon:
-                    # count intersections to the right
-                    intersection_count_right += 1
-        # odd intersection count -> inside
-        left_odd = intersection_count_left % 2 == 1
-        right_odd = intersection_count_right % 2 == 1
-        if left_odd and right_odd:
-            # clear decision: we are inside
-            return True
-        elif not left_odd and not right_odd:
-            # clear decision: we are outside
-            return False
-        else:
-            # it seems like we are on the line -> inside
-            log.debug("polygon.is_point_inside: unclear decision")
-            return True
+        return self._get_prepared().is_point_inside(p)
 
     def get_points(self):
         return self._points[:]
 
+    def get_end_points(self):
+        """ Returns the first and the last point (without copying all
+        points).
+        """
+        return (self._points[0], self._points[-1])
+
     def get_lines(self):
         """ Caching is necessary to avoid constant recalculation due to
         the "to_OpenGL" method.
@@ -563,11 +541,31 @@ class Polygon(TransformableContainer):
             self.maxz = max(self.maxz, point[2])
         self._lines_cache = None
         self._area_cache = None
+        self._prepared_cache = None
 
-    def reset_cache(self):
+    def _reset_shape_cache(self):
+        """ Flush the data derived from the points. The limits are kept:
+        "append" only adds points or removes points between two neighbours
+        on a straight line.
+        """
         self._cached_offset_polygons = {}
         self._lines_cache = None
         self._area_cache = None
+        self._prepared_cache = None
+
+    def _get_prepared(self):
+        """ Returns the polygon prepared for point and line queries (see
+        "PreparedPolygons").
+        """
+        if self._prepared_cache is None:
+            # don't import earlier to avoid circular imports
+            from pycam.Geometry.PolygonBoolean import PreparedPolygons
+            self._prepared_cache = PreparedPolygons([self],
+                    use_direction=False)
+        return self._prepared_cache
+
+    def reset_cache(self):
+        self._reset_shape_cache()
         self.minx, self.miny, self.minz = None, None, None
         self.maxx, self.maxy, self.maxz = None, None, None
         # update the limit for each line
@@ -952,6 +950,17 @@ class Polygon(TransformableContainer):
         offset = number(offset)
         if offset == 0:
             return [self]
+        # import here to avoid circular imports
+        from pycam.Geometry.PolygonOffset import is_offset_supported, \
+                get_offset_polygons
+        if is_offset_supported(self):
+            result = get_offset_polygons([self], offset, callback=callback)
+            if result is None:
+                return None
+            # Growing a polygon may enclose holes (e.g. by closing the gap of
+            # a "C"). These are ignored.
+            return [polygon for polygon in result
+                    if polygon.is_outer() == self.is_outer()]
         if self.is_outer():
             inside_shifting = max(0, -offset)
         else:
@@ -1219,8 +1228,10 @@ class Polygon(TransformableContainer):
                     new_line = cropped_line
             # add the new line to one of the line groups
             if not new_line is None:
-                # try to find a suitable line group
-                for new_group in new_groups:
+                # The lines are processed in order. Thus only the latest group
+                # (continuation) and the first group (end of a closed polygon)
+                # are suitable.
+                for new_group in new_groups[-1:] + new_groups[:1]:
                     try:
                         new_group.append(new_line)
                         break
@@ -1264,68 +1275,36 @@ class Polygon(TransformableContainer):
         return False
 
     def union(self, other):
-        """ This "union" of two polygons only works for polygons without
-        shared edges. TODO: fix the issues of shared edges!
+        """ Returns the polygons describing the area covered by both
+        polygons. The direction of this polygon is used for the result.
+        Only closed horizontal polygons are combined.
         """
         # don't import earlier to avoid circular imports
-        from pycam.Geometry.Model import ContourModel
-        # check if one of the polygons is completely inside of the other
-        if self.is_polygon_inside(other):
-            return [self]
-        if other.is_polygon_inside(self):
-            return [other]
-        # check if there is any overlap at all
-        if not self.is_overlap(other):
+        from pycam.Geometry.PolygonBoolean import is_polygon_supported, \
+                get_union_polygons
+        if not (is_polygon_supported(self) and is_polygon_supported(other)):
             # no changes
             return [self, other]
-        contour = ContourModel(self.plane)
-        def get_outside_lines(poly1, poly2):
-            result = []
-            for line in poly1.get_lines():
-                collisions = []
-                for o_line in poly2.get_lines():
-                    cp, dist = o_line.get_intersection(line)
-                    if (not cp is None) and (0 < dist < 1):
-                        collisions.append((cp, dist))
-                # sort the collisions according to the distance
-                collisions.append((line.p1, 0))
-                collisions.append((line.p2, 1))
-                collisions.sort(key=lambda (cp, dist): dist)
-                for index in range(len(collisions) - 1):
-                    p1 = collisions[index][0]
-                    p2 = collisions[index + 1][0]
-                    if pdist(p1, p2) < epsilon:
-                        # ignore zero-length lines
-                        continue
-                    # Use the middle between p1 and p2 to check the
-                    # inner/outer state.
-                    p_middle = pdiv(padd(p1, p2), 2)
-                    p_inside = poly2.is_point_inside(p_middle) \
-                            and not poly2.is_point_on_outline(p_middle)
-                    if not p_inside:
-                        result.append(Line(p1, p2))
-            return result
-        outside_lines = []
-        outside_lines.extend(get_outside_lines(self, other))
-        outside_lines.extend(get_outside_lines(other, self))
-        for line in outside_lines:
-            contour.append(line)
-        # fix potential overlapping at the beginning and end of each polygon
-        result = []
-        for poly in contour.get_polygons():
-            if not poly.is_closed:
-                lines = poly.get_lines()
-                line1 = lines[-1]
-                line2 = lines[0]
-                if (line1.dir == line2.dir) \
-                        and (line1.is_point_inside(line2.p1)):
-                    # remove the last point and define the polygon as closed
-                    poly._points.pop(-1)
-                    poly.is_closed = True
-            result.append(poly)
+        areas = []
+        for polygon in (self, other):
+            if not polygon.is_outer():
+                polygon = polygon.copy()
+                polygon.reverse_direction()
+            areas.append(polygon)
+        result = get_union_polygons(areas)
+        if not self.is_outer():
+            for polygon in result:
+                polygon.reverse_direction()
         return result
 
     def split_line(self, line):
+        """ Returns the parts of the line inside and outside of the polygon
+        (two lists of lines).
+        """
+        # don't import earlier to avoid circular imports
+        from pycam.Geometry.PolygonBoolean import is_polygon_supported
+        if is_polygon_supported(self):
+            return self._get_prepared().split_lines([line])[0]
         outer = []
         inner = []
         # project the line onto the polygon's plane
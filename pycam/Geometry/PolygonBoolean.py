@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pycam.Geometry.BVH import IntervalIndex, GridIndex, \
+        get_overlapping_pairs
+from pycam.Geometry.Line import Line
+from pycam.Geometry.Polygon import Polygon
+from pycam.Geometry.utils import epsilon
+import pycam.Utils.log
+import numpy
+
+log = pycam.Utils.log.get_logger()
+
+
+# All calculated points are rounded to multiples of this distance. Thus the
+# end points of adjacent parts are equal.
+SNAP_DISTANCE = 1e-9
+# the side of a part of the outline is tested at this distance
+WINDING_TEST_DISTANCE = 1e-7
+
+# the area of the result (based on the areas of the two operands)
+OPERATIONS = {
+        "union": lambda inside1, inside2: inside1 | inside2,
+        "intersection": lambda inside1, inside2: inside1 & inside2,
+        "difference": lambda inside1, inside2: inside1 & ~inside2,
+        "xor": lambda inside1, inside2: inside1 ^ inside2,
+}
+
+
+def is_polygon_supported(polygon):
+    """ Only closed polygons in horizontal planes can be processed. """
+    normal = polygon.plane.n
+    return polygon.is_closed and (len(polygon) > 2) \
+            and (normal[0] == normal[1] == 0) and (normal[2] != 0)
+
+def get_union_polygons(polygons1, polygons2=None, callback=None):
+    return get_boolean_polygons(polygons1, polygons2 or [], "union",
+            callback=callback)
+
+def get_intersection_polygons(polygons1, polygons2, callback=None):
+    return get_boolean_polygons(polygons1, polygons2, "intersection",
+            callback=callback)
+
+def get_difference_polygons(polygons1, polygons2, callback=None):
+    return get_boolean_polygons(polygons1, polygons2, "difference",
+            callback=callback)
+
+def get_xor_polygons(polygons1, polygons2, callback=None):
+    return get_boolean_polygons(polygons1, polygons2, "xor",
+            callback=callback)
+
+def get_boolean_polygons(polygons1, polygons2, operation, callback=None):
+    """ Combine the areas described by two lists of polygons.
+
+    Outer polygons (positive area) surround material, inner polygons
+    (negative area) are holes. Overlapping polygons of the same list are
+    united. The polygons are grouped by their height - polygons on different
+    levels are never combined.
+    @value polygons1: closed polygons (see "is_polygon_supported")
+    @value polygons2: closed polygons (see "is_polygon_supported")
+    @value operation: one of "union", "intersection", "difference" and "xor"
+    @value callback: function to call after each step. It should return
+        True if the user interrupted the operation.
+    @returns: the new polygons or None (if the operation was interrupted)
+    """
+    if not operation in OPERATIONS:
+        raise ValueError("Invalid boolean operation: %s" % str(operation))
+    groups = {}
+    for index, polygons in enumerate((polygons1, polygons2)):
+        for z, plane, rings in get_rings(polygons):
+            groups.setdefault(z, [plane, [], []])[index + 1].extend(rings)
+    result = []
+    for z, (plane, rings1, rings2) in sorted(groups.items()):
+        loops = get_boolean_loops(rings1, rings2, operation,
+                callback=callback)
+        if loops is None:
+            return None
+        result.extend(get_polygons_from_loops(loops, z, plane))
+    return result
+
+def get_rings(polygons):
+    """ Group the polygons by their height. Returns a list of tuples (z,
+    plane, rings) - each ring is an array (points x 2) of x/y coordinates.
+    The y axis is mirrored for planes pointing downwards. Thus outer
+    polygons are always counter-clockwise.
+    """
+    groups = {}
+    for polygon in polygons:
+        groups.setdefault(polygon.get_points()[0][2], []).append(polygon)
+    result = []
+    for z, group in sorted(groups.items()):
+        plane = group[0].plane
+        mirror = 1 if plane.n[2] > 0 else -1
+        rings = []
+        for polygon in group:
+            ring = numpy.array([point[:2] for point in polygon.get_points()],
+                    dtype=numpy.float64)
+            if polygon.plane.n[2] * mirror < 0:
+                ring = ring[::-1]
+            ring[:, 1] *= mirror
+            rings.append(ring)
+        result.append((z, plane, rings))
+    return result
+
+def get_polygons_from_loops(loops, z, plane):
+    """ Turn loops (see "get_rings") into polygons at the given height. """
+    mirror = 1 if plane.n[2] > 0 else -1
+    result = []
+    for loop in loops:
+        polygon = Polygon(plane=plane)
+        points = [(x, mirror * y, z) for x, y in loop]
+        for index in range(len(points)):
+            polygon.append(Line(points[index - 1], points[index]))
+        result.append(polygon)
+    return result
+
+def snap(values):
+    return numpy.round(values / SNAP_DISTANCE) * SNAP_DISTANCE
+
+def get_ring_segments(rings):
+    """ Returns the edges (array: segments x 2 x 2) of the rings. """
+    if not rings:
+        return numpy.zeros((0, 2, 2))
+    return numpy.concatenate([numpy.concatenate((ring[:, numpy.newaxis],
+            numpy.roll(ring, -1, axis=0)[:, numpy.newaxis]), axis=1)
+            for ring in rings])
+
+def get_outside_winding(rings):
+    """ The material reaches infinity, if the outermost ring is a hole. """
+    if not rings:
+        return 0
+    outermost = rings[numpy.argmin([ring[:, 0].min() for ring in rings])]
+    area = (outermost[:, 0] * numpy.roll(outermost[:, 1], -1)
+            - numpy.roll(outermost[:, 0], -1) * outermost[:, 1]).sum()
+    return 1 if area < 0 else 0
+
+def get_split_segments(segments):
+    """ Split the segments (array: segments x 2 x 2) at their intersections.
+    Returns the pieces (array: pieces x 2 x 2).
+    """
+    tolerance = 1e-9
+    mins = segments.min(axis=1) - tolerance
+    maxs = segments.max(axis=1) + tolerance
+    first, second = get_overlapping_pairs(mins, maxs)
+    cross = lambda a, b: a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+    start1, start2 = segments[first, 0], segments[second, 0]
+    dir1 = segments[first, 1] - start1
+    dir2 = segments[second, 1] - start2
+    denominator = cross(dir1, dir2)
+    old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+    try:
+        factor1 = cross(start2 - start1, dir2) / denominator
+        factor2 = cross(start2 - start1, dir1) / denominator
+        crossing = (abs(denominator) > 1e-12) & (factor1 >= -tolerance) \
+                & (factor1 <= 1 + tolerance) & (factor2 >= -tolerance) \
+                & (factor2 <= 1 + tolerance)
+    finally:
+        numpy.seterr(**old_settings)
+    # both segments are split at the same point
+    split_points = start1[crossing] + factor1[crossing, numpy.newaxis] \
+            * dir1[crossing]
+    split_segments = [first[crossing], second[crossing]]
+    split_factors = [factor1[crossing], factor2[crossing]]
+    split_positions = [split_points, split_points]
+    # collinear segments: split at the end points of the other segment
+    collinear = (abs(denominator) <= 1e-12) \
+            & (abs(cross(start2 - start1, dir1)) <= 1e-12)
+    for this, other in ((first, second), (second, first)):
+        this, other = this[collinear], other[collinear]
+        start, direction = segments[this, 0], segments[this, 1] \
+                - segments[this, 0]
+        length_sq = (direction ** 2).sum(axis=1)
+        for end in (0, 1):
+            points = segments[other, end]
+            factors = ((points - start) * direction).sum(axis=1) / length_sq
+            split_segments.append(this)
+            split_factors.append(factors)
+            split_positions.append(points)
+    # the end points of the segments complete the list of splits
+    count = len(segments)
+    split_segments.extend([numpy.arange(count), numpy.arange(count)])
+    split_factors.extend([numpy.zeros(count), numpy.ones(count)])
+    split_positions.extend([segments[:, 0], segments[:, 1]])
+    split_segments = numpy.concatenate(split_segments)
+    split_factors = numpy.concatenate(split_factors)
+    split_positions = snap(numpy.concatenate(split_positions))
+    inside = (split_factors > 0) & (split_factors < 1)
+    inside[-2 * count:] = True
+    split_segments = split_segments[inside]
+    split_factors = split_factors[inside]
+    split_positions = split_positions[inside]
+    order = numpy.lexsort((split_factors, split_segments))
+    split_segments = split_segments[order]
+    split_positions = split_positions[order]
+    # connect subsequent splits of the same segment
+    valid = split_segments[:-1] == split_segments[1:]
+    pieces = numpy.concatenate((split_positions[:-1, numpy.newaxis],
+            split_positions[1:, numpy.newaxis]), axis=1)[valid]
+    non_empty = (pieces[:, 0] != pieces[:, 1]).any(axis=1)
+    return pieces[non_empty]
+
+def get_winding_numbers(points, segments):
+    """ Count the segments crossing a ray from each point in the direction
+    of the x axis (upwards: +1, downwards: -1).
+    """
+    if len(segments) == 0:
+        return numpy.zeros(len(points), dtype=numpy.intp)
+    y1, y2 = segments[:, 0, 1], segments[:, 1, 1]
+    index = IntervalIndex(numpy.minimum(y1, y2), numpy.maximum(y1, y2))
+    point_index, segment_index = index.query_pairs(points[:, 1])
+    x, y = points[point_index, 0], points[point_index, 1]
+    start = segments[segment_index, 0]
+    end = segments[segment_index, 1]
+    upwards = (start[:, 1] <= y) & (y < end[:, 1])
+    downwards = (end[:, 1] <= y) & (y < start[:, 1])
+    crossing = upwards | downwards
+    old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+    try:
+        crossing_x = start[:, 0] + (y - start[:, 1]) \
+                * (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+        crossing &= crossing_x > x
+    finally:
+        numpy.seterr(**old_settings)
+    weights = numpy.where(upwards, 1, -1) * crossing
+    return numpy.bincount(point_index, weights=weights,
+            minlength=len(points)).round().astype(numpy.intp)
+
+def get_side_points(pieces):
+    """ Returns the points right next to the middle of each piece (array:
+    pieces x 2 x 2) on its left and on its right side.
+    """
+    middles = pieces.mean(axis=1)
+    directions = pieces[:, 1] - pieces[:, 0]
+    directions /= numpy.sqrt((directions ** 2).sum(axis=1))[:, numpy.newaxis]
+    normals = WINDING_TEST_DISTANCE * numpy.column_stack((-directions[:, 1],
+            directions[:, 0]))
+    return middles + normals, middles - normals
+
+def get_loops(pieces):
+    """ Connect the pieces (array: pieces x 2 x 2) to closed loops. Returns
+    a list of point lists. The area to the left of the pieces is enclosed
+    by the loops.
+    """
+    starts = {}
+    for index, start in enumerate(pieces[:, 0]):
+        starts.setdefault(tuple(start), []).append(index)
+    used = numpy.zeros(len(pieces), dtype=bool)
+    loops = []
+    for index in range(len(pieces)):
+        if used[index]:
+            continue
+        loop = []
+        first = tuple(pieces[index, 0])
+        current = index
+        while True:
+            used[current] = True
+            loop.append(current)
+            end = tuple(pieces[current, 1])
+            if end == first:
+                loop = _remove_short_edges(pieces[loop, 0])
+                if len(loop) > 2:
+                    loops.append([tuple([float(value) for value in point])
+                            for point in loop])
+                break
+            candidates = [candidate for candidate in starts.get(end, [])
+                    if not used[candidate]]
+            if not candidates:
+                log.debug("PolygonBoolean: skipping an open outline with " \
+                        + "%d parts" % len(loop))
+                break
+            if len(candidates) > 1:
+                # Turn left as far as possible. Thus the area (to the left)
+                # is surrounded tightly and separate areas touching at a
+                # single point stay separate.
+                incoming = pieces[current, 1] - pieces[current, 0]
+                outgoing = pieces[candidates, 1] - pieces[candidates, 0]
+                angles = numpy.arctan2(incoming[0] * outgoing[:, 1]
+                        - incoming[1] * outgoing[:, 0],
+                        (incoming * outgoing).sum(axis=1))
+                current = candidates[numpy.argmax(angles)]
+            else:
+                current = candidates[0]
+    return loops
+
+def _remove_short_edges(loop):
+    """ remove points that are too close to their predecessor """
+    result = [loop[0]]
+    for point in loop[1:]:
+        if numpy.sqrt(((point - result[-1]) ** 2).sum()) >= epsilon:
+            result.append(point)
+    while (len(result) > 1) \
+            and (numpy.sqrt(((result[0] - result[-1]) ** 2).sum()) < epsilon):
+        result.pop()
+    return result
+
+def get_boolean_loops(rings1, rings2, operation, callback=None):
+    """ Returns the outlines (lists of points) of the combination of the
+    areas described by two lists of rings (arrays: points x 2).
+    """
+    rings1 = [ring for ring in rings1 if len(ring) > 2]
+    rings2 = [ring for ring in rings2 if len(ring) > 2]
+    all_segments = []
+    for rings in (rings1, rings2):
+        segments = snap(get_ring_segments(rings))
+        all_segments.append(
+                segments[(segments[:, 0] != segments[:, 1]).any(axis=1)])
+    segments = numpy.concatenate(all_segments)
+    if len(segments) == 0:
+        return []
+    pieces = get_split_segments(segments)
+    if callback and callback():
+        return None
+    # Pieces shared by both operands (or by overlapping rings) are used once.
+    reverse = (pieces[:, 0, 0] > pieces[:, 1, 0]) \
+            | ((pieces[:, 0, 0] == pieces[:, 1, 0])
+                    & (pieces[:, 0, 1] > pieces[:, 1, 1]))
+    canonical = pieces.copy()
+    canonical[reverse] = canonical[reverse, ::-1]
+    unique = numpy.unique(canonical.reshape(-1, 4), axis=0,
+            return_index=True)[1]
+    pieces = canonical[numpy.sort(unique)]
+    # Keep the pieces separating the resulting area from the remaining
+    # space. The area of the result is located to the left of each piece.
+    left_side, right_side = get_side_points(pieces)
+    combine = OPERATIONS[operation]
+    inside = []
+    for side in (left_side, right_side):
+        inside.append(combine(*[
+                get_winding_numbers(side, segments) + get_outside_winding(rings)
+                        != 0
+                for segments, rings in zip(all_segments, (rings1, rings2))]))
+    if callback and callback():
+        return None
+    inside_left, inside_right = inside
+    pieces[inside_right] = pieces[inside_right, ::-1]
+    return get_loops(pieces[inside_left != inside_right])
+
+def get_split_lines(polygons, lines):
+    """ Split the lines at the outlines of the area described by the
+    polygons (see "PreparedPolygons.split_lines").
+    """
+    return PreparedPolygons(polygons).split_lines(lines)
+
+
+class PreparedPolygons(object):
+    """ closed polygons prepared for repeated point and line queries
+
+    The polygons are projected onto the xy plane - their height is ignored.
+    The edges are registered in an index of their y ranges (for casting rays
+    along the x axis) and in a grid index (for intersections with lines).
+    Thus every query checks only a few edges.
+    By default outer polygons surround material, inner polygons are holes
+    and overlapping polygons are united. Otherwise ("use_direction" is
+    False) every polygon surrounds material.
+    Points on the outline (or very close to it) are inside.
+    """
+
+    def __init__(self, polygons, use_direction=True):
+        rings = []
+        for polygon in polygons:
+            if not polygon.is_closed or (len(polygon) < 3):
+                continue
+            ring = numpy.array([point[:2] for point in polygon.get_points()],
+                    dtype=numpy.float64)
+            if use_direction:
+                reverse = polygon.plane.n[2] < 0
+            else:
+                reverse = (ring[:, 0] * numpy.roll(ring[:, 1], -1)
+                        - numpy.roll(ring[:, 0], -1) * ring[:, 1]).sum() < 0
+            if reverse:
+                ring = ring[::-1]
+            rings.append(ring)
+        self.edges = get_ring_segments(rings)
+        self.outside_winding = get_outside_winding(rings)
+        y1, y2 = self.edges[:, 0, 1], self.edges[:, 1, 1]
+        self._ray_index = IntervalIndex(numpy.minimum(y1, y2),
+                numpy.maximum(y1, y2))
+        self._grid_index = GridIndex(self.edges.min(axis=1),
+                self.edges.max(axis=1))
+
+    def is_point_inside(self, point):
+        return bool(self.get_points_inside([point])[0])
+
+    def get_points_inside(self, points):
+        """ Returns a boolean array: the inside state of each point. """
+        if len(points) == 0:
+            return numpy.zeros(0, dtype=bool)
+        points = numpy.array(points, dtype=numpy.float64).reshape(
+                len(points), -1)[:, :2]
+        inside = numpy.zeros(len(points), dtype=bool)
+        # Points on the outline are inside. The ray casting below would miss
+        # some of them (e.g. on the top edges).
+        point_index, edge_index = self._grid_index.query_pairs(
+                points - epsilon, points + epsilon)
+        start = self.edges[edge_index, 0]
+        direction = self.edges[edge_index, 1] - start
+        offset = points[point_index] - start
+        length_sq = (direction ** 2).sum(axis=1)
+        factor = (offset * direction).sum(axis=1) / numpy.where(length_sq > 0,
+                length_sq, 1)
+        factor = numpy.clip(factor, 0, 1)[:, numpy.newaxis]
+        distance_sq = ((offset - factor * direction) ** 2).sum(axis=1)
+        inside[point_index[distance_sq <= epsilon ** 2]] = True
+        point_index, edge_index = self._ray_index.query_pairs(points[:, 1])
+        x, y = points[point_index, 0], points[point_index, 1]
+        start = self.edges[edge_index, 0]
+        end = self.edges[edge_index, 1]
+        upwards = (start[:, 1] <= y) & (y < end[:, 1])
+        downwards = (end[:, 1] <= y) & (y < start[:, 1])
+        crossing = upwards | downwards
+        old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+        try:
+            crossing_x = start[:, 0] + (y - start[:, 1]) \
+                    * (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+            # Count the crossings on both sides. A crossing very close to
+            # the point is part of both rays - thus the point is inside.
+            right = crossing & (crossing_x > x - epsilon)
+            left = crossing & (crossing_x < x + epsilon)
+        finally:
+            numpy.seterr(**old_settings)
+        weights = numpy.where(upwards, 1, -1)
+        # the ray to the left crosses the edges in the opposite direction
+        for ray, sign in ((right, 1), (left, -1)):
+            windings = sign * numpy.bincount(point_index, weights=weights
+                    * ray, minlength=len(points)).round().astype(numpy.intp)
+            inside |= windings + self.outside_winding != 0
+        return inside
+
+    def split_lines(self, lines):
+        """ Split the lines at the outlines.
+        @value lines: a list of Line objects
+        @returns: a list of tuples (inner lines, outer lines) - one for each
+            line
+        """
+        if len(self.edges) == 0:
+            return [([], [line]) for line in lines]
+        segments = numpy.array([(line.p1[:2], line.p2[:2]) for line in lines],
+                dtype=numpy.float64).reshape(-1, 2, 2)
+        # the factors of all intersections along the lines
+        tolerance = 1e-9
+        line_index, edge_index = self._grid_index.query_pairs(
+                segments.min(axis=1) - tolerance,
+                segments.max(axis=1) + tolerance)
+        cross = lambda a, b: a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+        start1, start2 = segments[line_index, 0], self.edges[edge_index, 0]
+        dir1 = segments[line_index, 1] - start1
+        dir2 = self.edges[edge_index, 1] - start2
+        denominator = cross(dir1, dir2)
+        old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+        try:
+            factor1 = cross(start2 - start1, dir2) / denominator
+            factor2 = cross(start2 - start1, dir1) / denominator
+            crossing = (abs(denominator) > 1e-12) & (factor1 > 0) \
+                    & (factor1 < 1) & (factor2 >= -tolerance) \
+                    & (factor2 <= 1 + tolerance)
+        finally:
+            numpy.seterr(**old_settings)
+        count = len(segments)
+        split_lines = numpy.concatenate((line_index[crossing],
+                numpy.arange(count), numpy.arange(count)))
+        split_factors = numpy.concatenate((factor1[crossing],
+                numpy.zeros(count), numpy.ones(count)))
+        order = numpy.lexsort((split_factors, split_lines))
+        split_lines = split_lines[order]
+        split_factors = split_factors[order]
+        # the pieces between subsequent splits of the same line
+        valid = (split_lines[:-1] == split_lines[1:]) \
+                & (split_factors[:-1] < split_factors[1:])
+        piece_lines = split_lines[:-1][valid]
+        piece_starts = split_factors[:-1][valid]
+        piece_ends = split_factors[1:][valid]
+        middles = segments[piece_lines, 0] + ((piece_starts + piece_ends) / 2
+                )[:, numpy.newaxis] * (segments[piece_lines, 1]
+                        - segments[piece_lines, 0])
+        inside = self.get_points_inside(middles)
+        result = [([], []) for line in lines]
+        for line_index, start, end, is_inside in zip(piece_lines,
+                piece_starts, piece_ends, inside):
+            line = lines[line_index]
+            if start == 0:
+                p1 = line.p1
+            else:
+                p1 = tuple([v1 + start * (v2 - v1)
+                        for v1, v2 in zip(line.p1, line.p2)])
+            if end == 1:
+                p2 = line.p2
+            else:
+                p2 = tuple([v1 + end * (v2 - v1)
+                        for v1, v2 in zip(line.p1, line.p2)])
+            result[line_index][0 if is_inside else 1].append(Line(p1, p2))
+        return result
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pycam.Geometry.BVH import get_overlapping_pairs_between
+from pycam.Geometry.PolygonBoolean import is_polygon_supported, get_rings, \
+        get_polygons_from_loops, snap, get_ring_segments, \
+        get_outside_winding, get_split_segments, get_winding_numbers, \
+        get_side_points, get_loops
+from pycam.Geometry.utils import epsilon
+import pycam.Utils.log
+import numpy
+
+log = pycam.Utils.log.get_logger()
+
+
+# The corners of the offset polygons are sharp (miter), unless the tip would
+# be further away from the original corner than this multiple of the offset.
+# These corners are cut off.
+MITER_LIMIT = 2.0
+
+
+def is_offset_supported(polygon):
+    """ Only closed polygons in horizontal planes are handled by
+    "get_offset_polygons".
+    """
+    return is_polygon_supported(polygon)
+
+def get_offset_polygons(polygons, offset, callback=None):
+    """ Shift the outlines of the area described by the polygons.
+
+    The polygons are processed together: outer polygons (positive area)
+    surround material, inner polygons (negative area) are holes. Positive
+    offsets enlarge the material. Overlapping parts are united and parts
+    that vanish are removed.
+    The polygons are grouped by their height.
+    @value polygons: closed polygons (see "is_offset_supported")
+    @value callback: function to call after each step. It should return
+        True if the user interrupted the operation.
+    @returns: the new polygons or None (if the operation was interrupted)
+    """
+    offset = float(offset)
+    result = []
+    for z, plane, rings in get_rings(polygons):
+        loops = _get_offset_loops(rings, offset, callback=callback)
+        if loops is None:
+            return None
+        result.extend(get_polygons_from_loops(loops, z, plane))
+    return result
+
+def _get_raw_ring(ring, offset):
+    """ Returns the points (array: points x 2) of the shifted ring. The
+    result may intersect itself. Returns None, if the ring vanishes.
+    """
+    # remove duplicate points
+    ring = ring[(abs(ring - numpy.roll(ring, 1, axis=0)) > 0).any(axis=1)]
+    if len(ring) < 3:
+        return None
+    area = (ring[:, 0] * numpy.roll(ring[:, 1], -1)
+            - numpy.roll(ring[:, 0], -1) * ring[:, 1]).sum()
+    width = (ring.max(axis=0) - ring.min(axis=0)).min()
+    if (area * offset < 0) and (2 * abs(offset) >= width):
+        # the ring shrinks and nothing is left
+        return None
+    # the directions of the outgoing edges of all vertices
+    directions = numpy.roll(ring, -1, axis=0) - ring
+    lengths = numpy.sqrt((directions ** 2).sum(axis=1))
+    directions /= lengths[:, numpy.newaxis]
+    distance = abs(offset)
+    # shift to the right of the edges (outwards) for positive offsets
+    normals = numpy.column_stack((directions[:, 1], -directions[:, 0])) \
+            * numpy.sign(offset)
+    dir_prev, dir_next = numpy.roll(directions, 1, axis=0), directions
+    norm_prev, norm_next = numpy.roll(normals, 1, axis=0), normals
+    # A negative "side" means that the edges turn away from the shifting
+    # direction: the shifted edges do not meet (outer corner).
+    side = (norm_prev * dir_next).sum(axis=1)
+    straight = (dir_prev * dir_next).sum(axis=1)
+    is_flat = abs(side) < 1e-12
+    is_outer = (side < 0) & ~is_flat | (is_flat & (straight < 0))
+    is_inner = (side > 0) & ~is_flat
+    # every vertex is replaced by up to three points
+    points = numpy.zeros((len(ring), 3, 2))
+    counts = numpy.ones(len(ring), dtype=numpy.intp)
+    shifted_prev = ring + distance * norm_prev
+    shifted_next = ring + distance * norm_next
+    points[:, 0] = shifted_next
+    normal_dot = (norm_prev * norm_next).sum(axis=1)
+    # Inner corners: the shifted edges meet, if both edges are long enough.
+    # Otherwise the outline goes through the original vertex. The resulting
+    # loop is removed later.
+    overlap = distance * abs(side) / (1 + normal_dot)
+    is_joined = is_inner & (2 * overlap <= numpy.minimum(lengths,
+            numpy.roll(lengths, 1)))
+    is_detour = is_inner & ~is_joined
+    points[is_detour, 0] = shifted_prev[is_detour]
+    points[is_detour, 1] = ring[is_detour]
+    points[is_detour, 2] = shifted_next[is_detour]
+    counts[is_detour] = 3
+    # outer corners: the shifted edges are extended until they meet
+    is_miter = is_joined \
+            | (is_outer & ((1 + normal_dot) * MITER_LIMIT ** 2 > 2))
+    points[is_miter, 0] = ring[is_miter] + distance \
+            * (norm_prev[is_miter] + norm_next[is_miter]) \
+            / (1 + normal_dot[is_miter])[:, numpy.newaxis]
+    # sharp outer corners are cut off perpendicular to the bisector
+    is_cut = is_outer & ~is_miter
+    if is_cut.any():
+        bisectors = norm_prev[is_cut] + norm_next[is_cut]
+        lengths = numpy.sqrt((bisectors ** 2).sum(axis=1))
+        # reversing edges: the bisector is the direction of the first edge
+        reversing = lengths < 1e-12
+        bisectors[reversing] = dir_prev[is_cut][reversing]
+        lengths[reversing] = 1
+        bisectors /= lengths[:, numpy.newaxis]
+        limit = distance * MITER_LIMIT
+        dot = lambda a, b: (a * b).sum(axis=1)
+        factor_prev = (limit - distance * dot(norm_prev[is_cut], bisectors)) \
+                / dot(dir_prev[is_cut], bisectors)
+        factor_next = (limit - distance * dot(norm_next[is_cut], bisectors)) \
+                / -dot(dir_next[is_cut], bisectors)
+        points[is_cut, 0] = shifted_prev[is_cut] \
+                + factor_prev[:, numpy.newaxis] * dir_prev[is_cut]
+        points[is_cut, 1] = shifted_next[is_cut] \
+                - factor_next[:, numpy.newaxis] * dir_next[is_cut]
+        counts[is_cut] = 2
+    used = numpy.arange(3)[numpy.newaxis, :] < counts[:, numpy.newaxis]
+    return points[used]
+
+def _get_minimum_distances(points, segments, distance):
+    """ Returns the distance of each point to the nearest segment - or the
+    given distance, if no segment is closer.
+    """
+    result = numpy.zeros(len(points)) + distance
+    point_index, segment_index = get_overlapping_pairs_between(
+            points - distance, points + distance, segments.min(axis=1),
+            segments.max(axis=1))
+    start = segments[segment_index, 0]
+    direction = segments[segment_index, 1] - start
+    relative = points[point_index] - start
+    factors = (relative * direction).sum(axis=1) \
+            / (direction ** 2).sum(axis=1)
+    factors = numpy.minimum(numpy.maximum(factors, 0), 1)
+    distances = numpy.sqrt(((relative - factors[:, numpy.newaxis]
+            * direction) ** 2).sum(axis=1))
+    numpy.minimum.at(result, point_index, distances)
+    return result
+
+def _get_offset_loops(rings, offset, callback=None):
+    """ Returns the shifted outlines (lists of points) of the area described
+    by the rings (arrays: points x 2).
+    """
+    rings = [ring for ring in rings if len(ring) > 2]
+    if not rings:
+        return []
+    original = get_ring_segments(rings)
+    outside_winding = get_outside_winding(rings)
+    if offset == 0:
+        raw_rings = rings
+    else:
+        raw_rings = [_get_raw_ring(ring, offset) for ring in rings]
+        raw_rings = [ring for ring in raw_rings if not ring is None]
+    if not raw_rings:
+        return []
+    segments = snap(get_ring_segments(raw_rings))
+    segments = segments[(segments[:, 0] != segments[:, 1]).any(axis=1)]
+    if callback and callback():
+        return None
+    pieces = get_split_segments(segments)
+    if callback and callback():
+        return None
+    # Keep the pieces with material on their left side only. The winding
+    # number is calculated right next to the middle of each piece.
+    middles = pieces.mean(axis=1)
+    right_side = get_side_points(pieces)[1]
+    windings = get_winding_numbers(right_side, segments)
+    valid = windings + outside_winding == 0
+    if offset != 0:
+        # all parts of the outline keep the distance to the original rings
+        distances = _get_minimum_distances(middles[valid], original,
+                abs(offset))
+        valid[valid] = distances > abs(offset) - epsilon
+    if callback and callback():
+        return None
+    return get_loops(pieces[valid])
@@ -41,7 +41,7 @@ class Triangle(IDGenerator, TransformableContainer):
 
     __slots__ = ["id", "p1", "p2", "p3", "normal", "minx", "maxx", "miny",
             "maxy", "minz", "maxz", "e1", "e2", "e3", "normal", "center",
-            "radius", "radiussq", "middle"]
+            "radius", "radiussq", "middle", "_inside_data"]
 
     def __init__(self, p1=None, p2=None, p3=None, n=None):
         # points are expected to be in ClockWise order
@@ -80,6 +80,18 @@ class Triangle(IDGenerator, TransformableContainer):
         self.middle = (self.p1[0] * alpha + self.p2[0] * beta + self.p3[0] * gamma,
                         self.p1[1] * alpha + self.p2[1] * beta + self.p3[1] * gamma,
                         self.p1[2] * alpha + self.p2[2] * beta + self.p3[2] * gamma)
+        # The barycentric data of "is_point_inside" depends on the vertices
+        # only. It is prepared once for all subsequent (cutter) queries.
+        v0 = psub(self.p3, self.p1)
+        v1 = psub(self.p2, self.p1)
+        dot00 = pdot(v0, v0)
+        dot01 = pdot(v0, v1)
+        dot11 = pdot(v1, v1)
+        denom = dot00 * dot11 - dot01 * dot01
+        if denom == 0:
+            self._inside_data = None
+        else:
+            self._inside_data = (v0, v1, dot00, dot01, dot11, 1.0 / denom)
 
     def __repr__(self):
         return "Triangle%d<%s,%s,%s>" % (self.id, self.p1, self.p2, self.p3)
@@ -181,21 +193,15 @@ class Triangle(IDGenerator, TransformableContainer):
 
     def is_point_inside(self, p):
         # http://www.blackpawn.com/texts/pointinpoly/default.html
-        # Compute vectors
-        v0 = psub(self.p3, self.p1)
-        v1 = psub(self.p2, self.p1)
-        v2 = psub(p, self.p1)
+        if self._inside_data is None:
+            # degenerated triangle
+            return False
+        v0, v1, dot00, dot01, dot11, invDenom = self._inside_data
         # Compute dot products
-        dot00 = pdot(v0, v0)
-        dot01 = pdot(v0, v1)
+        v2 = psub(p, self.p1)
         dot02 = pdot(v0, v2)
-        dot11 = pdot(v1, v1)
         dot12 = pdot(v1, v2)
         # Compute barycentric coordinates
-        denom = dot00 * dot11 - dot01 * dot01
-        if denom == 0:
-            return False
-        invDenom = 1.0 / denom
         # Originally, "u" and "v" are multiplied with "1/denom".
         # We don't do this to avoid division by zero (for triangles that are
         # "almost" invalid).
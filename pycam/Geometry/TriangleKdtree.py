@@ -76,14 +76,19 @@ class TriangleKdtree(kdtree):
 
     __slots__ = []
 
-    def __init__(self, triangles, cutoff=3, cutoff_distance=1.0):
+    def __init__(self, triangles, cutoff=3, cutoff_distance=1.0, bounds=None):
+        """ The bounds (minx, maxx, miny, maxy) of the items are calculated
+        from the triangles unless "bounds" is given. In this case "triangles"
+        may be any sequence of objects (e.g. indices of an array based mesh).
+        """
         nodes = []
-        for t in triangles:
-            n = Node(t, (min(t.p1[0], t.p2[0], t.p3[0]),
+        if bounds is None:
+            bounds = [(min(t.p1[0], t.p2[0], t.p3[0]),
                     max(t.p1[0], t.p2[0], t.p3[0]),
                     min(t.p1[1], t.p2[1], t.p3[1]),
-                    max(t.p1[1], t.p2[1], t.p3[1])))
-            nodes.append(n)
+                    max(t.p1[1], t.p2[1], t.p3[1])) for t in triangles]
+        for t, bound in zip(triangles, bounds):
+            nodes.append(Node(t, bound))
         super(TriangleKdtree, self).__init__(nodes, cutoff, cutoff_distance)
 
     def Search(self, minx, maxx, miny, maxy):
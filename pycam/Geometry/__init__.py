@@ -22,8 +22,8 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 __all__ = ["utils", "Line", "Model", "Path", "Plane", "Triangle",
-           "PolygonExtractor", "TriangleKdtree", "intersection", "kdtree",
-           "Matrix", "Polygon", "Letters", "PointUtils"]
+           "PolygonExtractor", "TriangleKdtree", "BVH", "intersection",
+           "kdtree", "Matrix", "Polygon", "Letters", "PointUtils"]
 
 from pycam.Geometry.PointUtils import *
 from pycam.Geometry.utils import epsilon, ceil
@@ -27,6 +27,12 @@ from pycam.Geometry.utils import INFINITE, sqrt, epsilon
 from pycam.Geometry.Plane import Plane
 from pycam.Geometry.Line import Line
 from pycam.Geometry.PointUtils import *
+import numpy
+
+# The contact of a dropped torus with an edge is searched by sampling the
+# edge (at most half of the minor radius between the samples) followed by a
+# golden section search around the best sample with this number of steps.
+TORUS_EDGE_REFINE_STEPS = 16
 
 def isNear(a, b):
     return abs(a - b) < epsilon
@@ -351,3 +357,133 @@ def intersect_torus_point(center, axis, majorradius, minorradius, majorradiussq,
         dist = l
     return (ccp, point, dist)
 
+def drop_torus_points(centers, majorradius, minorradius, points):
+    """ vectorized version of the "drop" case of "intersect_torus_point"
+
+    @value centers: array (items x 3) of the centers of the torus (or a
+        single center for all items)
+    @value points: array (items x 3) of points
+    @returns: the distances between the torus and the points along the
+        direction of the drop (INFINITE without contact) and a boolean array
+        marking the valid contacts
+    """
+    minlsq = (majorradius - minorradius) ** 2
+    maxlsq = (majorradius + minorradius) ** 2
+    l_sq = (points[..., 0] - centers[..., 0]) ** 2 \
+            + (points[..., 1] - centers[..., 1]) ** 2
+    valid = (l_sq >= minlsq + epsilon) & (l_sq <= maxlsq - epsilon)
+    z_sq = minorradius ** 2 - (majorradius - numpy.sqrt(l_sq)) ** 2
+    valid &= z_sq >= 0
+    dist = centers[..., 2] - numpy.sqrt(numpy.maximum(z_sq, 0)) \
+            - points[..., 2]
+    return numpy.where(valid, dist, INFINITE), valid
+
+def _get_line_circle_range(a, b, c, radiussq):
+    """ Returns the range of the factors of lines within a circle. The
+    squared distance of a line point from the center is a*m^2 + b*m + c.
+    Empty ranges start at infinity.
+    """
+    old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+    try:
+        discriminant = b * b - 4 * a * (c - radiussq)
+        root = numpy.sqrt(numpy.maximum(discriminant, 0))
+        low = (-b - root) / (2 * a)
+        high = (-b + root) / (2 * a)
+    finally:
+        numpy.seterr(**old_settings)
+    inside = discriminant > 0
+    # vertical lines are either completely inside or outside
+    vertical = a == 0
+    inside[vertical] = c[vertical] < radiussq
+    low[vertical], high[vertical] = -numpy.inf, numpy.inf
+    return numpy.where(inside, low, numpy.inf), \
+            numpy.where(inside, high, -numpy.inf)
+
+def drop_torus_edges(centers, majorradius, minorradius, starts, ends):
+    """ vectorized version of the "drop" case of
+    "pycam.Cutters.ToroidalCutter.intersect_torus_edge"
+
+    Only the parts of the edges below the ring of the torus are sampled.
+    The best sample is refined by a golden section search.
+    @value centers: array (edges x 3) of the centers of the torus (or a
+        single center for all edges)
+    @value starts: array (edges x 3) of the start points of the edges
+    @value ends: array (edges x 3) of the end points of the edges
+    @returns: the distances between the torus and the edges along the
+        direction of the drop (INFINITE without contact), the factors of
+        the contact points along the edges and a boolean array marking the
+        valid contacts
+    """
+    centers = numpy.broadcast_to(centers, starts.shape)
+    count = len(starts)
+    vectors = ends - starts
+    # squared horizontal distance from the center: a*m^2 + b*m + c
+    relative = starts[:, :2] - centers[:, :2]
+    a = (vectors[:, :2] ** 2).sum(axis=1)
+    b = 2 * (relative * vectors[:, :2]).sum(axis=1)
+    c = (relative ** 2).sum(axis=1)
+    outer_low, outer_high = _get_line_circle_range(a, b, c,
+            (majorradius + minorradius) ** 2 - epsilon)
+    inner_low, inner_high = _get_line_circle_range(a, b, c,
+            (majorradius - minorradius) ** 2 + epsilon)
+    no_inner = inner_low > inner_high
+    inner_low[no_inner] = inner_high[no_inner] = numpy.inf
+    # up to two ranges per edge: before and behind the inner circle
+    lows = numpy.concatenate((numpy.maximum(0, outer_low),
+            numpy.maximum(numpy.maximum(0, outer_low), inner_high)))
+    highs = numpy.concatenate((numpy.minimum(numpy.minimum(1, outer_high),
+            inner_low), numpy.minimum(1, outer_high)))
+    edges = numpy.concatenate((numpy.arange(count), numpy.arange(count)))
+    used = lows <= highs
+    lows, highs, edges = lows[used], highs[used], edges[used]
+    def get_distances(factors, indices):
+        points = starts[indices] + factors[:, numpy.newaxis] \
+                * vectors[indices]
+        return drop_torus_points(centers[indices], majorradius,
+                minorradius, points)[0]
+    # sample each range with at most half of the minor radius between
+    # subsequent samples (horizontally)
+    lengths = numpy.sqrt(a[edges]) * (highs - lows)
+    steps = numpy.maximum(2, (lengths / minorradius * 2).astype(numpy.intp))
+    counts = steps + 1
+    ranges = numpy.repeat(numpy.arange(len(lows)), counts)
+    offsets = numpy.arange(counts.sum()) \
+            - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    factors = lows[ranges] + (highs - lows)[ranges] * offsets \
+            / steps[ranges].astype(numpy.float64)
+    dist = get_distances(factors, edges[ranges])
+    # the best sample of each range
+    order = numpy.lexsort((dist, ranges))
+    best = order[numpy.cumsum(counts) - counts]
+    best_dist, best_factor = dist[best], factors[best]
+    # golden section search between the neighbours of the best sample
+    step_size = (highs - lows) / steps
+    low = numpy.maximum(lows, best_factor - step_size)
+    high = numpy.minimum(highs, best_factor + step_size)
+    ratio = (numpy.sqrt(5) - 1) / 2
+    factor1 = high - ratio * (high - low)
+    factor2 = low + ratio * (high - low)
+    dist1 = get_distances(factor1, edges)
+    dist2 = get_distances(factor2, edges)
+    for step in range(TORUS_EDGE_REFINE_STEPS):
+        left = dist1 <= dist2
+        high = numpy.where(left, factor2, high)
+        low = numpy.where(left, low, factor1)
+        new_factor = numpy.where(left, high - ratio * (high - low),
+                low + ratio * (high - low))
+        new_dist = get_distances(new_factor, edges)
+        factor1, factor2 = numpy.where(left, new_factor, factor2), \
+                numpy.where(left, factor1, new_factor)
+        dist1, dist2 = numpy.where(left, new_dist, dist2), \
+                numpy.where(left, dist1, new_dist)
+    for factor, distance in ((factor1, dist1), (factor2, dist2)):
+        better = distance < best_dist
+        best_dist = numpy.where(better, distance, best_dist)
+        best_factor = numpy.where(better, factor, best_factor)
+    # the best range of each edge (the last assignment wins)
+    result = numpy.zeros(count) + INFINITE
+    result_factors = numpy.zeros(count)
+    order = numpy.lexsort((-best_dist, edges))
+    result[edges[order]] = best_dist[order]
+    result_factors[edges[order]] = best_factor[order]
+    return result, result_factors, result < INFINITE
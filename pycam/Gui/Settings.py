@@ -127,6 +127,7 @@ class ToolpathSettings(object):
         "Program": {
             "unit": str,
             "enable_ode": bool,
+            "calculation_backend": str,
         },
         "Process": {
             "generator": str,
@@ -190,10 +191,17 @@ class ToolpathSettings(object):
         return self.support_model
 
     def set_calculation_backend(self, backend=None):
-        self.program["enable_ode"] = (backend.upper() == "ODE")
+        self.program["enable_ode"] = bool(backend) \
+                and (backend.upper() == "ODE")
+        if backend and not self.program["enable_ode"]:
+            self.program["calculation_backend"] = backend
+        elif self.program.has_key("calculation_backend"):
+            del self.program["calculation_backend"]
 
     def get_calculation_backend(self):
-        if self.program.has_key("enable_ode"):
+        if self.program.get("calculation_backend"):
+            return self.program["calculation_backend"]
+        elif self.program.has_key("enable_ode"):
             if self.program["enable_ode"]:
                 return "ODE"
             else:
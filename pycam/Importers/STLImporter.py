@@ -21,61 +21,246 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pycam.Geometry.PointUtils import *
-from pycam.Geometry.Triangle import Triangle
-from pycam.Geometry.PointKdtree import PointKdtree
 from pycam.Geometry.utils import epsilon
-from pycam.Geometry.Model import Model
+from pycam.Geometry.Model import TriangleMesh
 import pycam.Utils.log
 import pycam.Utils
 
 from struct import unpack 
 import StringIO
+import numpy
+import os
 import re
 
 log = pycam.Utils.log.get_logger()
 
+# layout of a facet in a binary STL file (50 bytes)
+BINARY_FACET_DTYPE = numpy.dtype([("normal", "<f4", (3, )),
+        ("vertices", "<f4", (3, 3)), ("attributes", "<u2")])
+# number of facets to be converted between two calls of the callback
+BINARY_FACET_BLOCK_SIZE = 65536
+# number of bytes read at once from ASCII STL files
+ASCII_CHUNK_SIZE = 2 ** 20
 
-vertices = 0
-edges = 0
-kdtree = None
 
-lastUniqueVertex = (None,None,None)
-def UniqueVertex(x, y, z):
-    global vertices,lastUniqueVertex
-    if kdtree:
-        p = kdtree.Point(x, y, z)
-        if p == lastUniqueVertex:
-            vertices += 1
-        return p
-    else:
-        vertices += 1
-        return (x, y, z)
+def weld_vertices(points, tolerance=epsilon):
+    """ merge points that are closer than "tolerance"
 
-def ImportModel(filename, use_kdtree=True, callback=None, **kwargs):
-    global vertices, edges, kdtree
-    vertices = 0
-    edges = 0
-    kdtree = None
+    The coordinates are quantized and sorted. Points with the same quantized
+    coordinates are merged.
+    @param points: array of points (x, y, z)
+    @returns: an array of unique vertices (in the order of their first
+        occurence) and an array with the index of the unique vertex for each
+        of the given points
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3))
+    if len(points) == 0:
+        return points, numpy.zeros(0, dtype=numpy.intp)
+    keys = numpy.floor(points / tolerance + 0.5).astype(numpy.int64)
+    # lexsort is stable: the first point of each group is its first occurence
+    order = numpy.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+    sorted_keys = keys[order]
+    is_first = numpy.ones(len(points), dtype=bool)
+    is_first[1:] = (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)
+    group_ids = numpy.cumsum(is_first) - 1
+    first_indices = order[is_first]
+    # number the groups in the order of their first occurence
+    group_order = numpy.argsort(first_indices)
+    new_ids = numpy.empty(len(first_indices), dtype=numpy.intp)
+    new_ids[group_order] = numpy.arange(len(first_indices))
+    indices = numpy.empty(len(points), dtype=numpy.intp)
+    indices[order] = new_ids[group_ids]
+    return points[first_indices[group_order]], indices
+
+def _read_binary_facets(facets, callback=None):
+    """ convert the facets of a binary STL file into arrays of normals and
+    vertices
+    """
+    normals = numpy.empty((len(facets), 3), dtype=numpy.float64)
+    corners = numpy.empty((len(facets), 3, 3), dtype=numpy.float64)
+    for start in range(0, len(facets), BINARY_FACET_BLOCK_SIZE):
+        if callback and callback(percent=100.0 * start / len(facets)):
+            return None
+        end = start + BINARY_FACET_BLOCK_SIZE
+        block = facets[start:end]
+        normals[start:end] = block["normal"]
+        corners[start:end] = block["vertices"]
+    return normals, corners
+
+def _read_ascii_facets(f, file_size, filename, callback=None):
+    """ read the facets of an ASCII STL file
+
+    The input is read in chunks. Each chunk (cut after its last "endfacet"
+    keyword) is split into tokens. The keywords are located and the numbers
+    following them are converted at once.
+    @returns: the name of the solid, an array of normals (zero for undefined
+        normals) and an array of the three vertices of each facet - or None
+        (if the operation was interrupted)
+    @raises ValueError: for invalid numbers in the definition of a vertex
+    """
+    name = None
+    normals_list = []
+    corners_list = []
+    remainder = ""
+    offset = 0
+    while True:
+        chunk = f.read(ASCII_CHUNK_SIZE)
+        offset += len(chunk)
+        text = remainder + chunk
+        if chunk:
+            end = text.rfind("endfacet")
+            if end < 0:
+                remainder = text
+                continue
+            end += len("endfacet")
+            text, remainder = text[:end], text[end:]
+        else:
+            remainder = ""
+        tokens = numpy.array(text.split())
+        # use the name of the last solid
+        for position in numpy.nonzero(tokens == "solid")[0]:
+            if position + 1 < len(tokens):
+                m = re.match(r"\w+", tokens[position + 1])
+                if m and (tokens[position + 1] != "facet"):
+                    name = m.group()
+        if len(tokens) > 0:
+            try:
+                facets = _parse_ascii_tokens(tokens, filename)
+            except (ValueError, IndexError):
+                raise ValueError(("Invalid number in vertex definition of " \
+                        + "'%s' (near byte %d)") % (filename, offset))
+            normals_list.append(facets[0])
+            corners_list.append(facets[1])
+        if callback and callback(percent=100.0 * offset / max(1, file_size)):
+            return None
+        if not chunk:
+            break
+    if not normals_list:
+        normals_list.append(numpy.zeros((0, 3)))
+        corners_list.append(numpy.zeros((0, 3, 3)))
+    return (name, numpy.concatenate(normals_list),
+            numpy.concatenate(corners_list))
+
+def _parse_ascii_tokens(tokens, filename):
+    """ Returns the normals and the corners of the complete facets. Invalid
+    numbers in the definition of a vertex raise a ValueError. Normals with
+    invalid numbers are ignored (zero) - they are calculated later.
+    """
+    end_positions = numpy.nonzero(tokens == "endfacet")[0]
+    vertex_positions = numpy.nonzero(tokens == "vertex")[0]
+    normal_positions = numpy.nonzero(tokens == "normal")[0]
+    get_numbers = lambda positions: tokens[positions[:, numpy.newaxis]
+            + (1, 2, 3)].astype(numpy.float64)
+    # assign the vertices to their facets
+    vertex_facets = numpy.searchsorted(end_positions, vertex_positions)
+    counts = numpy.bincount(vertex_facets,
+            minlength=len(end_positions) + 1)[:len(end_positions)]
+    if (counts > 3).any():
+        log.error("STLImporter: more then 3 points in facet %d of '%s'" \
+                % (numpy.nonzero(counts > 3)[0][0] + 1, filename))
+    if (counts < 3).any():
+        log.warn(("Invalid facet definition (%d facets) in '%s'. Please " \
+                + "validate the STL file!") % ((counts < 3).sum(), filename))
+    complete = counts >= 3
+    # use the first three vertices of each facet
+    first_vertex = numpy.searchsorted(vertex_facets,
+            numpy.arange(len(end_positions)))[complete]
+    corner_positions = vertex_positions[first_vertex[:, numpy.newaxis]
+            + (0, 1, 2)]
+    corners = get_numbers(corner_positions.ravel()).reshape((-1, 3, 3))
+    normals = numpy.zeros((len(end_positions), 3), dtype=numpy.float64)
+    if len(normal_positions) > 0:
+        try:
+            values = get_numbers(normal_positions)
+        except ValueError:
+            values = numpy.array([_parse_normal(tokens[position + 1:
+                    position + 4]) for position in normal_positions])
+            invalid = (values == 0).all(axis=1).sum()
+            log.warn(("Ignoring %d invalid normals in '%s'. Please " \
+                    + "validate the STL file!") % (invalid, filename))
+        normals[numpy.searchsorted(end_positions, normal_positions)] = values
+    return normals[complete], corners
 
-    normal_conflict_warning_seen = False
+def _parse_normal(texts):
+    """ convert the three components of a normal - or return a zero
+    vector for an invalid normal (e.g. "-0,774597")
+    """
+    try:
+        return [float(text) for text in texts]
+    except ValueError:
+        return [0.0, 0.0, 0.0]
 
+def _get_mesh_from_facets(normals, corners, filename, use_kdtree=True):
+    """ create a TriangleMesh from arrays of normals and vertices (in the
+    order of the STL file)
+    """
+    vertices, indices = weld_vertices(corners.reshape((-1, 3)))
+    faces = indices.reshape((-1, 3))
+    points = vertices[faces]
+    cross = numpy.cross(points[:, 1] - points[:, 0],
+            points[:, 2] - points[:, 0])
+    # facets without a normal are oriented upwards
+    missing_normal = (normals == 0).all(axis=1)
+    dotcross = numpy.where(missing_normal, cross[:, 2],
+            (normals * cross).sum(axis=1))
+    conflicts = numpy.nonzero(dotcross < 0)[0]
+    if len(conflicts) > 0:
+        log.warn(("Inconsistent normal/vertices found in facet definition " \
+                + "%d of '%s'. Please validate the STL file!") \
+                % (conflicts[0] + 1, filename))
+    invalid = dotcross == 0
+    if invalid.any():
+        # the three points are in a line - or two points are identical
+        log.warn(("Skipping %d invalid triangles (maybe the resolution of " \
+                + "the model is too high?)") % invalid.sum())
+    # Triangle expects the vertices in clockwise order
+    swap = dotcross > 0
+    faces[swap] = faces[swap][:, (0, 2, 1)]
+    valid = numpy.logical_not(invalid)
+    faces = faces[valid]
+    normals = normals[valid]
+    missing_normal = missing_normal[valid]
+    if missing_normal.any():
+        # see Triangle.reset_cache
+        points = vertices[faces[missing_normal]]
+        cross = numpy.cross(points[:, 2] - points[:, 0],
+                points[:, 1] - points[:, 0])
+        normals[missing_normal] = cross \
+                / numpy.sqrt((cross * cross).sum(axis=1))[:, numpy.newaxis]
+    # remove unused vertices (only referenced by invalid triangles)
+    used_indices, faces = numpy.unique(faces, return_inverse=True)
+    faces = faces.reshape((-1, 3))
+    return TriangleMesh(vertices[used_indices], faces, normals=normals,
+            use_kdtree=use_kdtree)
+
+def ImportModel(filename, use_kdtree=True, callback=None, **kwargs):
+    local_path = None
     if hasattr(filename, "read"):
         # make sure that the input stream can seek and has ".len"
         f = StringIO.StringIO(filename.read())
+        file_size = f.len
         # useful for later error messages
         filename = "input stream"
     else:
         try:
-            url_file = pycam.Utils.URIHandler(filename).open()
-            # urllib.urlopen objects do not support "seek" - so we need to read
-            # the whole file at once. This is ugly - anyone with a better idea?
-            f = StringIO.StringIO(url_file.read())
-            # TODO: the above ".read" may be incomplete - this is ugly
-            # see http://patrakov.blogspot.com/2011/03/case-of-non-raised-exception.html
-            # and http://stackoverflow.com/questions/1824069/urllib2-not-retrieving-entire-http-response
-            url_file.close()
-        except IOError, err_msg:
+            uri = pycam.Utils.URIHandler(filename)
+            if uri.is_local():
+                # local files are read directly (or memory-mapped)
+                local_path = uri.get_local_path()
+                f = open(local_path, "rb")
+                file_size = os.path.getsize(local_path)
+            else:
+                url_file = uri.open()
+                # urllib.urlopen objects do not support "seek" - so we need
+                # to read the whole file at once. This is ugly - anyone with a
+                # better idea?
+                f = StringIO.StringIO(url_file.read())
+                file_size = f.len
+                # TODO: the above ".read" may be incomplete - this is ugly
+                # see http://patrakov.blogspot.com/2011/03/case-of-non-raised-exception.html
+                # and http://stackoverflow.com/questions/1824069/urllib2-not-retrieving-entire-http-response
+                url_file.close()
+        except (IOError, OSError), err_msg:
             log.error("STLImporter: Failed to read file (%s): %s" \
                     % (filename, err_msg))
             return None
@@ -86,6 +271,9 @@ def ImportModel(filename, use_kdtree=True, callback=None, **kwargs):
         line = f.readline(200)
         if len(line) == 0:
             # empty line (not even a line-feed) -> EOF
+            if header_lines:
+                # small binary files do not need to contain two "lines"
+                break
             log.error("STLImporter: No valid lines found in '%s'" % filename)
             return None
         # ignore comment lines
@@ -98,9 +286,9 @@ def ImportModel(filename, use_kdtree=True, callback=None, **kwargs):
     numfacets = unpack("<I", f.read(4))[0]
     binary = False
     log.debug("STL import info: %s / %s / %s / %s" % \
-            (f.len, numfacets, header.find("solid"), header.find("facet")))
+            (file_size, numfacets, header.find("solid"), header.find("facet")))
 
-    if f.len == (84 + 50*numfacets):
+    if file_size == (84 + 50*numfacets):
         binary = True
     elif header.find("solid") >= 0 and header.find("facet") >= 0:
         binary = False
@@ -109,187 +297,51 @@ def ImportModel(filename, use_kdtree=True, callback=None, **kwargs):
         log.error("STLImporter: STL binary/ascii detection failed")
         return None
 
-    if use_kdtree:
-        kdtree = PointKdtree([], 3, 1, epsilon)
-    model = Model(use_kdtree)
-
-    t = None
-    p1 = None
-    p2 = None
-    p3 = None
-
     if binary:
-        for i in range(1, numfacets + 1): 
-            if callback and callback():
-                log.warn("STLImporter: load model operation cancelled")
-                return None
-            a1 = unpack("<f", f.read(4))[0] 
-            a2 = unpack("<f", f.read(4))[0] 
-            a3 = unpack("<f", f.read(4))[0] 
-
-            n = (float(a1), float(a2), float(a3), 'v')
-            
-            v11 = unpack("<f", f.read(4))[0] 
-            v12 = unpack("<f", f.read(4))[0] 
-            v13 = unpack("<f", f.read(4))[0] 
-
-            p1 = UniqueVertex(float(v11), float(v12), float(v13))
-            
-            v21 = unpack("<f", f.read(4))[0] 
-            v22 = unpack("<f", f.read(4))[0] 
-            v23 = unpack("<f", f.read(4))[0] 
-
-            p2 = UniqueVertex(float(v21), float(v22), float(v23))
-            
-            v31 = unpack("<f", f.read(4))[0] 
-            v32 = unpack("<f", f.read(4))[0] 
-            v33 = unpack("<f", f.read(4))[0] 
-            
-            p3 = UniqueVertex(float(v31), float(v32), float(v33))
-
-            # not used
-            attribs = unpack("<H", f.read(2)) 
-            
-            dotcross = pdot(n, pcross(psub(p2, p1), psub(p3, p1)))
-            if a1 == a2 == a3 == 0:
-                dotcross = pcross(psub(p2, p1), psub(p3,p1))[2]
-                n = None
-
-            if dotcross > 0:
-                # Triangle expects the vertices in clockwise order
-                t = Triangle(p1, p3, p2)
-            elif dotcross < 0:
-                if not normal_conflict_warning_seen:
-                    log.warn(("Inconsistent normal/vertices found in facet " + \
-                            "definition %d of '%s'. Please validate the " + \
-                            "STL file!") % (i, filename))
-                    normal_conflict_warning_seen = True
-                t = Triangle(p1, p2, p3)
-            else:
-                # the three points are in a line - or two points are identical
-                # usually this is caused by points, that are too close together
-                # check the tolerance value in pycam/Geometry/PointKdtree.py
-                log.warn("Skipping invalid triangle: %s / %s / %s " \
-                        % (p1, p2, p3) + "(maybe the resolution of the model " \
-                        + "is too high?)")
-                continue
-            if n:
-                t.normal = n
-
-            model.append(t)
+        if local_path and (numfacets > 0):
+            facets = numpy.memmap(local_path, dtype=BINARY_FACET_DTYPE,
+                    mode="r", offset=84, shape=(numfacets, ))
+        else:
+            f.seek(84)
+            facets = numpy.frombuffer(f.read(50 * numfacets),
+                    dtype=BINARY_FACET_DTYPE)
+        name = None
+        result = _read_binary_facets(facets, callback=callback)
+        del facets
     else:
-        solid = re.compile(r"\s*solid\s+(\w+)\s+.*")
-        endsolid = re.compile(r"\s*endsolid\s*")
-        facet = re.compile(r"\s*facet\s*")
-        normal = re.compile(r"\s*facet\s+normal" \
-                + r"\s+(?P<x>[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)" \
-                + r"\s+(?P<y>[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)" \
-                + r"\s+(?P<z>[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)\s+")
-        endfacet = re.compile(r"\s*endfacet\s+")
-        loop = re.compile(r"\s*outer\s+loop\s+")
-        endloop = re.compile(r"\s*endloop\s+")
-        vertex = re.compile(r"\s*vertex" \
-                + r"\s+(?P<x>[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)" \
-                + r"\s+(?P<y>[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)" \
-                + r"\s+(?P<z>[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)\s+")
-
-        current_line = 0
-
-        for line in f:
-            if callback and callback():
-                log.warn("STLImporter: load model operation cancelled")
-                return None
-            current_line += 1
-            m = solid.match(line)
-            if m:
-                model.name = m.group(1)
-                continue
-
-            m = facet.match(line)
-            if m:
-                m = normal.match(line)
-                if m:
-                    n = (float(m.group('x')), float(m.group('y')), float(m.group('z')), 'v')
-                else:
-                    n = None
-                continue
-            m = loop.match(line)
-            if m:
-                continue
-            m = vertex.match(line)
-            if m:
-                p = UniqueVertex(float(m.group('x')), float(m.group('y')),
-                        float(m.group('z')))
-                if p1 is None:
-                    p1 = p
-                elif p2 is None:
-                    p2 = p
-                elif p3 is None:
-                    p3 = p
-                else:
-                    log.error("STLImporter: more then 3 points in facet " \
-                            + "(line %d)" % current_line)
-                continue
-            m = endloop.match(line)
-            if m:
-                continue
-            m = endfacet.match(line)
-            if m:
-                if p1 is None or p2 is None or p3 is None:
-                    log.warn(("Invalid facet definition in line " \
-                            + "%d of '%s'. Please validate the STL file!") \
-                            % (current_line, filename))
-                    n, p1, p2, p3 = None, None, None, None
-                    continue
-                if not n:
-                    n = pnormalized(pcross(psub(p2, p1), psub(p3, p1)))
-
-                # validate the normal
-                # The three vertices of a triangle in an STL file are supposed
-                # to be in counter-clockwise order. This should match the
-                # direction of the normal.
-                if n is None:
-                    # invalid triangle (zero-length vector)
-                    dotcross = 0
-                else:
-                    # make sure the points are in ClockWise order
-                    dotcross = pdot(n, pcross(psub(p2,p1), psub(p3, p1)))
-                if dotcross > 0:
-                    # Triangle expects the vertices in clockwise order
-                    t = Triangle(p1, p3, p2, n)
-                elif dotcross < 0:
-                    if not normal_conflict_warning_seen:
-                        log.warn(("Inconsistent normal/vertices found in " + \
-                                "line %d of '%s'. Please validate the STL " + \
-                                "file!") % (current_line, filename))
-                        normal_conflict_warning_seen = True
-                    t = Triangle(p1, p2, p3, n)
-                else:
-                    # The three points are in a line - or two points are
-                    # identical. Usually this is caused by points, that are too
-                    # close together. Check the tolerance value in
-                    # pycam/Geometry/PointKdtree.py.
-                    log.warn("Skipping invalid triangle: %s / %s / %s " \
-                            % (p1, p2, p3) + "(maybe the resolution of the " \
-                            + "model is too high?)")
-                    n, p1, p2, p3 = (None, None, None, None)
-                    continue
-                n, p1, p2, p3 = (None, None, None, None)
-                model.append(t)
-                continue
-            m = endsolid.match(line)
-            if m:
-                continue
+        try:
+            result = _read_ascii_facets(f, file_size, filename,
+                    callback=callback)
+        except ValueError, err_msg:
+            log.error("STLImporter: %s" % err_msg)
+            f.close()
+            return None
+        if result:
+            name, result = result[0], result[1:]
+    f.close()
+    if result is None:
+        log.warn("STLImporter: load model operation cancelled")
+        return None
+    normals, corners = result
+    if not binary:
+        # ASCII facets without a normal: the vertices are counter-clockwise
+        missing_normal = (normals == 0).all(axis=1)
+        cross = numpy.cross(corners[missing_normal, 1]
+                - corners[missing_normal, 0],
+                corners[missing_normal, 2] - corners[missing_normal, 0])
+        lengths = numpy.sqrt((cross * cross).sum(axis=1))
+        lengths[lengths == 0] = 1
+        normals[missing_normal] = cross / lengths[:, numpy.newaxis]
+    model = _get_mesh_from_facets(normals, corners, filename,
+            use_kdtree=use_kdtree)
+    if name:
+        model.name = name
 
     log.info("Imported STL model: %d vertices, %d edges, %d triangles" \
-            % (vertices, edges, len(model.triangles())))
-    vertices = 0
-    edges = 0
-    kdtree = None
+            % (len(model.vertices), 0, len(model)))
 
     if not model:
         # no valid items added to the model
         return None
     else:
         return model
-    
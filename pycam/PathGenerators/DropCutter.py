@@ -22,78 +22,175 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from pycam.PathGenerators import get_max_height_dynamic
+from pycam.Physics.height_map import get_height_map
+from pycam.Geometry.utils import INFINITE
 from pycam.Utils import ProgressCounter
 from pycam.Utils.threading import run_in_parallel
+import pycam.Utils.threading
 import pycam.Geometry.Model
 import pycam.Utils.log
 from pycam.Toolpath import MOVE_STRAIGHT, MOVE_SAFETY
 
 log = pycam.Utils.log.get_logger()
 
+# number of tiles per worker process (more tiles improve the load balancing)
+TILES_PER_PROCESS = 4
+# upper limit for the number of grid lines in one tile (smaller tiles return
+# visible results earlier)
+MAX_LINES_PER_TILE = 32
+
 
 # We need to use a global function here - otherwise it does not work with
 # the multiprocessing Pool.
-def _process_one_grid_line((positions, minz, maxz, model, cutter, physics)):
-    """ This function assumes, that the positions are next to each other.
-    Otherwise the dynamic over-sampling (in get_max_height_dynamic) is
-    pointless.
+def _process_grid_tile((lines, minz, maxz, model, cutter, physics,
+        tolerance)):
+    """ This function assumes, that the positions of each line are next to
+    each other. Otherwise the dynamic over-sampling (in
+    get_max_height_dynamic) is pointless.
+    Returns the points of each line and the number of added points.
     """
-    return get_max_height_dynamic(model, cutter, positions, minz, maxz, physics)
+    result = []
+    added_count = 0
+    for positions in lines:
+        points, count = get_max_height_dynamic(model, cutter, positions,
+                minz, maxz, physics, tolerance=tolerance)
+        result.append(points)
+        added_count += count
+    return result, added_count
 
 
 class DropCutter(object):
 
-    def __init__(self, physics=None):
+    def __init__(self, physics=None, use_height_map=False,
+            inverse_tool=False, tolerance=None):
+        """ The optional height map (see pycam.Physics.height_map) is shared
+        by all DropCutter calculations with the same model and the same
+        cutter. "inverse_tool" calculates the height map by rasterizing the
+        model instead of dropping the cutter (implies "use_height_map").
+        The cutter is still dropped where the rasterized heights may be too
+        low.
+        Additional points are added to the lines of the grid, if a point
+        deviates more than "tolerance" from the chord between its
+        neighbours (by default a small angular deviance is accepted). The
+        number of added points of the last calculation is available as
+        "added_count".
+        """
         self.physics = physics
+        self.tolerance = tolerance
+        self.added_count = 0
+        self.use_height_map = use_height_map or inverse_tool
+        self.inverse_tool = inverse_tool
+
+    def _get_tiles(self, layers):
+        """ group adjacent grid lines of each layer into tiles """
+        if pycam.Utils.threading.is_multiprocessing_enabled():
+            num_of_tiles = TILES_PER_PROCESS \
+                    * pycam.Utils.threading.get_number_of_processes()
+        else:
+            num_of_tiles = TILES_PER_PROCESS
+        tiles = []
+        for lines in layers:
+            lines_per_tile = (len(lines) + num_of_tiles - 1) // num_of_tiles
+            lines_per_tile = min(MAX_LINES_PER_TILE, max(1, lines_per_tile))
+            for start in range(0, len(lines), lines_per_tile):
+                tiles.append(lines[start:start + lines_per_tile])
+        return tiles
+
+    def _get_tile_data(self, tile, model, cutter, physics):
+        """ Returns the (sub-)model and (sub-)physics covering the positions
+        of a tile. Each task transfers only this data.
+        """
+        positions = [pos for line in tile for pos in line]
+        if not positions:
+            return model, physics
+        minx = min([pos[0] for pos in positions])
+        maxx = max([pos[0] for pos in positions])
+        miny = min([pos[1] for pos in positions])
+        maxy = max([pos[1] for pos in positions])
+        if physics:
+            # the model is not used, if a physics engine is available
+            if hasattr(physics, "get_subset"):
+                return None, physics.get_subset(minx, maxx, miny, maxy)
+            else:
+                return None, physics
+        elif model and hasattr(model, "get_sub_model"):
+            radius = cutter.distance_radius
+            return model.get_sub_model(minx - radius, miny - radius,
+                    -INFINITE, maxx + radius, maxy + radius, INFINITE), None
+        else:
+            return model, None
 
     def GenerateToolPath(self, cutter, models, motion_grid, minz=None, maxz=None, draw_callback=None):
         path = []
         quit_requested = False
         model = pycam.Geometry.Model.get_combined_model(models)
+        physics = self.physics
+        if self.use_height_map and model:
+            if draw_callback:
+                callback = lambda: draw_callback(text="DropCutter: " \
+                        + "calculating the height map")
+            else:
+                callback = None
+            physics = get_height_map(model, cutter, physics=physics,
+                    inverse_tool=self.inverse_tool, callback=callback)
+            if physics is None:
+                # cancel requested
+                return path
 
         # Transfer the grid (a generator) into a list of lists and count the
         # items.
-        lines = []
+        layers = []
         # usually there is only one layer - but an xy-grid consists of two
         for layer in motion_grid:
-            for line in layer:
-                lines.append(line)
+            # simplify the data (useful for remote processing)
+            layers.append([[(pos[0], pos[1]) for pos in line]
+                    for line in layer])
 
-        num_of_lines = len(lines)
-        progress_counter = ProgressCounter(len(lines), draw_callback)
+        num_of_lines = sum([len(lines) for lines in layers])
+        progress_counter = ProgressCounter(num_of_lines, draw_callback)
         current_line = 0
 
-
+        # Adjacent grid lines are grouped into tiles. Every task receives
+        # only the triangles below its tile.
         args = []
-        for one_grid_line in lines:
-            # simplify the data (useful for remote processing)
-            xy_coords = [(pos[0], pos[1]) for pos in one_grid_line]
-            args.append((xy_coords, minz, maxz, model, cutter,
-                    self.physics))
-        for points in run_in_parallel(_process_one_grid_line, args,
-                callback=progress_counter.update):
-            if draw_callback and draw_callback(text="DropCutter: processing " \
-                        + "line %d/%d" % (current_line + 1, num_of_lines)):
-                # cancel requested
-                quit_requested = True
-                break
-            for point in points:
-                if point is None:
-                    # exceeded maxz - the cutter has to skip this point
-                    path.append((MOVE_SAFETY, None))
-                else:
-                    path.append((MOVE_STRAIGHT, point))
-                # The progress counter may return True, if cancel was requested.
-                if draw_callback and draw_callback(tool_position=point,
-                        toolpath=path):
+        for tile in self._get_tiles(layers):
+            tile_model, tile_physics = self._get_tile_data(tile, model,
+                    cutter, physics)
+            args.append((tile, minz, maxz, tile_model, cutter, tile_physics,
+                    self.tolerance))
+        self.added_count = 0
+        # the results of the tiles are returned in order
+        for tile_results, added_count in run_in_parallel(_process_grid_tile,
+                args, callback=progress_counter.update):
+            self.added_count += added_count
+            for points in tile_results:
+                if draw_callback and draw_callback(text="DropCutter: " \
+                            + "processing line %d/%d" \
+                            % (current_line + 1, num_of_lines)):
+                    # cancel requested
                     quit_requested = True
                     break
-            # add a move to safety height after each line of moves
-            path.append((MOVE_SAFETY, None))
-            progress_counter.increment()
-            # update progress
-            current_line += 1
+                for point in points:
+                    if point is None:
+                        # exceeded maxz - the cutter has to skip this point
+                        path.append((MOVE_SAFETY, None))
+                    else:
+                        path.append((MOVE_STRAIGHT, point))
+                    # The progress counter may return True, if cancel was
+                    # requested.
+                    if draw_callback and draw_callback(tool_position=point,
+                            toolpath=path):
+                        quit_requested = True
+                        break
+                # add a move to safety height after each line of moves
+                path.append((MOVE_SAFETY, None))
+                progress_counter.increment()
+                # update progress
+                current_line += 1
+                if quit_requested:
+                    break
             if quit_requested:
                 break
+        log.debug("DropCutter: added %d points to %d lines" \
+                % (self.added_count, num_of_lines))
         return path
-
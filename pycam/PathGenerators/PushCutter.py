@@ -21,10 +21,12 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pycam.PathGenerators import get_free_paths_ode, get_free_paths_triangles
-import pycam.PathProcessors
+from pycam.PathGenerators import get_free_paths_ode, \
+        get_free_paths_triangles_lines
+import pycam.PathProcessors.ContourCutter
 from pycam.Geometry.utils import ceil
 from pycam.Utils.threading import run_in_parallel
+import pycam.Utils.threading
 from pycam.Utils import ProgressCounter
 from pycam.Geometry.PointUtils import *
 import pycam.Utils.log
@@ -34,15 +36,61 @@ from pycam.Toolpath import MOVE_STRAIGHT, MOVE_SAFETY
 
 log = pycam.Utils.log.get_logger()
 
+# number of tasks per worker process (more tasks improve the load balancing)
+TASKS_PER_PROCESS = 4
+# upper limit for the number of scanlines in one task (smaller tasks return
+# visible results earlier)
+MAX_LINES_PER_TASK = 64
+
 
 # We need to use a global function here - otherwise it does not work with
 # the multiprocessing Pool.
-def _process_one_line((p1, p2, depth, models, cutter, physics)):
+def _process_lines((lines, models, cutter, physics)):
+    """ calculate the free paths of a group of adjacent (parallel) lines """
     if physics:
-        points = get_free_paths_ode(physics, p1, p2, depth=depth)
+        return [get_free_paths_ode(physics, p1, p2, depth=depth)
+                for p1, p2, depth in lines]
     else:
-        points = get_free_paths_triangles(models, cutter, p1, p2)
-    return points
+        return get_free_paths_triangles_lines(models, cutter,
+                [(p1, p2) for p1, p2, depth in lines])
+
+def _process_waterline_layer((lines, models, cutter, physics)):
+    """ calculate the waterlines of one layer
+
+    The first model is used for the waterline. All other models are
+    obstacles (e.g. a support grid).
+    Returns a list of (height, moves) tuples - one for each waterline.
+    """
+    # the ContourCutter pathprocessor does not work with combined models
+    path_processor = pycam.PathProcessors.ContourCutter.ContourCutter()
+    path_processor.new_direction(0)
+    for points in _process_lines((lines, models[:1], cutter, physics)):
+        if points:
+            path_processor.new_scanline()
+            for point in points:
+                path_processor.append(point)
+            path_processor.end_scanline()
+    path_processor.end_direction()
+    path_processor.finish()
+    result = []
+    # turn the waterline points into cutting segments
+    for path in path_processor.paths:
+        pairs = []
+        for index in range(len(path.points) - 1):
+            pairs.append((path.points[index], path.points[index + 1]))
+        if len(models) > 1:
+            pairs_free_points = get_free_paths_triangles_lines(models[1:],
+                    cutter, pairs)
+        else:
+            pairs_free_points = pairs
+        moves = []
+        for free_points in pairs_free_points:
+            for index in range(len(free_points) / 2):
+                moves.append((MOVE_STRAIGHT, free_points[2 * index]))
+                moves.append((MOVE_STRAIGHT, free_points[2 * index + 1]))
+                moves.append((MOVE_SAFETY, None))
+        result.append((path.points[0][2], moves))
+    return result
 
 
 class PushCutter(object):
@@ -72,11 +120,12 @@ class PushCutter(object):
 
         progress_counter = ProgressCounter(num_of_grid_positions, draw_callback)
 
-        current_layer = 0
         if self.waterlines:
-            self.pa = pycam.PathProcessors.ContourCutter.ContourCutter()
-        else:
-            path = []
+            return self._generate_waterlines(cutter, models, grid,
+                    draw_callback, progress_counter)
+
+        current_layer = 0
+        path = []
         for layer_grid in grid:
             # update the progress bar and check, if we should cancel the process
             if draw_callback and draw_callback(text="PushCutter: processing" \
@@ -84,63 +133,54 @@ class PushCutter(object):
                 # cancel immediately
                 break
 
-            if self.waterlines:
-                self.pa.new_direction(0)
             result = self.GenerateToolPathSlice(cutter, models, layer_grid,
                     draw_callback, progress_counter)
-            if self.waterlines:
-                self.pa.end_direction()
-                self.pa.finish()
-            else:
-                path.extend(result)
+            path.extend(result)
 
             current_layer += 1
 
-        if self.waterlines:
-            # TODO: this is complicated and hacky :(
-            # we don't use parallelism or ODE (for the sake of simplicity)
-            result = []
-            # turn the waterline points into cutting segments
-            for path in self.pa.paths:
-                pairs = []
-                for index in range(len(path.points) - 1):
-                    pairs.append((path.points[index], path.points[index + 1]))
-                if len(models) > 1:
-                    # We assume that the first model is used for the waterline and all
-                    # other models are obstacles (e.g. a support grid).
-                    other_models = models[1:]
-                    for p1, p2 in pairs:
-                        free_points = get_free_paths_triangles(other_models,
-                                cutter, p1, p2)
-                        for index in range(len(free_points) / 2):
-                            result.append((MOVE_STRAIGHT, free_points[2 * index]))
-                            result.append((MOVE_STRAIGHT, free_points[2 * index + 1]))
-                            result.append((MOVE_SAFETY, None))
-                else:
-                    for p1, p2 in pairs:
-                        result.append((MOVE_STRAIGHT, p1))
-                        result.append((MOVE_STRAIGHT, p2))
-                        result.append((MOVE_SAFETY, None))
-            return result
-        else:
-            return path
+        return path
 
-    def GenerateToolPathSlice(self, cutter, models, layer_grid, draw_callback=None,
+    def _generate_waterlines(self, cutter, models, grid, draw_callback=None,
             progress_counter=None):
-        path = []
-
+        """ Every layer is processed by a separate (parallel) task. The
+        waterlines of all layers are sorted by height (upper first).
+        """
+        num_of_layers = len(grid)
+        args = []
+        for layer_grid in grid:
+            args.append((self._get_lines_with_depth(cutter, layer_grid),
+                    models, cutter, self.physics))
+        waterlines = []
+        current_layer = 0
+        for layer_waterlines in run_in_parallel(_process_waterline_layer,
+                args, callback=progress_counter.update):
+            waterlines.extend(layer_waterlines)
+            current_layer += 1
+            if draw_callback and draw_callback(text="PushCutter: processed" \
+                        + " layer %d/%d" % (current_layer, num_of_layers)):
+                # cancel immediately
+                break
+            if progress_counter.increment(len(grid[current_layer - 1])):
+                # quit requested
+                break
+        # a stable sort keeps the order of waterlines at the same height
+        waterlines.sort(key=lambda (height, moves): height, reverse=True)
+        result = []
+        for height, moves in waterlines:
+            result.extend(moves)
+        return result
+
+    def _get_lines_with_depth(self, cutter, layer_grid):
+        """ add the required calculation depth (recursion) of ODE to each
+        line
+        """
         # settings for calculation of depth
         accuracy = 20
         max_depth = 20
         min_depth = 4
 
-        # the ContourCutter pathprocessor does not work with combined models
-        if self.waterlines:
-            models = models[:1]
-        else:
-            models = models
-
-        args = []
+        lines = []
         for line in layer_grid:
             p1, p2 = line
             # calculate the required calculation depth (recursion)
@@ -148,32 +188,46 @@ class PushCutter(object):
             # TODO: accessing cutter.radius here is slightly ugly
             depth = math.log(accuracy * distance / cutter.radius) / math.log(2)
             depth = min(max(ceil(depth), 4), max_depth)
-            args.append((p1, p2, depth, models, cutter, self.physics))
+            lines.append((p1, p2, depth))
+        return lines
+
+    def GenerateToolPathSlice(self, cutter, models, layer_grid, draw_callback=None,
+            progress_counter=None):
+        path = []
 
-        for points in run_in_parallel(_process_one_line, args,
-                callback=progress_counter.update):
+        lines = self._get_lines_with_depth(cutter, layer_grid)
+
+        # Adjacent lines are processed together. The candidate triangles of
+        # all lines of a task are collected in a single sweep.
+        if pycam.Utils.threading.is_multiprocessing_enabled():
+            num_of_tasks = TASKS_PER_PROCESS \
+                    * pycam.Utils.threading.get_number_of_processes()
+        else:
+            num_of_tasks = 1
+        lines_per_task = (len(lines) + num_of_tasks - 1) // num_of_tasks
+        lines_per_task = min(MAX_LINES_PER_TASK, max(1, lines_per_task))
+        args = []
+        for start in range(0, len(lines), lines_per_task):
+            args.append((lines[start:start + lines_per_task], models, cutter,
+                    self.physics))
+
+        def get_results():
+            for task_results in run_in_parallel(_process_lines, args,
+                    callback=progress_counter.update):
+                for points in task_results:
+                    yield points
+
+        for points in get_results():
             if points:
-                if self.waterlines:
-                    self.pa.new_scanline()
-                    for point in points:
-                        self.pa.append(point)
-                else:
-                    for index in range(len(points) / 2):
-                        path.append((MOVE_STRAIGHT, points[2 * index]))
-                        path.append((MOVE_STRAIGHT, points[2 * index + 1]))
-                        path.append((MOVE_SAFETY, None))
-                if self.waterlines:
-                    if draw_callback:
-                        draw_callback(tool_position=points[-1])
-                    self.pa.end_scanline()
-                else:
-                    if draw_callback:
-                        draw_callback(tool_position=points[-1], toolpath=path)
+                for index in range(len(points) / 2):
+                    path.append((MOVE_STRAIGHT, points[2 * index]))
+                    path.append((MOVE_STRAIGHT, points[2 * index + 1]))
+                    path.append((MOVE_SAFETY, None))
+                if draw_callback:
+                    draw_callback(tool_position=points[-1], toolpath=path)
             # update the progress counter
             if progress_counter and progress_counter.increment():
                 # quit requested
                 break
 
-        if not self.waterlines:
-            return path
-
+        return path
@@ -0,0 +1,841 @@
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from pycam.PathGenerators import get_free_paths_triangles_lines
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+from pycam.Geometry.BVH import get_overlapping_pairs_between
+from pycam.Geometry.Plane import Plane
+from pycam.Geometry.utils import epsilon
+from pycam.Utils.threading import run_in_parallel
+from pycam.Utils import ProgressCounter
+from pycam.Toolpath import MOVE_STRAIGHT, MOVE_SAFETY
+import pycam.Utils.log
+import numpy
+import math
+
+
+log = pycam.Utils.log.get_logger()
+
+# default tolerance (relative to the radius of the cutter): the profile of
+# the cutter is approximated by four slices, the circles by polygons with 16
+# edges
+TOLERANCE_FACTOR = 0.04
+
+
+def _get_cutter_shape(cutter):
+    """ Every cutter shape is handled as a flat disk ("flat" radius) swept by
+    a sphere around the rim of the disk. The center of the sphere is located
+    at the "center" height above the tip of the cutter. The material
+    allowance grows the sphere ("rounding" radius).
+    """
+    allowance = cutter.get_required_distance()
+    if isinstance(cutter, ToroidalCutter):
+        flat, center = cutter.majorradius, cutter.minorradius
+    elif isinstance(cutter, SphericalCutter):
+        flat, center = 0, cutter.radius
+    else:
+        flat, center = cutter.radius, 0
+    return float(flat), float(center), float(center + allowance)
+
+def get_cutter_width(cutter, height):
+    """ Returns the horizontal radius of the cutter (including the material
+    allowance) at the given height above the tip of the cutter.
+    """
+    flat, center, rounding = _get_cutter_shape(cutter)
+    distance = min(center - height, rounding)
+    return flat + math.sqrt(max(rounding ** 2 - distance ** 2, 0))
+
+def get_tolerance(cutter, tolerance=None):
+    """ Returns the given tolerance or the default tolerance for the cutter
+    (see TOLERANCE_FACTOR).
+    """
+    if tolerance is None:
+        flat, center, rounding = _get_cutter_shape(cutter)
+        return TOLERANCE_FACTOR * (flat + rounding)
+    return tolerance
+
+def _get_step_angle(radius, tolerance):
+    """ Returns the largest angle between the tangents of a circle for which
+    the circumscribed polygon deviates from the circle by not more than the
+    tolerance.
+    """
+    return 2 * math.acos(radius / (radius + tolerance))
+
+def get_circle_edges(cutter, tolerance=None):
+    """ Returns the number of edges of the polygons around the circles of
+    the slices. The polygons deviate from the circles by not more than the
+    tolerance.
+    """
+    flat, center, rounding = _get_cutter_shape(cutter)
+    if flat + rounding <= epsilon:
+        return 4
+    tolerance = max(get_tolerance(cutter, tolerance), epsilon)
+    return max(4, int(math.ceil(2 * math.pi
+            / _get_step_angle(flat + rounding, tolerance) - epsilon)))
+
+def get_cutter_profile(cutter, tolerance=None):
+    """ Returns a list of (height, width) tuples describing the cutter: the
+    horizontal radius (see "get_cutter_width") at a height above the tip of
+    the cutter.
+    The rounded part of the cutter is approximated by a polygon around its
+    profile (the tangents of evenly distributed angles). Thus the widths
+    between the heights of the slices are never too small. The polygon
+    deviates from the profile by not more than the tolerance.
+    """
+    flat, center, rounding = _get_cutter_shape(cutter)
+    if rounding <= epsilon:
+        return [(0.0, flat)]
+    tolerance = max(get_tolerance(cutter, tolerance), epsilon)
+    steps = max(1, int(math.ceil(0.5 * math.pi
+            / _get_step_angle(rounding, tolerance) - epsilon)))
+    step = 0.5 * math.pi / steps
+    # the corners of the polygon are located between the tangents
+    corner_radius = rounding / math.cos(step / 2)
+    profile = []
+    for index in range(steps):
+        angle = step * (index + 0.5)
+        profile.append((center - corner_radius * math.cos(angle),
+                flat + corner_radius * math.sin(angle)))
+    # the shaft of the cutter starts above the rounded part
+    profile.append((center, flat + rounding))
+    return profile
+
+def _get_flat_heights(model):
+    """ Returns the heights of all horizontal triangles of the model.
+    The slice of a model changes abruptly at these heights. Thus the slices
+    right below (upward facing triangles) or above (downward facing
+    triangles) are added to the slices of the cutter's profile.
+    """
+    heights = set()
+    # "Plane.intersect_triangle" ignores collisions close to the vertices
+    offset = 10 * epsilon
+    for triangle in model.triangles():
+        if triangle.maxz - triangle.minz > epsilon:
+            continue
+        if triangle.normal[2] > 0:
+            heights.add(triangle.maxz - offset)
+        else:
+            heights.add(triangle.minz + offset)
+    return sorted(heights)
+
+def _get_slice(model, z):
+    """ Returns the segments (array: lines x 2 x 2) of the slice of the model
+    at the given height and the outward normals (array: lines x 2) of the
+    segments.
+    Only the triangles crossing the height are visited.
+    """
+    plane = Plane((0, 0, z), (0, 0, 1, 'v'))
+    segments = []
+    for triangle in model.triangles_at_height(z):
+        line = plane.intersect_triangle(triangle, counter_clockwise=True)
+        if (line is None) or (line.len < epsilon):
+            continue
+        segments.append((line.p1[:2], line.p2[:2]))
+    segments = numpy.array(segments, dtype=numpy.float64).reshape((-1, 2, 2))
+    directions = segments[:, 1] - segments[:, 0]
+    lengths = numpy.sqrt((directions ** 2).sum(axis=1)).reshape((-1, 1))
+    # counter-clockwise lines: the material is on the left side
+    normals = numpy.column_stack((directions[:, 1], -directions[:, 0])) \
+            / lengths
+    return segments, normals
+
+def _get_shaft_shadow(model, height):
+    """ Returns the parts of the downward facing triangles of the model
+    above the given height projected onto the xy plane (array: triangles x
+    3 x 2). The shaft of the cutter (above the rounded part of its profile)
+    must keep its distance to these triangles.
+    Material above the height without a downward facing triangle below it
+    is located above the slice at this height. Thus it is handled by the
+    slice.
+    The parts of the triangles crossing the height are clipped (one or two
+    triangles).
+    """
+    points = numpy.array([(t.p1[:3], t.p2[:3], t.p3[:3])
+            for t in model.triangles(minz=height) if t.normal[2] < -epsilon],
+            dtype=numpy.float64).reshape((-1, 3, 3))
+    above = points[:, :, 2] > height + epsilon
+    counts = above.sum(axis=1)
+    shadow = [points[counts == 3, :, :2]]
+    def cut(p1, p2):
+        """ the intersections of the edges with the plane (x, y) """
+        factors = ((height - p1[:, 2]) / (p2[:, 2] - p1[:, 2]))[:, None]
+        return (p1 + factors * (p2 - p1))[:, :2]
+    for count in (1, 2):
+        group = points[counts == count]
+        # rotate the vertices: the single vertex on its side comes first
+        first = numpy.argmax(above[counts == count] == (count == 1), axis=1)
+        order = (first[:, None] + numpy.arange(3)) % 3
+        group = group[numpy.arange(len(group))[:, None], order]
+        p1, p2, p3 = group[:, 0], group[:, 1], group[:, 2]
+        cut12, cut13 = cut(p1, p2), cut(p1, p3)
+        if count == 1:
+            shadow.append(numpy.concatenate((p1[:, None, :2],
+                    cut12[:, None], cut13[:, None]), axis=1))
+        else:
+            # the quadrangle above the plane is split into two triangles
+            shadow.append(numpy.concatenate((cut12[:, None],
+                    p2[:, None, :2], p3[:, None, :2]), axis=1))
+            shadow.append(numpy.concatenate((cut12[:, None],
+                    p3[:, None, :2], cut13[:, None]), axis=1))
+    return numpy.concatenate(shadow)
+
+def _get_convex_edges(triangles):
+    """ Returns the convex edges (array: edges x 2 x 3) of the triangles and
+    the horizontal directions of their normals: the arcs (start angle and
+    counter-clockwise turn) containing the directions from the edge towards
+    a touching cutter. Edges without a second triangle (e.g. at the border
+    of a surface) are convex in all directions. Only these edges (and their
+    vertices) can be closest to the cutter.
+    """
+    points = numpy.array([(t.p1[:3], t.p2[:3], t.p3[:3]) for t in triangles],
+            dtype=numpy.float64).reshape((-1, 3, 3))
+    normals = numpy.array([t.normal[:3] for t in triangles],
+            dtype=numpy.float64).reshape((-1, 3))
+    edges = numpy.concatenate((points[:, :, None],
+            points[:, (1, 2, 0), None]), axis=2).reshape((-1, 2, 3))
+    opposite = points[:, (2, 0, 1)].reshape((-1, 3))
+    normals = numpy.repeat(normals, 3, axis=0)
+    # the triangles share their edges (in opposite directions)
+    p1, p2 = edges[:, 0], edges[:, 1]
+    swap = (p1[:, 0] > p2[:, 0]) | ((p1[:, 0] == p2[:, 0])
+            & ((p1[:, 1] > p2[:, 1]) | ((p1[:, 1] == p2[:, 1])
+                & (p1[:, 2] > p2[:, 2]))))
+    edges[swap] = edges[swap][:, ::-1]
+    unique, inverse, counts = numpy.unique(edges.reshape((-1, 6)), axis=0,
+            return_inverse=True, return_counts=True)
+    order = numpy.argsort(inverse, kind="mergesort")
+    group_starts = numpy.cumsum(counts) - counts
+    # the pairs of triangles sharing an edge
+    is_pair = counts == 2
+    first = order[group_starts[is_pair]]
+    second = order[group_starts[is_pair] + 1]
+    # the second triangle is behind the plane of the first one
+    is_convex = ((opposite[second] - edges[first, 0])
+            * normals[first]).sum(axis=1) < -epsilon
+    first, second = first[is_convex], second[is_convex]
+    angles1 = numpy.arctan2(normals[first, 1], normals[first, 0])
+    angles2 = numpy.arctan2(normals[second, 1], normals[second, 0])
+    # the direction of a horizontal triangle is given by the other one
+    is_flat1 = (normals[first, :2] ** 2).sum(axis=1) < epsilon ** 2
+    is_flat2 = (normals[second, :2] ** 2).sum(axis=1) < epsilon ** 2
+    angles1 = numpy.where(is_flat1, angles2, angles1)
+    angles2 = numpy.where(is_flat2, angles1, angles2)
+    turns = (angles2 - angles1) % (2 * math.pi)
+    # the shorter arc between the directions
+    is_reverse = turns > math.pi
+    angles1 = numpy.where(is_reverse, angles2, angles1)
+    turns = numpy.where(is_reverse, 2 * math.pi - turns, turns)
+    turns[is_flat1 & is_flat2] = 2 * math.pi
+    others = order[group_starts[~is_pair]]
+    return (numpy.concatenate((unique[inverse[first]],
+                unique[inverse[others]])).reshape((-1, 2, 3)),
+            numpy.concatenate((angles1, numpy.zeros(len(others)))),
+            numpy.concatenate((turns,
+                numpy.zeros(len(others)) + 2 * math.pi)))
+
+def _get_side_points(model, cutter, z, tolerance):
+    """ Returns points of the model (array: points x 2) next to the rounded
+    part of the cutter (between its tip at the height "z" and the center of
+    the rounding), the width of the cutter (array) at their heights and the
+    arcs of the directions towards the cutter (see "_get_convex_edges").
+    The slices miss the vertices between their heights (e.g. the tip of a
+    pyramid pointing sideways) and the edges crossing the gap between two
+    slices. Thus the vertices and points along the edges are used. The
+    rounding of the cutter is grown by the tolerance for these points. The
+    distance of the points is chosen accordingly: the real cutter does not
+    come closer to the edge between two points.
+    """
+    flat, center, rounding = _get_cutter_shape(cutter)
+    low, high = z + center - rounding, z + center
+    triangles = model.triangles(minz=low, maxz=high)
+    if (rounding <= epsilon) or (len(triangles) == 0):
+        return numpy.zeros((0, 2)), numpy.zeros(0), numpy.zeros(0), \
+                numpy.zeros(0)
+    edges, angles, turns = _get_convex_edges(triangles)
+    # the vertices are surrounded by full circles
+    vertices = edges.reshape((-1, 3))
+    vertices = vertices[(low < vertices[:, 2]) & (vertices[:, 2] < high)]
+    if len(vertices) > 0:
+        vertices = numpy.unique(vertices, axis=0)
+    # the part of each edge between the heights
+    p1, p2 = edges[:, 0], edges[:, 1]
+    delta_z = p2[:, 2] - p1[:, 2]
+    is_flat = abs(delta_z) < epsilon
+    delta_z = numpy.where(is_flat, 1, delta_z)
+    factors1 = (low - p1[:, 2]) / delta_z
+    factors2 = (high - p1[:, 2]) / delta_z
+    is_inside = (low < p1[:, 2]) & (p1[:, 2] < high)
+    start = numpy.where(is_flat, numpy.where(is_inside, 0, 1),
+            numpy.maximum(numpy.minimum(factors1, factors2), 0))
+    end = numpy.where(is_flat, numpy.where(is_inside, 1, 0),
+            numpy.minimum(numpy.maximum(factors1, factors2), 1))
+    valid = start <= end
+    p1, p2, start, end = p1[valid], p2[valid], start[valid], end[valid]
+    angles, turns = angles[valid], turns[valid]
+    lengths = numpy.sqrt(((p2 - p1) ** 2).sum(axis=1)) * (end - start)
+    # the grown rounding touching two points along an edge keeps the
+    # distance of the real rounding from the edge between them
+    tolerance = max(tolerance, epsilon)
+    spacing = 2 * math.sqrt(tolerance * (2 * rounding + tolerance))
+    # the number of points along each part (including both ends)
+    counts = numpy.ceil(lengths / spacing - epsilon).astype(numpy.int64) + 1
+    edge_index = numpy.repeat(numpy.arange(len(p1)), counts)
+    step_index = numpy.arange(counts.sum()) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts)
+    factors = start[edge_index] + (end - start)[edge_index] * step_index \
+            / numpy.maximum(counts - 1, 1)[edge_index]
+    points = numpy.concatenate((vertices, p1[edge_index]
+            + factors[:, None] * (p2 - p1)[edge_index]))
+    angles = numpy.concatenate((numpy.zeros(len(vertices)),
+            angles[edge_index]))
+    turns = numpy.concatenate((numpy.zeros(len(vertices)) + 2 * math.pi,
+            turns[edge_index]))
+    distances = numpy.minimum(high - points[:, 2], rounding)
+    widths = flat + numpy.sqrt((rounding + tolerance) ** 2 - distances ** 2)
+    return points[:, :2], widths, angles, turns
+
+def _get_inside_triangles_mask(points, triangles, cell_size):
+    """ Check which points (array: points x 2) are inside of any of the
+    triangles (array: triangles x 3 x 2).
+    """
+    inside = numpy.zeros(len(points), dtype=bool)
+    if (len(points) == 0) or (len(triangles) == 0):
+        return inside
+    point_index, triangle_index = get_overlapping_pairs_between(points,
+            points, triangles.min(axis=1), triangles.max(axis=1), cell_size)
+    p1, p2, p3 = [triangles[triangle_index, index] for index in range(3)]
+    x, y = points[point_index, 0], points[point_index, 1]
+    det = (p2[:, 1] - p3[:, 1]) * (p1[:, 0] - p3[:, 0]) \
+            + (p3[:, 0] - p2[:, 0]) * (p1[:, 1] - p3[:, 1])
+    # triangles without an area are covered by the capsules of their edges
+    valid = abs(det) > epsilon ** 2
+    det = numpy.where(valid, det, 1)
+    a = ((p2[:, 1] - p3[:, 1]) * (x - p3[:, 0])
+            + (p3[:, 0] - p2[:, 0]) * (y - p3[:, 1])) / det
+    b = ((p3[:, 1] - p1[:, 1]) * (x - p3[:, 0])
+            + (p1[:, 0] - p3[:, 0]) * (y - p3[:, 1])) / det
+    hit = valid & (a > 0) & (b > 0) & (a + b < 1)
+    inside[point_index[hit]] = True
+    return inside
+
+def _get_polygon_edges(circle_edges):
+    """ Returns the edges (array: edges x 2 x 2) of a polygon around the
+    unit circle and the angles of their first corners.
+    """
+    step = 2 * math.pi / circle_edges
+    corner_angles = numpy.arange(circle_edges + 1) * step
+    corners = 1 / math.cos(step / 2) * numpy.column_stack((
+            numpy.cos(corner_angles), numpy.sin(corner_angles)))
+    edges = numpy.concatenate((corners[:-1, None], corners[1:, None]),
+            axis=1)
+    return edges, corner_angles[:-1]
+
+def _get_vertex_circles(points, radius, circle_edges):
+    """ Returns the edges (array: edges x 2 x 2) of polygons around the
+    unique points (array: points x 2). The edges touch a circle with the
+    given radius.
+    """
+    keys = numpy.round(points / epsilon).astype(numpy.int64)
+    order = numpy.lexsort((keys[:, 1], keys[:, 0]))
+    is_first = numpy.ones(len(points), dtype=bool)
+    is_first[1:] = (keys[order][1:] != keys[order][:-1]).any(axis=1)
+    points = points[order[is_first]]
+    edges = radius * _get_polygon_edges(circle_edges)[0]
+    return (points[:, None, None] + edges[None]).reshape((-1, 2, 2))
+
+def _get_arcs(centers, radii, angles, turns, circle_edges):
+    """ Returns the edges (array: edges x 2 x 2) of polygons around circles
+    (centers: array points x 2, radii: array). Only the edges overlapping
+    the arc of each circle from its angle counter-clockwise by its turn
+    (arrays) are used.
+    """
+    edges, edge_angles = _get_polygon_edges(circle_edges)
+    step = 2 * math.pi / circle_edges
+    # select the edges overlapping the arc of each circle
+    relative = (edge_angles[None] - angles[:, None]) % (2 * math.pi)
+    selected = (relative < turns[:, None]) \
+            | (relative > 2 * math.pi - step)
+    point_index, edge_index = numpy.nonzero(selected)
+    return centers[point_index, None] \
+            + radii[point_index, None, None] * edges[edge_index]
+
+def _get_corner_arcs(segments, normals, radius, circle_edges):
+    """ Returns the edges (array: edges x 2 x 2) of polygons around the
+    vertices of the slice (the edges touch a circle with the given radius).
+    Only the part of the circle between the normals of the adjacent
+    segments is needed at convex corners. Concave corners and the ends of
+    open polylines (e.g. at the border of a surface) are skipped.
+    """
+    keys = [tuple(key) for key in
+            numpy.round(segments.reshape((-1, 2)) / epsilon).astype(
+                    numpy.int64)]
+    next_segment = {}
+    for index in range(len(segments)):
+        next_segment[keys[2 * index]] = index
+    incoming, outgoing = [], []
+    for index in range(len(segments)):
+        following = next_segment.get(keys[2 * index + 1], None)
+        if not following is None:
+            incoming.append(index)
+            outgoing.append(following)
+    incoming = numpy.array(incoming, dtype=numpy.int64)
+    outgoing = numpy.array(outgoing, dtype=numpy.int64)
+    # the outward normals turn counter-clockwise at convex corners
+    angle1 = numpy.arctan2(normals[incoming, 1], normals[incoming, 0])
+    angle2 = numpy.arctan2(normals[outgoing, 1], normals[outgoing, 0])
+    turn = (angle2 - angle1) % (2 * math.pi)
+    is_convex = (turn > epsilon) & (turn < math.pi)
+    return _get_arcs(segments[incoming[is_convex], 1],
+            numpy.zeros(is_convex.sum()) + radius, angle1[is_convex],
+            turn[is_convex], circle_edges)
+
+def _get_interval_of_line(start, direction, value_range):
+    """ Returns the interval of factors "t" of the linear functions
+    "start + t * direction" within the given range (exclusive).
+    The interval is empty (first > second), if there is no such factor.
+    """
+    low, high = value_range
+    old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+    try:
+        factor1 = (low - start) / direction
+        factor2 = (high - start) / direction
+    finally:
+        numpy.seterr(**old_settings)
+    inside = (low < start) & (start < high)
+    parallel = direction == 0
+    first = numpy.where(parallel, numpy.where(inside, -numpy.inf, numpy.inf),
+            numpy.minimum(factor1, factor2))
+    second = numpy.where(parallel, numpy.where(inside, numpy.inf, -numpy.inf),
+            numpy.maximum(factor1, factor2))
+    return first, second
+
+def _get_covered_intervals(starts, directions, capsule_starts, capsule_ends,
+        radii):
+    """ Returns the interval of factors "t" of each line
+    ("start + t * direction") within the capsule (all points with a distance
+    below the radius from the segment) of the respective pair.
+    The interval is empty (first > second), if the line misses the capsule.
+    """
+    first = numpy.zeros(len(starts)) + numpy.inf
+    second = numpy.zeros(len(starts)) - numpy.inf
+    square_lengths = (directions ** 2).sum(axis=1)
+    # the circles around both ends of the segment
+    for center in (capsule_starts, capsule_ends):
+        offset = starts - center
+        half_b = (directions * offset).sum(axis=1)
+        c = (offset ** 2).sum(axis=1) - radii ** 2
+        discriminant = half_b ** 2 - square_lengths * c
+        hit = discriminant > 0
+        root = numpy.sqrt(numpy.maximum(discriminant, 0))
+        first = numpy.where(hit, numpy.minimum(first,
+                (-half_b - root) / square_lengths), first)
+        second = numpy.where(hit, numpy.maximum(second,
+                (-half_b + root) / square_lengths), second)
+    # the rectangle along the segment
+    axis = capsule_ends - capsule_starts
+    lengths = numpy.sqrt((axis ** 2).sum(axis=1))
+    valid = lengths > 0
+    axis = axis / numpy.where(valid, lengths, 1).reshape((-1, 1))
+    normal = numpy.column_stack((-axis[:, 1], axis[:, 0]))
+    offset = starts - capsule_starts
+    along1, along2 = _get_interval_of_line((offset * axis).sum(axis=1),
+            (directions * axis).sum(axis=1), (0, lengths))
+    across1, across2 = _get_interval_of_line((offset * normal).sum(axis=1),
+            (directions * normal).sum(axis=1), (-radii, radii))
+    rectangle1 = numpy.maximum(along1, across1)
+    rectangle2 = numpy.minimum(along2, across2)
+    # line and capsule are convex: the union of the parts is an interval
+    hit = valid & (rectangle1 < rectangle2)
+    first = numpy.where(hit, numpy.minimum(first, rectangle1), first)
+    second = numpy.where(hit, numpy.maximum(second, rectangle2), second)
+    return first, second
+
+def _get_free_parts(pieces, capsules, radii, cell_size):
+    """ Remove all parts of the pieces (array: pieces x 2 x 2) that are
+    within the capsules (array: capsules x 2 x 2) around the segments of the
+    slices.
+    Returns the remaining parts (array: parts x 2 x 2).
+    """
+    if (len(pieces) == 0) or (len(capsules) == 0):
+        return pieces
+    capsule_radii = radii.reshape((-1, 1))
+    piece_index, capsule_index = get_overlapping_pairs_between(
+            pieces.min(axis=1), pieces.max(axis=1),
+            capsules.min(axis=1) - capsule_radii,
+            capsules.max(axis=1) + capsule_radii, cell_size)
+    starts = pieces[:, 0]
+    directions = pieces[:, 1] - pieces[:, 0]
+    first, second = _get_covered_intervals(starts[piece_index],
+            directions[piece_index], capsules[capsule_index, 0],
+            capsules[capsule_index, 1], radii[capsule_index])
+    first = numpy.maximum(first, 0)
+    second = numpy.minimum(second, 1)
+    covered = first < second
+    piece_index = piece_index[covered]
+    first, second = first[covered], second[covered]
+    # Merge the covered intervals of each piece: the running maximum of the
+    # ends is calculated for all pieces at once (the intervals of each piece
+    # are shifted to separate ranges).
+    order = numpy.lexsort((first, piece_index))
+    piece_index = piece_index[order]
+    first = first[order] + 2 * piece_index
+    second = numpy.maximum.accumulate(second[order] + 2 * piece_index)
+    is_first = numpy.ones(len(piece_index), dtype=bool)
+    is_first[1:] = piece_index[1:] != piece_index[:-1]
+    is_last = numpy.ones(len(piece_index), dtype=bool)
+    is_last[:-1] = is_first[1:]
+    # the free parts: gaps between covered intervals, before the first and
+    # after the last interval and pieces without any covered interval
+    gap_starts = numpy.concatenate((second[:-1][~is_first[1:]],
+            2.0 * piece_index[is_first], second[is_last],
+            2.0 * numpy.setdiff1d(numpy.arange(len(pieces)), piece_index)))
+    gap_ends = numpy.concatenate((first[1:][~is_first[1:]], first[is_first],
+            2.0 * piece_index[is_last] + 1,
+            2.0 * numpy.setdiff1d(numpy.arange(len(pieces)), piece_index) + 1))
+    owners = numpy.floor(gap_starts / 2).astype(numpy.int64)
+    gap_starts -= 2 * owners
+    gap_ends -= 2 * owners
+    lengths = numpy.sqrt((directions[owners] ** 2).sum(axis=1))
+    valid = (gap_ends - gap_starts) * lengths > epsilon
+    owners = owners[valid]
+    gap_starts = gap_starts[valid].reshape((-1, 1))
+    gap_ends = gap_ends[valid].reshape((-1, 1))
+    return numpy.concatenate((
+            (starts[owners] + gap_starts * directions[owners])[:, None],
+            (starts[owners] + gap_ends * directions[owners])[:, None]), axis=1)
+
+def _get_nearest_crossings(points, segments, normals, cell_size):
+    """ Send rays from each point along both directions of the x axis.
+    Returns the distance to the nearest crossed segment (infinite, if there
+    is none) and whether the ray leaves the material there.
+    """
+    nearest = numpy.zeros(len(points)) + numpy.inf
+    leaving = numpy.zeros(len(points), dtype=bool)
+    # only the y position is relevant: the grid is collapsed along x
+    point_boxes = numpy.column_stack((numpy.zeros(len(points)),
+            points[:, 1]))
+    segment_mins = numpy.column_stack((numpy.zeros(len(segments)),
+            segments[:, :, 1].min(axis=1)))
+    segment_maxs = numpy.column_stack((numpy.zeros(len(segments)),
+            segments[:, :, 1].max(axis=1)))
+    point_index, segment_index = get_overlapping_pairs_between(point_boxes,
+            point_boxes, segment_mins, segment_maxs, cell_size)
+    x, y = points[point_index, 0], points[point_index, 1]
+    start = segments[segment_index, 0]
+    end = segments[segment_index, 1]
+    crossing = (start[:, 1] > y) != (end[:, 1] > y)
+    old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+    try:
+        cross_x = start[:, 0] + (y - start[:, 1]) \
+                * (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+    finally:
+        numpy.seterr(**old_settings)
+    point_index = point_index[crossing]
+    segment_index = segment_index[crossing]
+    distances = cross_x[crossing] - x[crossing]
+    order = numpy.lexsort((abs(distances), point_index))
+    point_index = point_index[order]
+    segment_index = segment_index[order]
+    distances = distances[order]
+    is_first = numpy.ones(len(point_index), dtype=bool)
+    is_first[1:] = point_index[1:] != point_index[:-1]
+    point_index = point_index[is_first]
+    nearest[point_index] = abs(distances[is_first])
+    leaving[point_index] = (normals[segment_index[is_first], 0] > 0) \
+            == (distances[is_first] > 0)
+    return nearest, leaving
+
+def _is_inside_model(model, x, y, z):
+    """ Check if the point is inside of the material: the nearest triangle
+    above the point must face upwards.
+    """
+    nearest = None
+    for triangle in model.triangles(minx=x, miny=y, minz=z, maxx=x, maxy=y):
+        normal = triangle.normal
+        if abs(normal[2]) < epsilon:
+            continue
+        p1, p2, p3 = triangle.p1, triangle.p2, triangle.p3
+        # barycentric check (projected to the xy plane)
+        det = (p2[1] - p3[1]) * (p1[0] - p3[0]) \
+                + (p3[0] - p2[0]) * (p1[1] - p3[1])
+        if abs(det) < epsilon ** 2:
+            continue
+        a = ((p2[1] - p3[1]) * (x - p3[0]) + (p3[0] - p2[0]) * (y - p3[1])) \
+                / det
+        b = ((p3[1] - p1[1]) * (x - p3[0]) + (p1[0] - p3[0]) * (y - p3[1])) \
+                / det
+        if (a < 0) or (b < 0) or (a + b > 1):
+            continue
+        height = p1[2] - (normal[0] * (x - p1[0]) + normal[1] * (y - p1[1])) \
+                / normal[2]
+        if (height > z) and ((nearest is None) or (height < nearest[0])):
+            nearest = (height, normal[2] > 0)
+    return (not nearest is None) and nearest[1]
+
+def _get_inside_mask(points, slices, model, cell_size):
+    """ Check which points are inside of any of the slices (tuples of
+    height, segments and outward normals).
+    Rays from each point are sent along both axes. The point is inside, if
+    the ray leaves the material at the nearest crossed segment. Thus open
+    polylines (e.g. the slices of a surface) are handled, too. Points
+    without any crossed segment (e.g. between the open slices of a surface)
+    are checked against the triangles above.
+    """
+    inside = numpy.zeros(len(points), dtype=bool)
+    if len(points) == 0:
+        return inside
+    for height, segments, normals in slices:
+        if len(segments) == 0:
+            nearest_x = nearest_y = numpy.zeros(len(points)) + numpy.inf
+            inside_slice = numpy.zeros(len(points), dtype=bool)
+        else:
+            nearest_x, leaving_x = _get_nearest_crossings(points, segments,
+                    normals, cell_size)
+            # the rays along the y axis: swap the coordinates
+            nearest_y, leaving_y = _get_nearest_crossings(points[:, ::-1],
+                    segments[:, :, ::-1], normals[:, ::-1], cell_size)
+            inside_slice = numpy.where(nearest_x <= nearest_y, leaving_x,
+                    leaving_y)
+        undecided = numpy.isinf(nearest_x) & numpy.isinf(nearest_y) \
+                & ~inside
+        for index in numpy.nonzero(undecided)[0]:
+            inside_slice[index] = _is_inside_model(model, points[index, 0],
+                    points[index, 1], height)
+        inside |= inside_slice
+    return inside
+
+def _get_polylines(parts):
+    """ Combine the parts (array: parts x 2 x 2) with common end points into
+    polylines.
+    """
+    keys = [tuple(key) for key in
+            numpy.round(parts.reshape((-1, 2)) / epsilon).astype(numpy.int64)]
+    ends_by_key = {}
+    for index, key in enumerate(keys):
+        ends_by_key.setdefault(key, []).append(index)
+    used = numpy.zeros(len(parts), dtype=bool)
+    polylines = []
+    def walk(end):
+        """ follow the parts connected to the given end point """
+        points = []
+        while True:
+            for other_end in ends_by_key[keys[end]]:
+                if not used[other_end // 2]:
+                    break
+            else:
+                return points
+            used[other_end // 2] = True
+            # continue with the opposite end of the part
+            end = other_end ^ 1
+            points.append(parts[end // 2, end % 2])
+    for index in range(len(parts)):
+        if used[index]:
+            continue
+        used[index] = True
+        forward = walk(2 * index + 1)
+        backward = walk(2 * index)
+        backward.reverse()
+        polylines.append(backward + [parts[index, 0], parts[index, 1]]
+                + forward)
+    return polylines
+
+def _process_layer((z, models, cutter, profile, circle_edges, tolerance,
+        flat_heights)):
+    """ calculate the waterlines of one layer
+
+    The first model is used for the waterline. All other models are
+    obstacles (e.g. a support grid).
+    Returns a list of moves.
+    """
+    model = models[0]
+    flat, center, rounding = _get_cutter_shape(cutter)
+    profile = list(profile)
+    for flat_height in flat_heights:
+        height = flat_height - z
+        if center - rounding < height < center:
+            profile.append((height, get_cutter_width(cutter, height)))
+    slices = []
+    pieces = []
+    capsules = []
+    radii = []
+    for height, width in profile:
+        segments, normals = _get_slice(model, z + height)
+        slices.append((z + height, segments, normals))
+        if len(segments) == 0:
+            continue
+        # the slice at the tip of a spherical cutter is moved slightly, too
+        width = max(width, 2 * epsilon)
+        # the segments of the slice are moved outwards by the cutter radius
+        shift = (width * normals)[:, None]
+        pieces.append(segments + shift)
+        # arcs around the vertices of the slice fill the gaps between the
+        # moved segments
+        pieces.append(_get_corner_arcs(segments, normals, width,
+                circle_edges))
+        capsules.append(segments)
+        # keep a small margin: a moved segment touches its own capsule
+        radii.append(numpy.zeros(len(segments)) + width - epsilon)
+    if not pieces:
+        return []
+    # the cutter keeps its distance to the vertices and edges between the
+    # slices
+    points, widths, angles, turns = _get_side_points(model, cutter, z,
+            tolerance)
+    if len(points) > 0:
+        pieces.append(_get_arcs(points, widths, angles, turns,
+                circle_edges))
+        capsules.append(numpy.concatenate((points[:, None],
+                points[:, None]), axis=1))
+        radii.append(widths - epsilon)
+    # The shaft of the cutter (above the rounded part) must not touch any
+    # material above (e.g. overhangs). The outline of the shadow of this
+    # material is moved outwards like the slices.
+    shadow = _get_shaft_shadow(model, z + center)
+    if len(shadow) > 0:
+        shaft_width = flat + rounding
+        edges = numpy.concatenate([shadow[:, (index, (index + 1) % 3)]
+                for index in range(3)])
+        directions = edges[:, 1] - edges[:, 0]
+        lengths = numpy.sqrt((directions ** 2).sum(axis=1))
+        edges = edges[lengths > epsilon]
+        directions = directions[lengths > epsilon]
+        lengths = lengths[lengths > epsilon].reshape((-1, 1))
+        shift = (shaft_width / lengths * numpy.column_stack((
+                directions[:, 1], -directions[:, 0])))[:, None]
+        pieces.extend((edges + shift, edges - shift))
+        # circles around the vertices
+        pieces.append(_get_vertex_circles(shadow.reshape((-1, 2)),
+                shaft_width, circle_edges))
+        capsules.append(edges)
+        radii.append(numpy.zeros(len(edges)) + shaft_width - epsilon)
+    pieces = numpy.concatenate(pieces)
+    capsules = numpy.concatenate(capsules)
+    radii = numpy.concatenate(radii)
+    # the grid cells should contain the capsules of a few adjacent segments
+    cell_size = 2 * radii.max() + numpy.sqrt(((capsules[:, 1]
+            - capsules[:, 0]) ** 2).sum(axis=1)).mean()
+    parts = _get_free_parts(pieces, capsules, radii, cell_size)
+    # Every remaining part is either completely inside or outside of each
+    # slice (otherwise it would cross a capsule). Check its center.
+    centers = parts.mean(axis=1)
+    parts = parts[~(_get_inside_mask(centers, slices, model, cell_size)
+            | _get_inside_triangles_mask(centers, shadow, cell_size))]
+    moves = []
+    for polyline in _get_polylines(parts):
+        points = [(x, y, z) for x, y in polyline]
+        pairs = [(points[index], points[index + 1])
+                for index in range(len(points) - 1)]
+        if len(models) > 1:
+            pairs_free_points = get_free_paths_triangles_lines(models[1:],
+                    cutter, pairs)
+        else:
+            pairs_free_points = [pair for pair in pairs]
+        # keep uninterrupted parts of the polyline connected
+        is_connected = False
+        for pair, free_points in zip(pairs, pairs_free_points):
+            if (len(free_points) == 2) and (tuple(free_points[0]) == pair[0]) \
+                    and (tuple(free_points[1]) == pair[1]):
+                if not is_connected:
+                    moves.append((MOVE_STRAIGHT, pair[0]))
+                moves.append((MOVE_STRAIGHT, pair[1]))
+                is_connected = True
+                continue
+            if is_connected:
+                moves.append((MOVE_SAFETY, None))
+                is_connected = False
+            for index in range(len(free_points) / 2):
+                moves.append((MOVE_STRAIGHT, free_points[2 * index]))
+                moves.append((MOVE_STRAIGHT, free_points[2 * index + 1]))
+                moves.append((MOVE_SAFETY, None))
+        if is_connected:
+            moves.append((MOVE_SAFETY, None))
+    return moves
+
+
+class WaterlineSlicer(object):
+    """ Calculate waterlines by slicing the model instead of pushing the
+    cutter along a grid of lines.
+
+    For each layer the model is sliced at a few heights along the cutter's
+    profile. The segments of every slice are moved outwards by the width of
+    the cutter at this height. Circles around the vertices fill the gaps.
+    All parts being closer to a slice than the width of the cutter (at the
+    height of the slice) or inside of a slice are removed. The vertices and
+    edges of the model between the slices are handled separately.
+    Only the triangles crossing a slice are visited. The shaft of the cutter
+    (above the rounded part of its profile) keeps its distance to the
+    projection of all triangles above it. Thus overhangs are not gouged.
+    The profile of the cutter and the circles are approximated by polygons
+    around them. Thus the waterline is not too close to the model (apart
+    from tiny parts of the triangles next to the vertices and edges between
+    the slices), but it may be too far away by the tolerance.
+    """
+
+    def __init__(self, tolerance=None):
+        """
+        @value tolerance: the maximum deviation of the waterline from the
+            exact distance to the model (default: see TOLERANCE_FACTOR)
+        """
+        self.tolerance = tolerance
+        log.debug("Starting WaterlineSlicer")
+
+    def GenerateToolPath(self, cutter, models, motion_grid, minz=None,
+            maxz=None, draw_callback=None):
+        """ Only the height of each layer of the motion grid is used. """
+        heights = []
+        for layer in motion_grid:
+            for line in layer:
+                for point in line:
+                    z = point[2]
+                    break
+                else:
+                    continue
+                break
+            else:
+                continue
+            if not heights or (abs(heights[-1] - z) > epsilon):
+                heights.append(z)
+        if not models:
+            return []
+        progress_counter = ProgressCounter(len(heights), draw_callback)
+        # the deviations of the profile (or of the points along the edges)
+        # and of the polygons around the circles add up
+        tolerance = 0.5 * get_tolerance(cutter, self.tolerance)
+        profile = get_cutter_profile(cutter, tolerance=tolerance)
+        circle_edges = get_circle_edges(cutter, tolerance=tolerance)
+        flat_heights = _get_flat_heights(models[0])
+        args = [(z, models, cutter, profile, circle_edges, tolerance,
+                flat_heights) for z in heights]
+        path = []
+        current_layer = 0
+        for moves in run_in_parallel(_process_layer, args,
+                callback=progress_counter.update):
+            path.extend(moves)
+            current_layer += 1
+            if draw_callback and draw_callback(text="WaterlineSlicer: " \
+                        + "processed layer %d/%d" % (current_layer,
+                                len(heights))):
+                # cancel immediately
+                break
+            if progress_counter.increment():
+                # quit requested
+                break
+        return path
@@ -21,109 +21,115 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-__all__ = ["DropCutter", "PushCutter", "EngraveCutter", "ContourFollow"]
+__all__ = ["DropCutter", "PushCutter", "EngraveCutter", "ContourFollow",
+        "WaterlineSlicer"]
 
 from pycam.Geometry.utils import INFINITE, epsilon, sqrt
 from pycam.Geometry.PointUtils import *
 import pycam.Utils.threading
+import pycam.Utils.log
 
+import numpy
 
-class Hit(object):
-    def __init__(self, cl, cp, t, d, direction):
-        self.cl = cl
-        self.cp = cp
-        self.t = t
-        self.d = d
-        self.dir = direction
-        self.z = -INFINITE
 
-    def __repr__(self):
-        return "%s - %s - %s - %s" % (self.d, self.cl, self.dir, self.cp)
+log = pycam.Utils.log.get_logger()
 
 
 def get_free_paths_triangles(models, cutter, p1, p2, return_triangles=False):
     if (len(models) == 0) or ((len(models) == 1) and (models[0] is None)):
         return (p1, p2)
-    elif len(models) == 1:
-        # only one model is left - just continue
-        model = models[0]
-    else:
-        # multiple models were given - process them in layers
-        result = get_free_paths_triangles(models[:1], cutter, p1, p2,
-                return_triangles)
-        # group the result into pairs of two points (start/end)
-        point_pairs = []
-        while result:
-            pair1 = result.pop(0)
-            pair2 = result.pop(0)
-            point_pairs.append((pair1, pair2))
-        all_results = []
-        for pair in point_pairs:
-            one_result = get_free_paths_triangles(models[1:], cutter, pair[0],
-                    pair[1], return_triangles)
-            all_results.extend(one_result)
-        return all_results
+    return get_free_paths_triangles_lines(models, cutter, [(p1, p2)],
+            return_triangles=return_triangles)[0]
+
+def get_free_paths_triangles_lines(models, cutter, lines,
+        return_triangles=False):
+    """ Calculate the free paths (see "get_free_paths_triangles") of
+    multiple lines. The candidate triangles of all lines are collected at
+    once. This is much cheaper for parallel lines (e.g. the scanlines of a
+    PushCutter layer) than one spatial query for each line.
+    The hits of all models (e.g. a model and its support grid) are merged
+    along each line. Thus the free intervals of all models are intersected
+    in a single pass.
+    """
+    models = [model for model in models if not model is None]
+    if not models:
+        return [(p1, p2) for p1, p2 in lines]
+    # triangles below the lowest point of the cutter can't be hit
+    minz = [min(p1[2], p2[2]) - cutter.get_required_distance()
+            for p1, p2 in lines]
+    # one list of triangles for each model and line
+    all_triangles = [model.triangles_along_lines(lines,
+            radius=cutter.distance_radius, minz=minz, maxz=INFINITE)
+            for model in models]
+    result = []
+    for index, (p1, p2) in enumerate(lines):
+        triangle_groups = [triangles[index] for triangles in all_triangles]
+        result.append(_get_free_paths_of_triangles(triangle_groups, cutter,
+                p1, p2, return_triangles))
+    return result
 
+def _get_free_paths_of_triangles(triangle_groups, cutter, p1, p2,
+        return_triangles=False):
+    """ Every group of triangles (usually a model) is a separate obstacle.
+    A position is free, if it is outside of all groups.
+    """
     backward = pnormalized(psub(p1, p2))
     forward = pnormalized(psub(p2, p1))
     xyz_dist = pdist(p2, p1)
 
-    minx = min(p1[0], p2[0])
-    maxx = max(p1[0], p2[0])
-    miny = min(p1[1], p2[1])
-    maxy = max(p1[1], p2[1])
-    minz = min(p1[2], p2[2])
-
-    # find all hits along scan line
+    # find all hits along scan line: (distance, is_forward, group, cl, t, cp)
     hits = []
-
-    triangles = model.triangles(minx - cutter.distance_radius,
-            miny - cutter.distance_radius, minz, maxx + cutter.distance_radius,
-            maxy + cutter.distance_radius, INFINITE)
-
-    for t in triangles:
-        (cl1, d1, cp1) = cutter.intersect(backward, t, start=p1)
-        if cl1:
-            hits.append(Hit(cl1, cp1, t, -d1, backward))
-        (cl2, d2, cp2) = cutter.intersect(forward, t, start=p1)
-        if cl2:
-            hits.append(Hit(cl2, cp2, t, d2, forward))
+    for group, triangles in enumerate(triangle_groups):
+        for t in triangles:
+            (cl1, d1, cp1) = cutter.intersect(backward, t, start=p1)
+            if cl1:
+                hits.append((-d1, False, group, cl1, t, cp1))
+            (cl2, d2, cp2) = cutter.intersect(forward, t, start=p1)
+            if cl2:
+                hits.append((d2, True, group, cl2, t, cp2))
 
     # sort along the scan direction
-    hits.sort(key=lambda h: h.d)
+    hits.sort(key=lambda hit: hit[0])
 
-    count = 0
+    counters = [0] * len(triangle_groups)
+    # number of groups with a positive counter
+    blocking = 0
     points = []
-    for h in hits:
-        if h.dir == forward:
-            if count == 0:
-                if -epsilon <= h.d <= xyz_dist + epsilon:
+    for d, is_forward, group, cl, t, cp in hits:
+        count = counters[group]
+        if is_forward:
+            if (count == 0) and (blocking == 0):
+                if -epsilon <= d <= xyz_dist + epsilon:
                     if len(points) == 0:
                         points.append((p1, None, None))
-                    points.append((h.cl, h.t, h.cp))
-            count += 1
+                    points.append((cl, t, cp))
+            if count == 0:
+                blocking += 1
+            counters[group] = count + 1
         else:
+            if (count == 1) and (blocking == 1):
+                if -epsilon <= d <= xyz_dist + epsilon:
+                    points.append((cl, t, cp))
             if count == 1:
-                if -epsilon <= h.d <= xyz_dist + epsilon:
-                    points.append((h.cl, h.t, h.cp))
-            count -= 1
+                blocking -= 1
+            counters[group] = count - 1
 
     if len(points) % 2 == 1:
         points.append((p2, None, None))
 
     if len(points) == 0:
-        # check if the path is completely free or if we are inside of the model
-        inside_counter = 0
-        for h in hits:
-            if -epsilon <= h.d:
-                # we reached the outer limit of the model
+        # check if the path is completely free or if we are inside of a model
+        inside_counters = [0] * len(triangle_groups)
+        for d, is_forward, group, cl, t, cp in hits:
+            if -epsilon <= d:
+                # we reached the outer limit of the models
                 break
-            if h.dir == forward:
-                inside_counter += 1
+            if is_forward:
+                inside_counters[group] += 1
             else:
-                inside_counter -= 1
-        if inside_counter <= 0:
-            # we are not inside of the model
+                inside_counters[group] -= 1
+        if max(inside_counters) <= 0:
+            # we are not inside of any model
             points.append((p1, None, None))
             points.append((p2, None, None))
 
@@ -233,14 +239,15 @@ def get_max_height_triangles(model, cutter, x, y, minz, maxz):
     box_x_max = cutter.get_maxx(p)
     box_y_min = cutter.get_miny(p)
     box_y_max = cutter.get_maxy(p)
-    box_z_min = minz
-    box_z_max = maxz
+    # Triangles above "maxz" are required for detecting collisions with the
+    # upper limit. Triangles below "minz" can't raise the cutter above minz.
+    box_z_min = minz - cutter.get_required_distance()
+    box_z_max = INFINITE
     triangles = model.triangles(box_x_min, box_y_min, box_z_min, box_x_max,
             box_y_max, box_z_max)
-    for t in triangles:
-        cut = cutter.drop(t, start=p)
-        if cut and ((height_max is None) or (cut[2] > height_max)):
-            height_max = cut[2]
+    cut = cutter.drop_triangles(triangles, start=p)
+    if cut:
+        height_max = cut[2]
     # don't do a complete boundary check for the height
     # this avoids zero-cuts for models that exceed the bounding box height
     if (height_max is None) or (height_max < minz + epsilon):
@@ -250,56 +257,119 @@ def get_max_height_triangles(model, cutter, x, y, minz, maxz):
     else:
         return (x, y, height_max)
 
-def _check_deviance_of_adjacent_points(p1, p2, p3, min_distance):
-    straight = psub(p3, p1)
-    added = pdist(p2, p1) + pdist(p3, p2)
-    # compare only the x/y distance of p1 and p3 with min_distance
-    if straight[0] ** 2 + straight[1] ** 2 < min_distance ** 2:
-        # the points are too close together
-        return True
-    else:
+def _get_bent_triples(points, valid, min_distance, tolerance=None):
+    """ Check all triples of consecutive points for being "flat".
+    Returns a boolean array with one item for each triple (starting at the
+    respective point) that should be refined.
+    """
+    p1, p2, p3 = points[:-2], points[1:-1], points[2:]
+    straight = p3 - p1
+    straight_length = numpy.sqrt((straight ** 2).sum(axis=1))
+    if tolerance is None:
         # allow 0.1% deviance - this is an angle of around 2 degrees
-        return (added / pnorm(straight)) < 1.001
+        added = numpy.sqrt(((p2 - p1) ** 2).sum(axis=1)) \
+                + numpy.sqrt(((p3 - p2) ** 2).sum(axis=1))
+        bent = added >= 1.001 * straight_length
+    else:
+        # distance of the middle point from the chord of its neighbours
+        cross = numpy.cross(p2 - p1, straight)
+        deviance = numpy.sqrt((cross ** 2).sum(axis=1))
+        bent = deviance > tolerance * straight_length
+    # compare only the x/y distance of p1 and p3 with min_distance
+    far_enough = (straight[:, 0] ** 2 + straight[:, 1] ** 2) \
+            >= min_distance ** 2
+    return bent & far_enough & valid[:-2] & valid[1:-1] & valid[2:]
 
-def get_max_height_dynamic(model, cutter, positions, minz, maxz, physics=None):
-    max_depth = 8
-    # the points don't need to get closer than 1/1000 of the cutter radius
-    min_distance = cutter.distance_radius / 1000
+def get_max_height_adaptive(get_max_heights, positions, min_distance,
+        tolerance=None, max_depth=8):
+    """ Calculate the heights of a line of positions and refine the line
+    where the surface is not flat.
+
+    Every pass checks all triples of adjacent points at once and splits both
+    intervals of every bent triple in the middle. All new midpoints of a pass
+    are handed over to "get_max_heights" in a single call.
+
+    @param get_max_heights: function returning a list of points (or None for
+        positions exceeding the upper limit) for a list of (x, y) positions
+    @param min_distance: the points don't get closer than this (x/y)
+    @param tolerance: maximum distance of a point from the chord between
+        its neighbours - by default a small angular deviance is accepted
+    @param max_depth: maximum number of splits of an original interval
+    @return: a tuple of the list of points and the number of added points
+    """
+    if len(positions) == 0:
+        return [], 0
+    xy = numpy.array([p[:2] for p in positions], dtype=numpy.float64)
+    def get_heights(coords):
+        heights = numpy.empty(len(coords), dtype=numpy.float64)
+        for index, point in enumerate(get_max_heights(coords)):
+            heights[index] = numpy.nan if point is None else point[2]
+        return heights
+    heights = get_heights([tuple(p) for p in xy])
+    # number of splits that lead to each interval
+    levels = numpy.zeros(len(xy) - 1, dtype=numpy.intp)
+    added_count = 0
+    while len(xy) > 2:
+        valid = numpy.logical_not(numpy.isnan(heights))
+        points = numpy.column_stack((xy, numpy.where(valid, heights, 0)))
+        bent = _get_bent_triples(points, valid, min_distance,
+                tolerance=tolerance)
+        refine = numpy.zeros(len(levels), dtype=bool)
+        refine[:-1] |= bent
+        refine[1:] |= bent
+        refine &= levels < max_depth
+        splits = numpy.nonzero(refine)[0]
+        if len(splits) == 0:
+            break
+        middles = (xy[splits] + xy[splits + 1]) / 2
+        new_heights = get_heights([tuple(p) for p in middles])
+        # both halves of a split interval share its new level
+        levels[splits] += 1
+        xy = numpy.insert(xy, splits + 1, middles, axis=0)
+        heights = numpy.insert(heights, splits + 1, new_heights)
+        levels = numpy.insert(levels, splits + 1, levels[splits])
+        added_count += len(splits)
     result = []
-    if physics:
-        get_max_height = lambda x, y: get_max_height_ode(physics, x, y, minz,
-                maxz)
+    for (x, y), z in zip(xy, heights):
+        if numpy.isnan(z):
+            result.append(None)
+        else:
+            result.append((float(x), float(y), float(z)))
+    return result, added_count
+
+def get_max_heights_function(model, cutter, minz, maxz, physics=None):
+    """ Returns a function calculating the cutter locations (or None for
+    positions exceeding "maxz") for a list of (x, y) positions.
+    """
+    if hasattr(physics, "get_max_heights"):
+        # vectorized calculation (see pycam.Physics.numpy_physics)
+        get_max_heights = lambda coords: physics.get_max_heights(coords,
+                minz, maxz)
     else:
-        get_max_height = lambda x, y: get_max_height_triangles(model, cutter,
-                x, y, minz, maxz)
-    # add one point between all existing points
-    for index in range(len(positions)):
-        p = positions[index]
-        result.append(get_max_height(p[0], p[1]))
-    # Check if three consecutive points are "flat".
-    # Add additional points if necessary.
-    index = 0
-    depth_count = 0
-    while index < len(result) - 2:
-        p1 = result[index]
-        p2 = result[index + 1]
-        p3 = result[index + 2]
-        if (not p1 is None) and (not p2 is None) and (not p3 is None) and \
-                not _check_deviance_of_adjacent_points(p1, p2, p3,
-                    min_distance) and \
-                (depth_count < max_depth):
-            # distribute the new point two before the middle and one after
-            if depth_count % 3 != 2:
-                # insert between the 1st and 2nd point
-                middle = ((p1[0] + p2[0]) / 2, (p1[1] + p2[1]) / 2)
-                result.insert(index + 1, get_max_height(middle[0], middle[1]))
-            else:
-                # insert between the 2nd and 3rd point
-                middle = ((p2[0] + p3[0]) / 2, (p2[1] + p3[1]) / 2)
-                result.insert(index + 2, get_max_height(middle[0], middle[1]))
-            depth_count += 1
+        if physics:
+            get_max_height = lambda x, y: get_max_height_ode(physics, x, y,
+                    minz, maxz)
         else:
-            index += 1
-            depth_count = 0
-    return result
+            get_max_height = lambda x, y: get_max_height_triangles(model,
+                    cutter, x, y, minz, maxz)
+        get_max_heights = lambda coords: [get_max_height(x, y)
+                for x, y in coords]
+    return get_max_heights
+
+def get_max_height_dynamic(model, cutter, positions, minz, maxz, physics=None,
+        tolerance=None):
+    """ Calculate the cutter locations along a line of positions. Additional
+    points are added where the surface is not flat (see
+    "get_max_height_adaptive").
+
+    @value tolerance: maximum distance of a point from the chord between its
+        neighbours (see "get_max_height_adaptive")
+    @returns: a tuple of the list of points and the number of added points
+    """
+    # the points don't need to get closer than 1/1000 of the cutter radius
+    min_distance = cutter.distance_radius / 1000
+    get_max_heights = get_max_heights_function(model, cutter, minz, maxz,
+            physics=physics)
+    return get_max_height_adaptive(get_max_heights, positions, min_distance,
+            tolerance=tolerance)
 
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+""" Cached raster of cutter locations
+
+The heights of a cutter dropped onto a model (the cutter location surface)
+are calculated once for a regular grid of positions. Later drop cutter
+queries with the same model and the same cutter (shape, size and material
+allowance) interpolate between the grid nodes. Positions in bent parts of
+the surface (edges, steps, narrow curves) are calculated exactly instead.
+
+Alternatively the raster is calculated without any drop: the triangles are
+rasterized into a z-buffer and the inverted cutter is swept over it
+("inverse_tool"). An upper limit of the heights is calculated in the same
+way. Positions next to nodes whose height may be too low are calculated
+exactly, too.
+
+The rasters are kept in memory and in the disk cache (see
+pycam.Utils.DiskCache) - keyed by the content hash of the model.
+"""
+
+from pycam.Geometry.utils import epsilon, INFINITE
+from pycam.PathGenerators import get_max_heights_function
+from pycam.Simulation.ZBuffer import get_triangle_heights, \
+        MAX_PAIRS_PER_STEP
+import pycam.Utils.DiskCache
+import pycam.Utils.log
+import numpy
+import hashlib
+import copy
+
+
+log = pycam.Utils.log.get_logger()
+
+# the number of rasters that are kept in memory
+MEMORY_CACHE_SIZE = 4
+
+
+_memory_cache = []
+
+def get_height_map(model, cutter, physics=None, cell_size=None,
+        tolerance=None, inverse_tool=False, callback=None):
+    """ Returns the height map of the model and the cutter. The raster is
+    taken from the cache or calculated (and cached).
+
+    @value physics: the engine for the exact calculations (see
+        "pycam.PathGenerators.get_max_heights_function")
+    @value cell_size: the distance between the nodes of the raster - by
+        default a quarter of the cutter radius (1/16 for "inverse_tool")
+    @value tolerance: the maximum estimated deviance of interpolated heights
+        - by default 1/1000 of the cutter radius
+    @value inverse_tool: calculate the raster by sweeping the inverted
+        cutter over the rasterized model (see
+        "HeightMap.calculate_inverse_tool_raster")
+    @value callback: function to call after each line of the raster. It
+        should return True if the user interrupted the operation.
+    @returns: the height map or None (if the operation was interrupted)
+    """
+    if cell_size is None:
+        if inverse_tool:
+            cell_size = cutter.distance_radius / 16
+        else:
+            cell_size = cutter.distance_radius / 4
+    cell_size = float(cell_size)
+    height_map = HeightMap(model, cutter, physics=physics,
+            tolerance=tolerance)
+    cutter_key = (cutter.__class__.__name__, float(cutter.radius),
+            float(getattr(cutter, "minorradius", 0)),
+            float(cutter.get_required_distance()))
+    name = "height_map-%s" % hashlib.sha1(repr((cutter_key,
+            cell_size, bool(inverse_tool)))).hexdigest()
+    key = (model.uuid, name)
+    for cached_key, raster in _memory_cache:
+        if cached_key == key:
+            height_map.set_raster(raster)
+            return height_map
+    raster = pycam.Utils.DiskCache.get_cache().get(model.uuid, name)
+    if raster is None:
+        if inverse_tool:
+            raster = height_map.calculate_inverse_tool_raster(cell_size,
+                    callback=callback)
+        else:
+            raster = height_map.calculate_raster(cell_size,
+                    callback=callback)
+        if raster is None:
+            return None
+        pycam.Utils.DiskCache.get_cache().set(model.uuid, name, raster)
+    _memory_cache.insert(0, (key, raster))
+    del _memory_cache[MEMORY_CACHE_SIZE:]
+    height_map.set_raster(raster)
+    return height_map
+
+
+def _add_shifted_heights(target, source, dx, dy, offset):
+    """ raise the target heights to the source heights at the nodes (or
+    cells) shifted by (dx, dy) plus the offset
+    """
+    rows = min(target.shape[0], source.shape[0] - dy) - max(0, -dy)
+    columns = min(target.shape[1], source.shape[1] - dx) - max(0, -dx)
+    if (rows <= 0) or (columns <= 0):
+        return
+    target = target[max(0, -dy):max(0, -dy) + rows,
+            max(0, -dx):max(0, -dx) + columns]
+    source = source[max(0, dy):max(0, dy) + rows,
+            max(0, dx):max(0, dx) + columns]
+    numpy.maximum(target, source + offset, out=target)
+
+def _get_cell_limits(points, xs, ys, minz):
+    """ Returns the upper limit of the height of the triangles within each
+    cell of the raster (array: rows - 1 x columns - 1) - or "minz" (without
+    a triangle). A triangle within a cell is not higher than its plane at
+    the corners of the cell and not higher than its highest vertex.
+
+    @value points: array (triangles x 3 x 3) of the vertices of the triangles
+    @value xs: increasing x coordinates of the columns of the raster
+    @value ys: increasing y coordinates of the rows of the raster
+    """
+    limits = numpy.zeros((len(ys) - 1, len(xs) - 1)) + minz
+    if len(points) == 0:
+        return limits
+    mins = points.min(axis=1)
+    maxs = points.max(axis=1)
+    # the cells overlapping the bounding box of each triangle
+    x_start = numpy.maximum(0, numpy.searchsorted(xs, mins[:, 0]) - 1)
+    x_end = numpy.minimum(len(xs) - 1,
+            numpy.searchsorted(xs, maxs[:, 0], side="right"))
+    y_start = numpy.maximum(0, numpy.searchsorted(ys, mins[:, 1]) - 1)
+    y_end = numpy.minimum(len(ys) - 1,
+            numpy.searchsorted(ys, maxs[:, 1], side="right"))
+    columns = numpy.maximum(0, x_end - x_start)
+    counts = columns * numpy.maximum(0, y_end - y_start)
+    # the gradient of the planes (vertical triangles: infinite)
+    normals = numpy.cross(points[:, 1] - points[:, 0],
+            points[:, 2] - points[:, 0])
+    vertical = abs(normals[:, 2]) < epsilon ** 2
+    old_settings = numpy.seterr(divide="ignore", invalid="ignore")
+    try:
+        slope_x = numpy.where(vertical, 0, -normals[:, 0] / normals[:, 2])
+        slope_y = numpy.where(vertical, 0, -normals[:, 1] / normals[:, 2])
+    finally:
+        numpy.seterr(**old_settings)
+    origins = points[:, 0]
+    # process groups of triangles with a limited number of cells
+    group_start = 0
+    cumulated = numpy.cumsum(counts)
+    while group_start < len(counts):
+        group_end = numpy.searchsorted(cumulated, cumulated[group_start]
+                - counts[group_start] + MAX_PAIRS_PER_STEP, side="right")
+        group_end = max(group_end, group_start + 1)
+        group = numpy.arange(group_start, group_end)
+        group_start = group_end
+        group_counts = counts[group]
+        triangles = numpy.repeat(group, group_counts)
+        offsets = numpy.arange(group_counts.sum()) \
+                - numpy.repeat(numpy.cumsum(group_counts) - group_counts,
+                        group_counts)
+        column = x_start[triangles] + offsets % columns[triangles]
+        row = y_start[triangles] + offsets // columns[triangles]
+        origin = origins[triangles]
+        sx, sy = slope_x[triangles], slope_y[triangles]
+        plane = origin[:, 2] \
+                + numpy.maximum(sx * (xs[column] - origin[:, 0]),
+                        sx * (xs[column + 1] - origin[:, 0])) \
+                + numpy.maximum(sy * (ys[row] - origin[:, 1]),
+                        sy * (ys[row + 1] - origin[:, 1]))
+        limit = numpy.where(vertical[triangles], maxs[triangles, 2],
+                numpy.minimum(plane, maxs[triangles, 2]))
+        numpy.maximum.at(limits, (row, column), limit)
+    return limits
+
+
+class HeightMap(object):
+    """ evaluate the heights of a cutter dropped onto a model based on a
+    raster of precalculated heights
+    """
+
+    def __init__(self, model, cutter, physics=None, tolerance=None):
+        self._model = model
+        self._cutter = cutter
+        self._physics = physics
+        if tolerance is None:
+            tolerance = cutter.distance_radius / 1000
+        self.tolerance = tolerance
+        self._raster = None
+        self._usable_cells = None
+
+    def calculate_raster(self, cell_size, callback=None):
+        """ Calculate the heights of the nodes of a raster covering the model
+        (and the reach of the cutter around it).
+
+        Heights below "floor" are raised to "floor". Heights above the model
+        (they can't occur) are stored as NaN.
+        @returns: the raster (a dict) or None (if the operation was
+            interrupted)
+        """
+        model, cutter = self._model, self._cutter
+        floor = model.minz - cutter.distance_radius
+        ceiling = model.maxz + cutter.distance_radius \
+                + cutter.get_required_distance()
+        xs, ys = self._get_nodes(cell_size)
+        get_max_heights = get_max_heights_function(model, cutter, floor,
+                ceiling, physics=self._physics)
+        heights = numpy.empty((len(ys), len(xs)), dtype=numpy.float64)
+        for index, y in enumerate(ys):
+            points = get_max_heights([(float(x), float(y)) for x in xs])
+            heights[index] = [numpy.nan if point is None else point[2]
+                    for point in points]
+            if callback and callback():
+                return None
+        log.debug("Calculated a height map of %d x %d positions" % \
+                (len(xs), len(ys)))
+        return {"origin": (float(xs[0]), float(ys[0])),
+                "cell_size": cell_size, "floor": floor, "heights": heights}
+
+    def calculate_inverse_tool_raster(self, cell_size, callback=None):
+        """ Calculate the heights of the nodes of the same raster as
+        "calculate_raster" without dropping the cutter: the triangles are
+        rasterized into a z-buffer (the highest surface above each node).
+        Then the inverted cutter is placed on every node of the z-buffer -
+        the cutter location is the maximum of all of them.
+
+        Features of the model between the nodes (e.g. sharp edges) are
+        missed. Thus these heights are a lower limit of the real heights.
+        The upper limit ("upper_heights") is calculated from the highest
+        possible surface within each cell (see "_get_cell_limits") at the
+        smallest distance between the node and the cell.
+        @returns: the raster (a dict) or None (if the operation was
+            interrupted)
+        """
+        model, cutter = self._model, self._cutter
+        floor = model.minz - cutter.distance_radius
+        xs, ys = self._get_nodes(cell_size)
+        if hasattr(model, "get_triangle_points"):
+            points = model.get_triangle_points()
+        else:
+            points = [(t.p1, t.p2, t.p3) for t in model.triangles()]
+        points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3, 3))
+        surface = get_triangle_heights(points, xs, ys, -INFINITE)
+        cell_limits = _get_cell_limits(points, xs, ys, -INFINITE)
+        if callback and callback():
+            return None
+        heights = numpy.zeros(surface.shape) + floor
+        upper_heights = numpy.zeros(surface.shape) + floor
+        rows, columns = surface.shape
+        reach = int(cutter.distance_radius // cell_size) + 1
+        for dy in range(-reach, reach + 1):
+            for dx in range(-reach, reach + 1):
+                # the cutter at node (row, column) touches the surface at
+                # node (row + dy, column + dx)
+                distance = cell_size * (dx ** 2 + dy ** 2) ** 0.5
+                if distance <= cutter.distance_radius:
+                    _add_shifted_heights(heights, surface, dx, dy,
+                            -cutter.get_profile_height(distance))
+                # ... or within cell (row + dy, column + dx)
+                gap_x, gap_y = max(0, dx, -dx - 1), max(0, dy, -dy - 1)
+                distance = cell_size * (gap_x ** 2 + gap_y ** 2) ** 0.5
+                if distance <= cutter.distance_radius:
+                    _add_shifted_heights(upper_heights, cell_limits, dx, dy,
+                            -cutter.get_profile_height(distance))
+            if callback and callback():
+                return None
+        log.debug("Calculated an inverse tool height map of %d x %d " \
+                % (len(xs), len(ys)) + "positions")
+        return {"origin": (float(xs[0]), float(ys[0])),
+                "cell_size": cell_size, "floor": floor, "heights": heights,
+                "upper_heights": upper_heights, "method": "inverse_tool"}
+
+    def _get_nodes(self, cell_size):
+        """ Returns the x and y coordinates of the nodes of a raster
+        covering the model (and the reach of the cutter around it).
+        """
+        model = self._model
+        margin = self._cutter.distance_radius + cell_size
+        xs = numpy.arange(model.minx - margin, model.maxx + margin + cell_size,
+                cell_size)
+        ys = numpy.arange(model.miny - margin, model.maxy + margin + cell_size,
+                cell_size)
+        return xs, ys
+
+    def set_raster(self, raster):
+        self._raster = raster
+        self._usable_cells = self._get_usable_cells(raster["heights"],
+                self.tolerance)
+        if "upper_heights" in raster:
+            # the real height of the node may be higher
+            exact = raster["upper_heights"] - raster["heights"] \
+                    <= self.tolerance
+            self._usable_cells &= exact[:-1, :-1] & exact[1:, :-1] \
+                    & exact[:-1, 1:] & exact[1:, 1:]
+
+    @staticmethod
+    def _get_usable_cells(heights, tolerance):
+        """ Returns a boolean array marking the cells of the raster that may
+        be interpolated. The deviance of a straight interpolation is
+        estimated from the second differences at the corners of a cell: a
+        bend in the middle of a cell deviates by half of the second
+        difference of its neighbouring nodes (in both directions).
+        Nodes at the border of the raster are never used.
+        """
+        smooth = numpy.zeros(heights.shape, dtype=bool)
+        if (heights.shape[0] < 3) or (heights.shape[1] < 3):
+            return smooth[:-1, :-1]
+        old_settings = numpy.seterr(invalid="ignore")
+        try:
+            limit = tolerance
+            middle = heights[1:-1, 1:-1]
+            smooth[1:-1, 1:-1] = (abs(heights[1:-1, :-2] - 2 * middle
+                    + heights[1:-1, 2:]) <= limit) \
+                    & (abs(heights[:-2, 1:-1] - 2 * middle
+                        + heights[2:, 1:-1]) <= limit)
+        finally:
+            numpy.seterr(**old_settings)
+        return smooth[:-1, :-1] & smooth[1:, :-1] & smooth[:-1, 1:] \
+                & smooth[1:, 1:]
+
+    def get_subset(self, minx, maxx, miny, maxy):
+        """ Returns a new height map containing only the part of the raster
+        and the triangles that are relevant for cutter positions within the
+        given xy area.
+        """
+        subset = copy.copy(self)
+        radius = self._cutter.distance_radius
+        if hasattr(self._physics, "get_subset"):
+            subset._physics = self._physics.get_subset(minx, maxx, miny, maxy)
+        elif self._model and hasattr(self._model, "get_sub_model"):
+            subset._model = self._model.get_sub_model(minx - radius,
+                    miny - radius, -INFINITE, maxx + radius, maxy + radius,
+                    INFINITE)
+        if self._raster:
+            raster = self._raster
+            cell_size = raster["cell_size"]
+            heights = raster["heights"]
+            start_x, start_y = [max(0, int((low - origin) // cell_size))
+                    for low, origin in zip((minx, miny), raster["origin"])]
+            end_x, end_y = [max(0, int((high - origin) // cell_size) + 2)
+                    for high, origin in zip((maxx, maxy), raster["origin"])]
+            subset._raster = dict(raster)
+            subset._raster["origin"] = (
+                    raster["origin"][0] + start_x * cell_size,
+                    raster["origin"][1] + start_y * cell_size)
+            subset._raster["heights"] = heights[start_y:end_y,
+                    start_x:end_x].copy()
+            subset._usable_cells = self._usable_cells[start_y:end_y - 1,
+                    start_x:end_x - 1].copy()
+        return subset
+
+    def get_max_height(self, x, y, minz, maxz):
+        return self.get_max_heights([(x, y)], minz, maxz)[0]
+
+    def get_max_heights(self, positions, minz, maxz):
+        """ calculate the cutter location for each given (x, y) position
+        (see "pycam.PathGenerators.get_max_height_triangles")
+        """
+        coords = numpy.array([(pos[0], pos[1]) for pos in positions],
+                dtype=numpy.float64).reshape((-1, 2))
+        heights = numpy.empty(len(coords), dtype=numpy.float64)
+        usable = numpy.zeros(len(coords), dtype=bool)
+        raster = self._raster
+        if raster and (minz >= raster["floor"]) \
+                and (self._usable_cells.size > 0):
+            cells = (coords - raster["origin"]) / raster["cell_size"]
+            indices = numpy.floor(cells).astype(numpy.intp)
+            rows, columns = self._usable_cells.shape
+            usable = (indices[:, 0] >= 0) & (indices[:, 0] < columns) \
+                    & (indices[:, 1] >= 0) & (indices[:, 1] < rows)
+            usable[usable] = self._usable_cells[indices[usable, 1],
+                    indices[usable, 0]]
+            ix, iy = indices[usable, 0], indices[usable, 1]
+            fx, fy = (cells[usable] - indices[usable]).T
+            grid = raster["heights"]
+            lower = grid[iy, ix] * (1 - fx) + grid[iy, ix + 1] * fx
+            upper = grid[iy + 1, ix] * (1 - fx) + grid[iy + 1, ix + 1] * fx
+            heights[usable] = lower * (1 - fy) + upper * fy
+        exact = numpy.nonzero(~usable)[0]
+        if len(exact) > 0:
+            get_max_heights = get_max_heights_function(self._model,
+                    self._cutter, minz, maxz, physics=self._physics)
+            exact_points = get_max_heights([tuple(coords[index])
+                    for index in exact])
+        else:
+            exact_points = []
+        result = [None] * len(coords)
+        for index, point in zip(exact, exact_points):
+            result[index] = point
+        for index in numpy.nonzero(usable)[0]:
+            x, y = coords[index]
+            height = float(heights[index])
+            if height < minz + epsilon:
+                result[index] = (float(x), float(y), minz)
+            elif height <= maxz + epsilon:
+                result[index] = (float(x), float(y), height)
+        return result
@@ -0,0 +1,561 @@
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+""" Vectorized drop-cutter calculation
+
+The triangles of all models are packed into contiguous arrays. A whole grid
+line (or any other list of positions) is evaluated against these arrays at
+once. The calculations below follow the scalar code in
+"pycam.Cutters.*Cutter.intersect" and "pycam.Geometry.intersection" step by
+step (including their order of precedence between facets, edges and
+vertices). Thus the resulting heights are the same as the ones of
+"BaseCutter.drop" (within epsilon).
+"""
+
+from pycam.Geometry.utils import epsilon, INFINITE
+from pycam.Geometry.intersection import drop_torus_points, drop_torus_edges
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+import pycam.Utils.log
+import numpy
+import copy
+import uuid
+
+
+log = pycam.Utils.log.get_logger()
+
+# number of grid positions that are evaluated in one step
+TILE_SIZE = 64
+
+
+def generate_physics(models, cutter, physics=None):
+    if physics is None:
+        physics = DropCutterEngine(cutter)
+    physics.reset(cutter)
+    if not isinstance(models, (list, set, tuple)):
+        models = [models]
+    for model in models:
+        if hasattr(model, "get_triangle_points"):
+            # array based model (see pycam.Geometry.Model.TriangleMesh)
+            physics.add_arrays(model.get_triangle_points(), model.normals,
+                    model.middles, model.radii)
+        elif model:
+            physics.add_mesh(model.triangles())
+    return physics
+
+def _dot(a, b):
+    return (a * b).sum(axis=-1)
+
+def _norm(a):
+    return numpy.sqrt(_dot(a, a))
+
+def _normalized(a):
+    """ normalize a list of vectors - zero-length vectors are kept as zero
+    vectors (see "pnormalized")
+    """
+    lengths = _norm(a)
+    safe_lengths = numpy.where(lengths == 0, 1, lengths)
+    return a / safe_lengths[:, numpy.newaxis]
+
+def _sqrt(values):
+    """ vectorized version of pycam.Geometry.utils.sqrt """
+    return numpy.sqrt(numpy.maximum(values, 0))
+
+
+class DropCutterEngine(object):
+    """ evaluate the heights of a cutter dropped onto a triangle mesh for
+    many positions at once
+    """
+
+    def __init__(self, cutter):
+        self._cutter = None
+        self._chunks = []
+        self._arrays = None
+        self.__uuid = None
+        self.reset(cutter)
+
+    @property
+    def uuid(self):
+        if self.__uuid is None:
+            self.__uuid = str(uuid.uuid4())
+        return self.__uuid
+
+    def reset(self, cutter):
+        # store only the shape information - the location is not relevant
+        self._cutter = {"distance_radius": float(cutter.distance_radius),
+                # the center of the cutter is relative to its location
+                "center_offset": float(cutter.center[2] - cutter.location[2])}
+        if isinstance(cutter, ToroidalCutter):
+            self._cutter["shape"] = "ToroidalCutter"
+            self._cutter["distance_majorradius"] = \
+                    float(cutter.distance_majorradius)
+            self._cutter["distance_minorradius"] = \
+                    float(cutter.distance_minorradius)
+        elif isinstance(cutter, SphericalCutter):
+            self._cutter["shape"] = "SphericalCutter"
+        elif isinstance(cutter, CylindricalCutter):
+            self._cutter["shape"] = "CylindricalCutter"
+        else:
+            raise ValueError("Unsupported cutter shape for the vectorized " \
+                    + "drop cutter: %s" % str(cutter))
+        self._chunks = []
+        self._arrays = None
+        self.__uuid = None
+
+    def add_mesh(self, triangles):
+        count = len(triangles)
+        points = numpy.zeros((count, 3, 3), dtype=numpy.float64)
+        normals = numpy.zeros((count, 3), dtype=numpy.float64)
+        middles = numpy.zeros((count, 3), dtype=numpy.float64)
+        radii = numpy.zeros(count, dtype=numpy.float64)
+        for index, t in enumerate(triangles):
+            points[index] = (t.p1[:3], t.p2[:3], t.p3[:3])
+            normals[index] = t.normal[:3]
+            middles[index] = t.middle[:3]
+            radii[index] = t.radius
+        self.add_arrays(points, normals, middles, radii)
+
+    def add_arrays(self, points, normals, middles, radii):
+        """ add triangles given as arrays
+
+        @param points: array (triangles x 3 x 3) of the vertices p1, p2, p3
+        @param normals: array of the normals of the triangles
+        @param middles: array of the centers of the circumcircles
+        @param radii: array of the radii of the circumcircles
+        """
+        self._chunks.append((points, normals, middles, radii))
+        self._arrays = None
+        self.__uuid = None
+
+    def get_subset(self, minx, maxx, miny, maxy):
+        """ Returns a new engine containing only the triangles that are
+        relevant for cutter positions within the given xy area.
+        """
+        arrays = self._get_arrays()
+        radius = self._cutter["distance_radius"]
+        indices = numpy.nonzero(self._get_overlap_mask(arrays, minx - radius,
+                maxx + radius, miny - radius, maxy + radius))[0]
+        subset = copy.copy(self)
+        subset._chunks = [(arrays["points"][:, indices].transpose(1, 0, 2),
+                arrays["normal"][indices], arrays["middle"][indices],
+                arrays["radius"][indices])]
+        subset._arrays = None
+        subset.__uuid = None
+        return subset
+
+    def __getstate__(self):
+        # transfer only the packed arrays to other processes
+        self._get_arrays()
+        return self.__dict__
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            if self._chunks:
+                chunks = zip(*self._chunks)
+                chunks = [numpy.concatenate(items) for items in chunks]
+            else:
+                chunks = (numpy.zeros((0, 3, 3)), numpy.zeros((0, 3)),
+                        numpy.zeros((0, 3)), numpy.zeros(0))
+            self._arrays = self._pack_triangles(*chunks)
+            self._chunks = []
+        return self._arrays
+
+    @staticmethod
+    def _pack_triangles(points, normals, middles, radii):
+        points = numpy.asarray(points, dtype=numpy.float64).transpose(1, 0, 2)
+        centers = (points[0] + points[1] + points[2]) / 3
+        arrays = {"points": points, "normal": normals, "center": centers,
+                "middle": middles[:, :2], "radius": radii}
+        arrays["min"] = points.min(axis=0)
+        arrays["max"] = points.max(axis=0)
+        # data for the "point inside triangle" test (see Triangle)
+        v0 = points[2] - points[0]
+        v1 = points[1] - points[0]
+        dot00 = _dot(v0, v0)
+        dot01 = _dot(v0, v1)
+        dot11 = _dot(v1, v1)
+        denom = dot00 * dot11 - dot01 * dot01
+        arrays["inside"] = (v0, v1, dot00, dot01, dot11, denom)
+        # the edges e1 (p1->p2), e2 (p2->p3) and e3 (p3->p1)
+        edges = []
+        for start_index, end_index in ((0, 1), (1, 2), (2, 0)):
+            start = points[start_index]
+            vector = points[end_index] - start
+            length = _norm(vector)
+            edges.append((start, vector, _normalized(vector), length))
+        arrays["edges"] = edges
+        return arrays
+
+    def get_max_height(self, x, y, minz, maxz):
+        return self.get_max_heights([(x, y)], minz, maxz)[0]
+
+    def get_max_heights(self, positions, minz, maxz):
+        """ calculate the cutter location for each given (x, y) position
+
+        The result equals a call of
+        "pycam.PathGenerators.get_max_height_triangles" for every position:
+        a point at "minz" is used if no triangle is below the cutter, "None"
+        is returned for positions exceeding "maxz".
+        """
+        arrays = self._get_arrays()
+        coords = numpy.array([(pos[0], pos[1]) for pos in positions],
+                dtype=numpy.float64).reshape((-1, 2))
+        heights = numpy.empty(len(coords), dtype=numpy.float64)
+        heights.fill(-INFINITE)
+        radius = self._cutter["distance_radius"]
+        if len(coords) > 0:
+            # limit the triangles to the ones below the complete grid line
+            line_mask = self._get_overlap_mask(arrays,
+                    coords[:, 0].min() - radius, coords[:, 0].max() + radius,
+                    coords[:, 1].min() - radius, coords[:, 1].max() + radius)
+            line_triangles = numpy.nonzero(line_mask)[0]
+        else:
+            line_triangles = []
+        if len(line_triangles) > 0:
+            for tile_start in range(0, len(coords), TILE_SIZE):
+                tile = coords[tile_start:tile_start + TILE_SIZE]
+                tile_heights = self._get_tile_heights(arrays, tile,
+                        line_triangles, maxz)
+                heights[tile_start:tile_start + TILE_SIZE] = tile_heights
+        result = []
+        for (x, y), height in zip(coords, heights):
+            x, y, height = float(x), float(y), float(height)
+            if height < minz + epsilon:
+                result.append((x, y, minz))
+            elif height > maxz + epsilon:
+                result.append(None)
+            else:
+                result.append((x, y, height))
+        return result
+
+    @staticmethod
+    def _get_overlap_mask(arrays, minx, maxx, miny, maxy):
+        # this is the same xy overlap test as the one used for the BVH
+        return (arrays["min"][:, 0] <= maxx) & (arrays["max"][:, 0] >= minx) \
+                & (arrays["min"][:, 1] <= maxy) & (arrays["max"][:, 1] >= miny)
+
+    def _get_tile_heights(self, arrays, tile, candidates, start_z):
+        radius = self._cutter["distance_radius"]
+        tile_mask = self._get_overlap_mask(arrays,
+                tile[:, 0].min() - radius, tile[:, 0].max() + radius,
+                tile[:, 1].min() - radius, tile[:, 1].max() + radius)
+        candidates = candidates[tile_mask[candidates]]
+        heights = numpy.empty(len(tile), dtype=numpy.float64)
+        heights.fill(-INFINITE)
+        if len(candidates) == 0:
+            return heights
+        # build all combinations of positions and triangles
+        px = tile[:, 0][:, numpy.newaxis]
+        py = tile[:, 1][:, numpy.newaxis]
+        tmin = arrays["min"][candidates]
+        tmax = arrays["max"][candidates]
+        middle = arrays["middle"][candidates]
+        tradius = arrays["radius"][candidates]
+        # bounding box of the kdtree search (see "get_max_height_triangles")
+        pairs = (tmin[:, 0] <= px + radius) & (tmax[:, 0] >= px - radius) \
+                & (tmin[:, 1] <= py + radius) & (tmax[:, 1] >= py - radius)
+        # bounding box and bounding circle tests of "BaseCutter.drop"
+        pairs &= (px - radius <= tmax[:, 0] + epsilon) \
+                & (px + radius >= tmin[:, 0] - epsilon) \
+                & (py - radius <= tmax[:, 1] + epsilon) \
+                & (py + radius >= tmin[:, 1] - epsilon)
+        pairs &= (middle[:, 0] - px) ** 2 + (middle[:, 1] - py) ** 2 \
+                <= radius ** 2 + 2 * radius * tradius + tradius ** 2 + epsilon
+        point_indices, candidate_indices = numpy.nonzero(pairs)
+        if len(point_indices) == 0:
+            return heights
+        triangle_indices = candidates[candidate_indices]
+        start = numpy.empty((len(point_indices), 3), dtype=numpy.float64)
+        start[:, :2] = tile[point_indices]
+        start[:, 2] = start_z
+        shape = self._cutter["shape"]
+        if shape == "CylindricalCutter":
+            pair_heights = self._drop_cylinder(arrays, triangle_indices, start)
+        elif shape == "SphericalCutter":
+            pair_heights = self._drop_sphere(arrays, triangle_indices, start)
+        else:
+            pair_heights = self._drop_torus(arrays, triangle_indices, start)
+        numpy.maximum.at(heights, point_indices, pair_heights)
+        return heights
+
+    @staticmethod
+    def _combine(heights, valid):
+        """ combine multiple lists of feature heights by their maximum """
+        result = numpy.empty(len(heights[0]), dtype=numpy.float64)
+        result.fill(-INFINITE)
+        found = numpy.zeros(len(heights[0]), dtype=bool)
+        for height, mask in zip(heights, valid):
+            result = numpy.where(mask, numpy.maximum(result, height), result)
+            found |= mask
+        return result, found
+
+    @staticmethod
+    def _is_inside(arrays, tri, p):
+        """ vectorized version of "Triangle.is_point_inside" """
+        v0, v1, dot00, dot01, dot11, denom = [item[tri]
+                for item in arrays["inside"]]
+        v2 = p - arrays["points"][0][tri]
+        dot02 = _dot(v0, v2)
+        dot12 = _dot(v1, v2)
+        valid = denom != 0
+        inv_denom = 1.0 / numpy.where(valid, denom, 1)
+        u = (dot11 * dot02 - dot01 * dot12) * inv_denom
+        v = (dot00 * dot12 - dot01 * dot02) * inv_denom
+        return valid & (u > 0) & (v > 0) & (u + v < 1)
+
+    @staticmethod
+    def _plane_drop(arrays, tri, ccp):
+        """ intersect a vertical line through "ccp" with the triangle's plane
+        (see "Plane.intersect_point")
+        Returns the height of the point of contact.
+        """
+        n = arrays["normal"][tri]
+        denom = -n[:, 2]
+        valid = denom != 0
+        l = -(_dot(n, ccp) - _dot(n, arrays["center"][tri])) \
+                / numpy.where(valid, denom, 1)
+        return ccp[:, 2] - l, valid
+
+    def _circle_plane(self, arrays, tri, center, radius):
+        """ see "pycam.Geometry.intersection.intersect_circle_plane" """
+        n = arrays["normal"][tri]
+        valid = n[:, 2] != 0
+        n2 = _normalized(numpy.column_stack((n[:, 0], n[:, 1],
+                numpy.zeros(len(n)))))
+        ccp = center - n2 * radius
+        cp_z, plane_valid = self._plane_drop(arrays, tri, ccp)
+        valid &= plane_valid
+        cp = numpy.column_stack((ccp[:, 0], ccp[:, 1], cp_z))
+        valid &= self._is_inside(arrays, tri, cp)
+        return cp_z, ccp[:, 2], valid
+
+    @staticmethod
+    def _circle_point(point, center, radiussq):
+        """ see "pycam.Geometry.intersection.intersect_circle_point" """
+        dist_sq = (center[:, 0] - point[:, 0]) ** 2 \
+                + (center[:, 1] - point[:, 1]) ** 2
+        return point[:, 2], center[:, 2], dist_sq < radiussq - epsilon
+
+    @staticmethod
+    def _circle_line(edge, tri, center, radius):
+        """ see "pycam.Geometry.intersection.intersect_circle_line" and
+        "BaseCutter.intersect_circle_edge"
+        """
+        radiussq = radius ** 2
+        e_start, e_vector, e_dir, e_len = [item[tri] for item in edge]
+        e_end = e_start + e_vector
+        count = len(tri)
+        cp_z = numpy.zeros(count, dtype=numpy.float64)
+        ccp_z = center[:, 2]
+        valid = numpy.zeros(count, dtype=bool)
+        cp_xy = numpy.zeros((count, 2), dtype=numpy.float64)
+        # horizontal edges
+        flat = e_dir[:, 2] == 0
+        if flat.any():
+            c = center[flat]
+            d = e_dir[flat]
+            p1 = e_start[flat].copy()
+            p2 = e_end[flat].copy()
+            l = p1[:, 2] - c[:, 2]
+            p1[:, 2] = c[:, 2]
+            p2[:, 2] = c[:, 2]
+            line_dir = _normalized(p2 - p1)
+            closest = p1 - line_dir * (_dot(p1, line_dir)
+                    - _dot(c, line_dir))[:, numpy.newaxis]
+            d_sq = _dot(closest - c, closest - c)
+            a = _sqrt(radiussq - d_sq)
+            d1 = _dot(p1 - closest, d)
+            d2 = _dot(p2 - closest, d)
+            use_p1 = numpy.abs(d1) < a - epsilon
+            use_p2 = ~use_p1 & (numpy.abs(d2) < a - epsilon)
+            use_closest = ~use_p1 & ~use_p2 \
+                    & (((d1 < -a + epsilon) & (d2 > a - epsilon))
+                    | ((d2 < -a + epsilon) & (d1 > a - epsilon)))
+            contact = numpy.where(use_p1[:, numpy.newaxis], p1,
+                    numpy.where(use_p2[:, numpy.newaxis], p2, closest))
+            cp_xy[flat] = contact[:, :2]
+            cp_z[flat] = contact[:, 2] + l
+            valid[flat] = (d_sq < radiussq) & (use_p1 | use_p2 | use_closest)
+        # sloped edges (vertical edges do not touch the bottom of a cutter)
+        sloped = ~flat & ((e_dir[:, 0] != 0) | (e_dir[:, 1] != 0))
+        if sloped.any():
+            c = center[sloped]
+            d = e_dir[sloped]
+            p1 = e_start[sloped]
+            # n = d x direction
+            n = _normalized(numpy.column_stack((-d[:, 1], d[:, 0],
+                    numpy.zeros(len(d)))))
+            # intersect the edge with the plane of the circle
+            l = -(p1[:, 2] - c[:, 2]) / d[:, 2]
+            lp = p1 + d * l[:, numpy.newaxis]
+            v = numpy.column_stack((-n[:, 1], n[:, 0], numpy.zeros(len(n))))
+            n2 = numpy.column_stack((v[:, 1], -v[:, 0], numpy.zeros(len(v))))
+            dist = _dot(n2, c) - _dot(n2, lp)
+            distsq = dist * dist
+            dist2 = _sqrt(radiussq - distsq)
+            dist2 = numpy.where(d[:, 2] < 0, -dist2, dist2)
+            ccp = c - (n2 * dist[:, numpy.newaxis]
+                    - v * dist2[:, numpy.newaxis])
+            # plane through the edge: (d x direction) x d
+            plane_n = numpy.cross(numpy.column_stack((-d[:, 1], d[:, 0],
+                    numpy.zeros(len(d)))), d)
+            denom = -plane_n[:, 2]
+            l = -(_dot(plane_n, ccp) - _dot(plane_n, p1)) / denom
+            cp_xy[sloped] = ccp[:, :2]
+            cp_z[sloped] = ccp[:, 2] - l
+            valid[sloped] = distsq <= radiussq - epsilon
+        # the contact point needs to be between the end points of the edge
+        cp = numpy.column_stack((cp_xy, cp_z))
+        m = _dot(cp - e_start, e_dir)
+        valid &= (m >= -epsilon) & (m <= e_len + epsilon)
+        return cp_z, ccp_z, valid
+
+    def _drop_cylinder(self, arrays, tri, start):
+        radius = self._cutter["distance_radius"]
+        center = start.copy()
+        center[:, 2] += self._cutter["center_offset"]
+        offset = start[:, 2] - center[:, 2]
+        # facets have precedence over edges - edges over vertices
+        cp_z, ccp_z, facet_valid = self._circle_plane(arrays, tri, center,
+                radius)
+        facet_height = cp_z + offset
+        edge_heights = []
+        edge_valid = []
+        for edge in arrays["edges"]:
+            cp_z, ccp_z, valid = self._circle_line(edge, tri, center, radius)
+            edge_heights.append(cp_z + start[:, 2] - ccp_z)
+            edge_valid.append(valid)
+        edge_height, edge_found = self._combine(edge_heights, edge_valid)
+        vertex_heights = []
+        vertex_valid = []
+        for points in arrays["points"]:
+            cp_z, ccp_z, valid = self._circle_point(points[tri], center,
+                    radius ** 2)
+            vertex_heights.append(cp_z + start[:, 2] - ccp_z)
+            vertex_valid.append(valid)
+        vertex_height, vertex_found = self._combine(vertex_heights,
+                vertex_valid)
+        result = numpy.where(edge_found, edge_height, vertex_height)
+        return numpy.where(facet_valid, facet_height, result)
+
+    def _drop_sphere(self, arrays, tri, start):
+        radius = self._cutter["distance_radius"]
+        radiussq = radius ** 2
+        center = start.copy()
+        center[:, 2] += self._cutter["center_offset"]
+        # facet
+        n = arrays["normal"][tri]
+        upwards = -n[:, 2] < 0
+        sign = numpy.where(upwards, -1.0, 1.0)[:, numpy.newaxis]
+        ccp = center + sign * n * radius
+        cp_z, facet_valid = self._plane_drop(arrays, tri, ccp)
+        cp = numpy.column_stack((ccp[:, 0], ccp[:, 1], cp_z))
+        facet_valid &= self._is_inside(arrays, tri, cp)
+        facet_height = cp_z + start[:, 2] - ccp[:, 2]
+        # edges
+        heights = []
+        valids = []
+        for e_start, e_vector, e_dir, e_len in arrays["edges"]:
+            p1 = e_start[tri]
+            vector = e_vector[tri]
+            d = e_dir[tri]
+            n = numpy.column_stack((-d[:, 1], d[:, 0], numpy.zeros(len(d))))
+            valid = _norm(n) != 0
+            n = _normalized(n)
+            dist = -_dot(center, n) + _dot(p1, n)
+            valid &= numpy.abs(dist) <= radius - epsilon
+            n2 = _normalized(numpy.cross(n, d))
+            dist2 = _sqrt(radiussq - dist * dist)
+            ccp = center + n * dist[:, numpy.newaxis] \
+                    + n2 * dist2[:, numpy.newaxis]
+            denom = -n2[:, 2]
+            valid &= denom != 0
+            l = -(_dot(n2, ccp) - _dot(n2, p1)) / numpy.where(valid, denom, 1)
+            cp = ccp.copy()
+            cp[:, 2] -= l
+            m = _dot(cp - p1, vector)
+            valid &= (m >= -epsilon) & (m <= _dot(vector, vector) + epsilon)
+            heights.append(cp[:, 2] - (ccp[:, 2] - start[:, 2]))
+            valids.append(valid)
+        # vertices
+        for points in arrays["points"]:
+            point = points[tri]
+            p0_x0 = center - point
+            b = -2 * p0_x0[:, 2]
+            c = _dot(p0_x0, p0_x0) - radiussq
+            d = b * b - 4 * c
+            valid = d >= 0
+            l = (-b - _sqrt(d)) / 2
+            heights.append(start[:, 2] - l)
+            valids.append(valid)
+        height, found = self._combine(heights, valids)
+        return numpy.where(facet_valid, facet_height, height)
+
+    def _drop_torus(self, arrays, tri, start):
+        majorradius = self._cutter["distance_majorradius"]
+        minorradius = self._cutter["distance_minorradius"]
+        center = start.copy()
+        center[:, 2] += self._cutter["center_offset"]
+        heights = []
+        valids = []
+        # torus facet
+        n = arrays["normal"][tri]
+        valid = (n[:, 2] != 0) & (n[:, 2] != 1)
+        b = -n
+        a = numpy.column_stack((b[:, 0], b[:, 1], numpy.zeros(len(b))))
+        a_sq = _dot(a, a)
+        valid &= a_sq > 0
+        a = _normalized(a)
+        ccp = center + a * majorradius + b * minorradius
+        cp_z, plane_valid = self._plane_drop(arrays, tri, ccp)
+        cp = numpy.column_stack((ccp[:, 0], ccp[:, 1], cp_z))
+        valid &= plane_valid & self._is_inside(arrays, tri, cp)
+        heights.append(cp_z + start[:, 2] - ccp[:, 2])
+        valids.append(valid)
+        # torus edges
+        for e_start, e_vector, e_dir, e_len in arrays["edges"]:
+            dist, factors, valid = drop_torus_edges(center, majorradius,
+                    minorradius, e_start[tri], e_start[tri] + e_vector[tri])
+            heights.append(start[:, 2] - dist)
+            valids.append(valid)
+        # torus vertices
+        for points in arrays["points"]:
+            dist, valid = drop_torus_points(center, majorradius, minorradius,
+                    points[tri])
+            heights.append(start[:, 2] - dist)
+            valids.append(valid)
+        # the flat bottom of the cutter
+        cp_z, ccp_z, valid = self._circle_plane(arrays, tri, start,
+                majorradius)
+        heights.append(cp_z + start[:, 2] - ccp_z)
+        valids.append(valid)
+        for points in arrays["points"]:
+            cp_z, ccp_z, valid = self._circle_point(points[tri], start,
+                    majorradius ** 2)
+            heights.append(cp_z + start[:, 2] - ccp_z)
+            valids.append(valid)
+        for edge in arrays["edges"]:
+            cp_z, ccp_z, valid = self._circle_line(edge, tri, start,
+                    majorradius)
+            heights.append(cp_z + start[:, 2] - ccp_z)
+            valids.append(valid)
+        height, found = self._combine(heights, valids)
+        return height
@@ -91,6 +91,29 @@ class PathParamMaterialAllowance(pycam.Plugins.PluginBase):
         self.core.unregister_parameter("process", "material_allowance")
 
 
+class PathParamHeightMap(pycam.Plugins.PluginBase):
+
+    DEPENDS = ["Processes"]
+    CATEGORIES = ["Process", "Parameter"]
+
+    def setup(self):
+        self.control = pycam.Gui.ControlsGTK.InputChoice(
+                    (("exact drops", "exact"),
+                    ("interpolated height map", "height_map"),
+                    ("inverse tool (fast)", "inverse_tool")),
+                change_handler=lambda widget=None: self.core.emit_event(
+                        "process-changed"))
+        self.core.register_parameter("process", "height_map",
+                self.control)
+        self.core.register_ui("process_path_parameters", "Height calculation",
+                self.control.get_widget(), weight=35)
+        return True
+
+    def teardown(self):
+        self.core.unregister_ui("process_path_parameters", self.control.get_widget())
+        self.core.unregister_parameter("process", "height_map")
+
+
 class PathParamMillingStyle(pycam.Plugins.PluginBase):
 
     DEPENDS = ["Processes", "PathParamPattern"]
@@ -23,6 +23,7 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 
 import pycam.Plugins
 import pycam.PathGenerators.PushCutter
+import pycam.PathGenerators.WaterlineSlicer
 import pycam.Toolpath.MotionGrid
 from pycam.Toolpath.MotionGrid import START_X, START_Y, START_Z
 
@@ -98,16 +99,47 @@ class ProcessStrategyContour(pycam.Plugins.PluginBase):
         return path_generator, motion_grid
 
 
+class ProcessStrategySlicedWaterline(pycam.Plugins.PluginBase):
+
+    DEPENDS = ["Processes", "PathParamStepDown",
+            "PathParamMaterialAllowance"]
+    CATEGORIES = ["Process"]
+
+    def setup(self):
+        parameters = {"step_down": 1.0,
+                "material_allowance": 0,
+        }
+        self.core.register_parameter_set("process", "sliced_waterline",
+                "Waterline (sliced)", self.run_process,
+                parameters=parameters, weight=25)
+        return True
+
+    def teardown(self):
+        self.core.unregister_parameter_set("process", "sliced_waterline")
+
+    def run_process(self, process, tool_radius, (low, high)):
+        path_generator = \
+                pycam.PathGenerators.WaterlineSlicer.WaterlineSlicer()
+        # only the heights of the layers are used
+        motion_grid = pycam.Toolpath.MotionGrid.get_fixed_grid(
+                (low, high), process["parameters"]["step_down"],
+                line_distance=tool_radius,
+                grid_direction=pycam.Toolpath.MotionGrid.GRID_DIRECTION_X)
+        return path_generator, motion_grid
+
+
 class ProcessStrategySurfacing(pycam.Plugins.PluginBase):
 
     DEPENDS = ["ParameterGroupManager", "PathParamOverlap",
-            "PathParamMaterialAllowance", "PathParamPattern"]
+            "PathParamMaterialAllowance", "PathParamPattern",
+            "PathParamHeightMap"]
     CATEGORIES = ["Process"]
 
     def setup(self):
         parameters = {"overlap": 0.6,
                 "material_allowance": 0,
                 "path_pattern": None,
+                "height_map": "exact",
         }
         self.core.register_parameter_set("process", "surfacing",
                 "Surfacing", self.run_process, parameters=parameters,
@@ -120,7 +152,10 @@ class ProcessStrategySurfacing(pycam.Plugins.PluginBase):
     def run_process(self, process, tool_radius, (low, high)):
         line_distance = _get_line_distance(tool_radius,
                 process["parameters"]["overlap"])
-        path_generator = pycam.PathGenerators.DropCutter.DropCutter()
+        height_map = process["parameters"]["height_map"]
+        path_generator = pycam.PathGenerators.DropCutter.DropCutter(
+                use_height_map=(height_map == "height_map"),
+                inverse_tool=(height_map == "inverse_tool"))
         path_pattern = process["parameters"]["path_pattern"]
         path_get_func = self.core.get_parameter_sets(
                 "path_pattern")[path_pattern["name"]]["func"]
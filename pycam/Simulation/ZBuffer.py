@@ -24,6 +24,7 @@ from pycam.Geometry.utils import sqrt
 from pycam.Geometry.PointUtils import *
 import ctypes
 import math
+import numpy
 
 
 try:
@@ -40,6 +41,76 @@ NUM_PER_CELL_Y = 10
 NUM_CELL_X = 0
 NUM_CELL_Y = 0
 
+# upper limit for the number of (triangle, node) pairs that are evaluated at
+# once by "get_triangle_heights"
+MAX_PAIRS_PER_STEP = 2 ** 20
+
+
+def get_triangle_heights(points, xs, ys, minz):
+    """ vectorized version of "ZBuffer.add_triangle" for many triangles
+
+    @value points: array (triangles x 3 x 3) of the vertices of the triangles
+    @value xs: increasing x coordinates of the columns of the buffer
+    @value ys: increasing y coordinates of the rows of the buffer
+    @returns: array (rows x columns) of the height of the highest triangle
+        above each node of the buffer - or "minz" (without a triangle)
+    """
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    ys = numpy.asarray(ys, dtype=numpy.float64)
+    heights = numpy.zeros((len(ys), len(xs))) + minz
+    points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 3, 3))
+    p1, p2, p3 = points[:, 0], points[:, 1], points[:, 2]
+    v0 = p3 - p1
+    v1 = p2 - p1
+    dot00 = (v0[:, :2] ** 2).sum(axis=1)
+    dot01 = (v0[:, :2] * v1[:, :2]).sum(axis=1)
+    dot11 = (v1[:, :2] ** 2).sum(axis=1)
+    denom = dot00 * dot11 - dot01 * dot01
+    # vertical triangles don't cover any node
+    valid = denom != 0
+    p1, v0, v1 = p1[valid], v0[valid], v1[valid]
+    dot00, dot01, dot11 = dot00[valid], dot01[valid], dot11[valid]
+    inv_denom = 1 / denom[valid]
+    # the range of columns and rows covered by each triangle (plus one)
+    mins = points[valid].min(axis=1)
+    maxs = points[valid].max(axis=1)
+    x_start = numpy.maximum(0, numpy.searchsorted(xs, mins[:, 0]) - 1)
+    x_end = numpy.minimum(len(xs), numpy.searchsorted(xs, maxs[:, 0]) + 1)
+    y_start = numpy.maximum(0, numpy.searchsorted(ys, mins[:, 1]) - 1)
+    y_end = numpy.minimum(len(ys), numpy.searchsorted(ys, maxs[:, 1]) + 1)
+    columns = numpy.maximum(0, x_end - x_start)
+    counts = columns * numpy.maximum(0, y_end - y_start)
+    # process groups of triangles with a limited number of nodes
+    group_start = 0
+    cumulated = numpy.cumsum(counts)
+    while group_start < len(counts):
+        group_end = numpy.searchsorted(cumulated, cumulated[group_start]
+                - counts[group_start] + MAX_PAIRS_PER_STEP, side="right")
+        group_end = max(group_end, group_start + 1)
+        group = numpy.arange(group_start, group_end)
+        group_start = group_end
+        group_counts = counts[group]
+        triangles = numpy.repeat(group, group_counts)
+        offsets = numpy.arange(group_counts.sum()) \
+                - numpy.repeat(numpy.cumsum(group_counts) - group_counts,
+                        group_counts)
+        column = x_start[triangles] + offsets % columns[triangles]
+        row = y_start[triangles] + offsets // columns[triangles]
+        v2x = xs[column] - p1[triangles, 0]
+        v2y = ys[row] - p1[triangles, 1]
+        dot02 = v0[triangles, 0] * v2x + v0[triangles, 1] * v2y
+        dot12 = v1[triangles, 0] * v2x + v1[triangles, 1] * v2y
+        u = (dot11[triangles] * dot02 - dot01[triangles] * dot12) \
+                * inv_denom[triangles]
+        v = (dot00[triangles] * dot12 - dot01[triangles] * dot02) \
+                * inv_denom[triangles]
+        inside = (u >= -EPSILON) & (v >= -EPSILON) & (u + v <= 1 - EPSILON)
+        triangles, row, column = triangles[inside], row[inside], column[inside]
+        pz = p1[triangles, 2] + v0[triangles, 2] * u[inside] \
+                + v1[triangles, 2] * v[inside]
+        numpy.maximum.at(heights, (row, column), pz)
+    return heights
+
 
 class ZBufferItem(object):
     def __init__(self, z=0.0):
@@ -103,8 +174,21 @@ class ZBuffer(object):
                 self.buf[y][x].changed = True
 
     def add_triangles(self, triangles):
-        for t in triangles:
-            self.add_triangle(t)
+        points = [(t.p1[:3], t.p2[:3], t.p3[:3]) for t in triangles]
+        if not points:
+            return
+        # the last row and column are not covered (see "add_triangle")
+        heights = get_triangle_heights(points, self.x[:-1], self.y[:-1],
+                -numpy.inf)
+        for y, x in zip(*numpy.nonzero(heights > -numpy.inf)):
+            pz = float(heights[y, x])
+            if pz > self.buf[y][x].z:
+                self.buf[y][x].z = pz
+                self.buf[y+0][x+0].changed = True
+                self.buf[y+0][x+1].changed = True
+                self.buf[y+1][x+0].changed = True
+                self.buf[y+1][x+1].changed = True
+                self.changed = True
 
     def add_triangle(self, t):
         minx = int((t.minx - self.minx) / (self.maxx - self.minx) \
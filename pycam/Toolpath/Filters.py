@@ -28,6 +28,7 @@ from pycam.Toolpath import MOVE_STRAIGHT, MOVE_STRAIGHT_RAPID, MOVE_SAFETY, \
 from pycam.Geometry.PointUtils import padd, psub, pmul, pdist, pnear, \
         ptransform_by_matrix
 from pycam.Geometry.Line import Line
+from pycam.Geometry.PolygonBoolean import get_split_lines
 from pycam.Geometry.utils import epsilon
 import pycam.Utils.log
 
@@ -279,6 +280,15 @@ class Crop(BaseFilter):
     WEIGHT = 90
 
     def filter_toolpath(self, toolpath):
+        # split all lines at once
+        lines = []
+        last_pos = None
+        for move_type, args in toolpath:
+            if move_type in (MOVE_STRAIGHT, MOVE_STRAIGHT_RAPID):
+                if last_pos:
+                    lines.append(Line(last_pos, args))
+                last_pos = args
+        split_lines = iter(get_split_lines(self.settings["polygons"], lines))
         new_path = []
         last_pos = None
         optional_moves = []
@@ -286,10 +296,7 @@ class Crop(BaseFilter):
             if move_type in (MOVE_STRAIGHT, MOVE_STRAIGHT_RAPID):
                 if last_pos:
                     # find all remaining pieces of this line
-                    inner_lines = []
-                    for polygon in self.settings["polygons"]:
-                        inner, outer = polygon.split_line(Line(last_pos, args))
-                        inner_lines.extend(inner)
+                    inner_lines = split_lines.next()[0]
                     # turn these lines into moves
                     for line in inner_lines:
                         if pdist(line.p1, last_pos) > epsilon:
@@ -41,7 +41,10 @@ PATH_GENERATORS = frozenset(("DropCutter", "PushCutter", "EngraveCutter",
         "ContourFollow"))
 PATH_POSTPROCESSORS = frozenset(("ContourCutter", "PathAccumulator",
         "PolygonCutter", "SimpleCutter", "ZigZagCutter"))
-CALCULATION_BACKENDS = frozenset((None, "ODE"))
+CALCULATION_BACKENDS = frozenset((None, "ODE", "NumPy", "HeightMap",
+        "InverseTool"))
+# these backends are only available for the DropCutter
+DROP_CUTTER_BACKENDS = frozenset(("NumPy", "HeightMap", "InverseTool"))
 
 
 def generate_toolpath_from_settings(model, tp_settings, callback=None):
@@ -228,12 +231,16 @@ def generate_toolpath(model, tool_settings=None,
                 contour_model.minz, contour_model.maxz)
         if contour_model:
             return "No part of the contour model is within the bounding box."
+    if (calculation_backend in DROP_CUTTER_BACKENDS) \
+            and (path_generator != "DropCutter"):
+        return ("The calculation backend '%s' is only available for the " \
+                + "'DropCutter' path generator.") % calculation_backend
     physics = _get_physics(trimesh_models, cutter, calculation_backend)
     if isinstance(physics, basestring):
         return physics
     generator = _get_pathgenerator_instance(trimesh_models, contour_model,
             cutter, path_generator, path_postprocessor, physics,
-            milling_style)
+            milling_style, calculation_backend)
     if isinstance(generator, basestring):
         return generator
     overlap = overlap_percent / 100.0
@@ -264,8 +271,8 @@ def generate_toolpath(model, tool_settings=None,
                 step_width=step_width, grid_direction=direction_dict[direction],
                 milling_style=milling_style_grid[milling_style])
         if path_generator == "DropCutter":
-            toolpath = generator.GenerateToolPath(motion_grid, minz, maxz,
-                    callback)
+            toolpath = generator.GenerateToolPath(cutter, trimesh_models,
+                    motion_grid, minz, maxz, callback)
         else:
             toolpath = generator.GenerateToolPath(motion_grid, callback)
     elif path_generator == "EngraveCutter":
@@ -290,21 +297,19 @@ def generate_toolpath(model, tool_settings=None,
     return toolpath
     
 def _get_pathgenerator_instance(trimesh_models, contour_model, cutter,
-        pathgenerator, pathprocessor, physics, milling_style):
+        pathgenerator, pathprocessor, physics, milling_style,
+        calculation_backend=None):
     if pathgenerator != "EngraveCutter" and contour_model:
         return ("The only available toolpath strategy for 2D contour models " \
                 + "is 'Engraving'.")
     if pathgenerator == "DropCutter":
-        if pathprocessor == "ZigZagCutter":
-            processor = PathAccumulator.PathAccumulator(zigzag=True)
-        elif pathprocessor == "PathAccumulator":
-            processor = PathAccumulator.PathAccumulator()
-        else:
+        if not pathprocessor in ("ZigZagCutter", "PathAccumulator"):
             return ("Invalid postprocessor (%s) for 'DropCutter': only " \
                     + "'ZigZagCutter' or 'PathAccumulator' are allowed") \
                     % str(pathprocessor)
-        return DropCutter.DropCutter(cutter, trimesh_models, processor,
-                physics=physics)
+        return DropCutter.DropCutter(physics=physics,
+                use_height_map=(calculation_backend == "HeightMap"),
+                inverse_tool=(calculation_backend == "InverseTool"))
     elif pathgenerator == "PushCutter":
         if pathprocessor == "PathAccumulator":
             processor = PathAccumulator.PathAccumulator()
@@ -363,6 +368,15 @@ def _get_physics(models, cutter, calculation_backend):
             return "The ODE library returned an unexpected error " + \
                     "condition. You need to to disable ODE for this " + \
                     "calculation. Sorry!"
+    elif calculation_backend == "NumPy":
+        import pycam.Physics.numpy_physics as numpy_physics
+        try:
+            return numpy_physics.generate_physics(models, cutter)
+        except ValueError, err_msg:
+            return str(err_msg)
+    elif calculation_backend in ("HeightMap", "InverseTool"):
+        # the DropCutter calculates its height map by itself
+        return None
     else:
         return "Invalid calculation backend (%s): not one of %s" \
                 % (calculation_backend, CALCULATION_BACKENDS)
@@ -24,6 +24,8 @@ from pycam.Geometry.PointUtils import *
 from pycam.Geometry.Line import Line
 from pycam.Geometry.utils import epsilon
 from pycam.Geometry.Polygon import PolygonSorter
+from pycam.Geometry.PolygonOffset import is_offset_supported, \
+        get_offset_polygons
 import pycam.Utils.log
 import pycam.Geometry
 
@@ -491,22 +493,40 @@ def get_pocketing_polygons(polygons, offset, pocketing_type, callback=None):
     else:
         _log.warning("Invalid pocketing type given: %d" % str(pocketing_type))
         return polygons
-    # For now we use only the polygons that do not surround any other
-    # polygons. Sorry - the pocketing is currently very simple ...
+    # Closed polygons with the opposite direction inside of a base polygon
+    # are islands. Base polygons surrounding any other polygons are skipped.
     base_filtered_polygons = []
     for candidate in base_polygons:
         if callback and callback():
             # we were interrupted
             return polygons
+        islands = []
         for other in other_polygons:
             if candidate.is_polygon_inside(other):
-                break
+                if other.is_closed and is_offset_supported(candidate) \
+                        and is_offset_supported(other):
+                    islands.append(other)
+                else:
+                    break
         else:
-            base_filtered_polygons.append(candidate)
+            base_filtered_polygons.append((candidate, islands))
     # start the pocketing for all remaining polygons
     pocket_polygons = []
-    for base_polygon in base_filtered_polygons:
+    for base_polygon, islands in base_filtered_polygons:
         pocket_polygons.append(base_polygon)
+        pocket_polygons.extend(islands)
+        if is_offset_supported(base_polygon):
+            # the base polygon and its islands are shifted together
+            current_queue = [base_polygon] + islands
+            pocket_depth = 0
+            while current_queue and (pocket_depth < pocketing_limit):
+                current_queue = get_offset_polygons(current_queue, offset,
+                        callback=callback)
+                if current_queue is None:
+                    return polygons
+                pocket_polygons.extend(current_queue)
+                pocket_depth += 1
+            continue
         current_queue = [base_polygon]
         next_queue = []
         pocket_depth = 0
@@ -132,6 +132,7 @@ def get_support_grid(minx, maxx, miny, maxy, z_plane, dist_x, dist_y, thickness,
             dist_x, dist_y, offset_x, offset_y, adjustments_x, adjustments_y)
     # create all x grid lines
     grid_model = Model()
+    grid_model.begin_bulk_update()
     # convert all inputs to "number"
     thickness = number(thickness)
     height = number(height)
@@ -148,6 +149,7 @@ def get_support_grid(minx, maxx, miny, maxy, z_plane, dist_x, dist_y, thickness,
         grid_model += _add_aligned_cuboid_to_model(minx - length_extension,
                 maxx + length_extension, line_y - thick_half,
                 line_y + thick_half, z_plane, z_plane + height)
+    grid_model.end_bulk_update()
     return grid_model
 
 def get_support_distributed(model, z_plane, average_distance,
@@ -175,6 +177,7 @@ def get_support_distributed(model, z_plane, average_distance,
         bridge_calculator = _get_corner_bridges
     else:
         bridge_calculator = _get_edge_bridges
+    result.begin_bulk_update()
     for polygon in polygons:
         # no grid for _small_ inner polygons
         # TODO: calculate a reasonable factor (see below)
@@ -185,6 +188,7 @@ def get_support_distributed(model, z_plane, average_distance,
                 average_distance, avoid_distance)
         for pos, direction in bridges:
             _add_cuboid_to_model(result, pos, pmul(direction, length), height, thickness)
+    result.end_bulk_update()
     return result
 
 
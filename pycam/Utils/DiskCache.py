@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+$Id$
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+import time
+import cPickle as pickle
+
+import pycam.Utils.log
+import pycam.Utils.locations
+
+
+# increase this number whenever the format of cached data changes
+CACHE_FORMAT_VERSION = 1
+CACHE_FILE_EXTENSION = ".pickle"
+TEMP_FILE_EXTENSION = ".tmp"
+# The least recently used items are removed, if the cache exceeds this size.
+MAX_CACHE_SIZE = 256 * 1024 * 1024
+# The cache is checked after writing this fraction of its maximum size.
+CLEANUP_INTERVAL_FACTOR = 0.1
+# left-over temporary files of crashed processes are removed after a while
+TEMP_FILE_MAX_AGE = 3600
+
+
+log = pycam.Utils.log.get_logger()
+
+
+class DiskCache(object):
+    """ Store (picklable) data in files below a cache directory.
+    Every item is identified by a key (e.g. the content hash of a model) and a
+    name (the type of the data, e.g. "triangle_index"). Failures are never
+    fatal: "get" returns None for unusable items and "set" just gives up.
+    The size of the cache is limited: the least recently used items (by
+    modification time) are removed.
+    """
+
+    def __init__(self, cache_dir=None, max_size=MAX_CACHE_SIZE):
+        if cache_dir is None:
+            cache_dir = pycam.Utils.locations.get_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._write_failed = False
+        # the cache is checked with the first write of a session
+        self._written_size = None
+
+    def is_enabled(self):
+        return bool(self.cache_dir) and not self._write_failed
+
+    def _get_filename(self, key, name):
+        basename = "%s-%s-v%d%s" % (key, name, CACHE_FORMAT_VERSION,
+                CACHE_FILE_EXTENSION)
+        # spread the files over a few sub directories
+        return os.path.join(self.cache_dir, key[:2], basename)
+
+    def get(self, key, name):
+        if not self.is_enabled():
+            return None
+        filename = self._get_filename(key, name)
+        if not os.path.isfile(filename):
+            return None
+        try:
+            cache_file = open(filename, "rb")
+            try:
+                value = pickle.load(cache_file)
+            finally:
+                cache_file.close()
+            # mark the item as recently used
+            os.utime(filename, None)
+            return value
+        except Exception, err_msg:
+            # broken or incompatible files are simply ignored
+            log.debug("DiskCache: failed to read '%s': %s" % \
+                    (filename, err_msg))
+            return None
+
+    def set(self, key, name, value):
+        if not self.is_enabled():
+            return
+        filename = self._get_filename(key, name)
+        directory = os.path.dirname(filename)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # write to a temporary file first - other processes may read
+            # the same item at the same time
+            handle, temp_filename = tempfile.mkstemp(dir=directory,
+                    suffix=TEMP_FILE_EXTENSION)
+            try:
+                temp_file = os.fdopen(handle, "wb")
+                try:
+                    pickle.dump(value, temp_file, pickle.HIGHEST_PROTOCOL)
+                finally:
+                    temp_file.close()
+            except:
+                # don't leave incomplete files in the cache
+                _remove_file(temp_filename)
+                raise
+            size = os.path.getsize(temp_filename)
+            try:
+                os.rename(temp_filename, filename)
+            except OSError:
+                # windows: the target exists (stored by another process)
+                os.remove(temp_filename)
+        except (IOError, OSError, pickle.PicklingError), err_msg:
+            log.info(("DiskCache: disabling the cache after failing to " \
+                    + "write '%s': %s") % (filename, err_msg))
+            self._write_failed = True
+            return
+        if (self._written_size is None) or (self._written_size + size
+                > CLEANUP_INTERVAL_FACTOR * self.max_size):
+            self._written_size = 0
+            self.cleanup()
+        else:
+            self._written_size += size
+
+    def cleanup(self):
+        """ Remove the least recently used items, if the cache is too big.
+        Left-over temporary files and items of other format versions are
+        removed, too.
+        """
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        suffix = "-v%d%s" % (CACHE_FORMAT_VERSION, CACHE_FILE_EXTENSION)
+        now = time.time()
+        items = []
+        for directory, dirnames, filenames in os.walk(self.cache_dir):
+            for basename in filenames:
+                filename = os.path.join(directory, basename)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    # removed by another process
+                    continue
+                if basename.endswith(TEMP_FILE_EXTENSION):
+                    if now - stat.st_mtime > TEMP_FILE_MAX_AGE:
+                        _remove_file(filename)
+                elif basename.endswith(suffix):
+                    items.append((stat.st_mtime, stat.st_size, filename))
+                elif basename.endswith(CACHE_FILE_EXTENSION):
+                    _remove_file(filename)
+        total_size = sum([size for mtime, size, filename in items])
+        if total_size <= self.max_size:
+            return
+        items.sort()
+        removed = 0
+        for mtime, size, filename in items:
+            if total_size <= self.max_size:
+                break
+            _remove_file(filename)
+            total_size -= size
+            removed += 1
+        log.debug("DiskCache: removed %d old items" % removed)
+
+
+def _remove_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+_cache = None
+
+def get_cache():
+    """ Returns the shared cache (based on the default cache directory). """
+    global _cache
+    if _cache is None:
+        _cache = DiskCache()
+    return _cache
+
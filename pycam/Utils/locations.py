@@ -28,6 +28,8 @@ import pycam.Utils.log
 
 DATA_DIR_ENVIRON_KEY = "PYCAM_DATA_DIR"
 FONT_DIR_ENVIRON_KEY = "PYCAM_FONT_DIR"
+# an empty value disables the cache
+CACHE_DIR_ENVIRON_KEY = "PYCAM_CACHE_DIR"
 
 # this directory represents the base of the development tree
 PROJECT_BASE_DIR = os.path.realpath(os.path.join(os.path.dirname(
@@ -98,6 +100,24 @@ def get_font_dir():
                     ":".join(FONT_DIRS_FALLBACK))
             return None
 
+def get_cache_dir():
+    """ Returns the directory for cached data (e.g. spatial indexes of models)
+    or None (if caching is disabled).
+    """
+    if CACHE_DIR_ENVIRON_KEY in os.environ:
+        cache_dir = os.environ[CACHE_DIR_ENVIRON_KEY]
+        if not cache_dir:
+            return None
+        return os.path.normpath(cache_dir)
+    if "LOCALAPPDATA" in os.environ:
+        # windows
+        return os.path.join(os.environ["LOCALAPPDATA"], "pycam", "cache")
+    if "XDG_CACHE_HOME" in os.environ:
+        base_dir = os.environ["XDG_CACHE_HOME"]
+    else:
+        base_dir = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base_dir, "pycam")
+
 def get_external_program_location(key):
     extensions = ["", ".exe"]
     potential_names = ["%s%s" % (key, ext) for ext in extensions]
@@ -25,6 +25,7 @@ import pycam.Utils
 # multiprocessing is imported later
 #import multiprocessing
 import Queue
+import atexit
 import signal
 import socket
 import platform
@@ -33,6 +34,10 @@ import uuid
 import time
 import os
 import sys
+import tempfile
+import StringIO
+import cPickle as pickle
+import numpy
 
 
 log = pycam.Utils.log.get_logger()
@@ -57,6 +62,10 @@ else:
 
 DEFAULT_PORT = 1250
 
+# arrays (e.g. the triangles of a model) with at least this size (in bytes)
+# are shared with the workers of the local process pool via memory mapping
+MIN_SHARED_ARRAY_SIZE = 4096
+
 
 #TODO: create one or two classes for these functions (to get rid of the globals)
 
@@ -75,6 +84,15 @@ __task_source_uuid = None
 __finished_jobs = []
 __issued_warnings = []
 
+# the persistent pool of local worker processes
+__local_pool = None
+# data items (key -> LocalDataHandle) published for the local pool
+__published_items = {}
+# number of running jobs using a published item (key -> count)
+__published_usage = {}
+# items loaded by a local worker process (key -> value)
+__worker_items = {}
+
 
 def run_in_parallel(*args, **kwargs):
     global __manager
@@ -342,6 +360,7 @@ def init_threading(number_of_processes=None, enable_server=False, remote=None,
 
 def cleanup():
     global __multiprocessing, __manager, __closing
+    _cleanup_local_pool()
     if __multiprocessing and __closing:
         log.debug("Shutting down process handler")
         try:
@@ -637,32 +656,272 @@ def _cleanup_job(job_id, tasks_queue, pending_tasks, finished_jobs):
         finished_jobs.pop(0)
 
 
+class LocalDataHandle(object):
+    """ reference to a data item (e.g. a model) that was published for the
+    workers of the local process pool
+    """
+
+    def __init__(self, key, filename, state_offset):
+        self.key = key
+        self.filename = filename
+        self.state_offset = state_offset
+
+
+def _get_publication_key(item):
+    """ Models are identified by the hash of their content. They are
+    published only once and kept for the following jobs. Other items are
+    published for a single job.
+    @returns: the key of a model or None
+    """
+    # imported here - the models depend on this module
+    from pycam.Geometry.Model import Model
+    if isinstance(item, Model):
+        return "model-%s" % item.uuid
+    else:
+        return None
+
+def _publish_local_data(value, key=None):
+    """ Store the value in a file and return a handle for it. Large arrays
+    (e.g. the triangles and the spatial index of a model) are written
+    separately and mapped into the memory of the workers (see
+    "_get_local_data"). Thus the pages of these arrays are shared by all
+    workers. The pickled handle is tiny compared to the value.
+    @value key: the key of a model (see "_get_publication_key") or None for
+        items of a single job
+    """
+    global __published_items
+    if key is None:
+        key = str(uuid.uuid4())
+    elif key in __published_items:
+        return __published_items[key]
+    if hasattr(value, "build_indices"):
+        # the workers should not need to build the indices on their own
+        value.build_indices()
+    handle, filename = tempfile.mkstemp(prefix="pycam-", suffix=".data")
+    data_file = os.fdopen(handle, "wb")
+    arrays = {}
+    def get_array_id(obj):
+        if not isinstance(obj, numpy.ndarray) or obj.dtype.hasobject \
+                or (obj.nbytes < MIN_SHARED_ARRAY_SIZE):
+            return None
+        if not id(obj) in arrays:
+            # keep the offsets aligned
+            offset = data_file.tell()
+            offset += -offset % 64
+            data_file.seek(offset)
+            numpy.ascontiguousarray(obj).tofile(data_file)
+            arrays[id(obj)] = (obj, "%d:%s:%s" % (offset, obj.dtype.str,
+                    ",".join([str(size) for size in obj.shape])))
+        return arrays[id(obj)][1]
+    try:
+        try:
+            state = StringIO.StringIO()
+            pickler = pickle.Pickler(state, pickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = get_array_id
+            pickler.dump(value)
+            data_file.seek(0, os.SEEK_END)
+            state_offset = data_file.tell()
+            data_file.write(state.getvalue())
+        finally:
+            data_file.close()
+    except:
+        _remove_file(filename)
+        raise
+    __published_items[key] = LocalDataHandle(key, filename, state_offset)
+    return __published_items[key]
+
+def _unpublish_local_data(key):
+    global __published_items
+    handle = __published_items.pop(key, None)
+    if not handle is None:
+        _remove_file(handle.filename)
+
+def _remove_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+def _get_local_data(handle):
+    """ load a published item within a worker process (only once) """
+    global __worker_items
+    if not handle.key in __worker_items:
+        arrays = {}
+        def load_array(array_id):
+            if not array_id in arrays:
+                offset, dtype, shape = array_id.split(":")
+                shape = tuple([int(size) for size in shape.split(",")
+                        if size])
+                # the pages are written only in the rare case of a
+                # modification ("copy-on-write")
+                arrays[array_id] = numpy.memmap(handle.filename,
+                        dtype=numpy.dtype(dtype), mode="c",
+                        offset=int(offset), shape=shape)
+            return arrays[array_id]
+        data_file = open(handle.filename, "rb")
+        try:
+            data_file.seek(handle.state_offset)
+            unpickler = pickle.Unpickler(data_file)
+            unpickler.persistent_load = load_array
+            __worker_items[handle.key] = unpickler.load()
+        finally:
+            data_file.close()
+    return __worker_items[handle.key]
+
+def _drop_stale_local_data(handles):
+    """ Forget the items of previous jobs (e.g. a model replaced by its
+    transformed version) within a worker process.
+    """
+    global __worker_items
+    keys = set([handle.key for handle in handles])
+    for key in __worker_items.keys():
+        if not key in keys:
+            del __worker_items[key]
+
+def _get_same_container(container, items):
+    """ return the items in a container of the same type as the original """
+    for container_type in (tuple, frozenset, set):
+        if isinstance(container, container_type):
+            return container_type(items)
+    return list(items)
+
+def _get_cacheable_items(args):
+    """ the cacheable items (see "run_in_parallel_remote") of a task """
+    for arg in args:
+        if hasattr(arg, "uuid"):
+            yield arg
+        elif isinstance(arg, (list, set, frozenset, tuple)):
+            for item in arg:
+                if hasattr(item, "uuid"):
+                    yield item
+
+def _replace_local_data(args_list):
+    """ Replace cacheable items, that are shared by multiple tasks of a job,
+    with handles. Items used by a single task are pickled along with the task
+    anyway. Shared items are recognized by their identity - the uuid of some
+    objects (e.g. cutters) does not cover all of their state. Only the
+    models are identified by their content (see "_get_publication_key").
+    @returns: the tasks' arguments and the handles of the job
+    """
+    usage = {}
+    for args in args_list:
+        for item_id in set([id(item)
+                for item in _get_cacheable_items(args)]):
+            usage[item_id] = usage.get(item_id, 0) + 1
+    handles = {}
+    def replace(item):
+        if usage.get(id(item), 0) < 2:
+            return item
+        if not id(item) in handles:
+            handles[id(item)] = _publish_local_data(item,
+                    key=_get_publication_key(item))
+        return handles[id(item)]
+    result = []
+    for args in args_list:
+        new_args = []
+        for arg in args:
+            if hasattr(arg, "uuid"):
+                new_args.append(replace(arg))
+            elif isinstance(arg, (list, set, frozenset, tuple)):
+                new_args.append(_get_same_container(arg, [replace(item)
+                        if hasattr(item, "uuid") else item for item in arg]))
+            else:
+                new_args.append(arg)
+        result.append(_get_same_container(args, new_args))
+    return result, handles.values()
+
+def _begin_local_job(handles):
+    """ register the handles of a job and remove the models that were
+    published for previous jobs (and that are not used anymore)
+    """
+    global __published_usage
+    for handle in handles:
+        __published_usage[handle.key] = \
+                __published_usage.get(handle.key, 0) + 1
+    for key in __published_items.keys():
+        if not __published_usage.get(key):
+            _unpublish_local_data(key)
+
+def _finish_local_job(handles):
+    """ Remove the items that were published for this job only. The models
+    are kept for the next job.
+    """
+    global __published_usage
+    for handle in handles:
+        __published_usage[handle.key] -= 1
+        if not __published_usage[handle.key]:
+            del __published_usage[handle.key]
+            if not handle.key.startswith("model-"):
+                _unpublish_local_data(handle.key)
+
+def _run_local_task((func, args, handles)):
+    # We need to use a global function here - otherwise it does not work with
+    # the multiprocessing Pool.
+    _drop_stale_local_data(handles)
+    real_args = []
+    for arg in args:
+        if isinstance(arg, LocalDataHandle):
+            real_args.append(_get_local_data(arg))
+        elif isinstance(arg, (list, set, frozenset, tuple)):
+            real_args.append(_get_same_container(arg, [_get_local_data(item)
+                    if isinstance(item, LocalDataHandle) else item
+                    for item in arg]))
+        else:
+            real_args.append(arg)
+    return func(_get_same_container(args, real_args))
+
+def _get_local_pool():
+    global __local_pool
+    if __local_pool is None:
+        # the pool is kept for the whole session
+        __local_pool = __multiprocessing.Pool(__num_of_processes)
+        atexit.register(_cleanup_local_pool)
+    return __local_pool
+
+def _cleanup_local_pool():
+    global __local_pool, __published_usage
+    if not __local_pool is None:
+        __local_pool.terminate()
+        __local_pool = None
+    for key in __published_items.keys():
+        _unpublish_local_data(key)
+    __published_usage = {}
+
 def run_in_parallel_local(func, args, unordered=False,
         disable_multiprocessing=False, callback=None):
-    global __multiprocessing, __num_of_processes
+    global __multiprocessing, __num_of_processes, __local_pool
     if __multiprocessing is None:
         # threading was not configured before
         init_threading()
     if __multiprocessing and not disable_multiprocessing:
         # use the number of CPUs as the default number of worker threads
-        pool = __multiprocessing.Pool(__num_of_processes)
+        pool = _get_local_pool()
         if unordered:
             imap_func = pool.imap_unordered
         else:
             imap_func = pool.imap
-        # We need to use try/finally here to ensure the garbage collection
-        # of "pool". Otherwise a memory overflow is caused for Python 2.7.
+        args, handles = _replace_local_data(list(args))
+        tasks = [(func, task_args, handles) for task_args in args]
+        _begin_local_job(handles)
+        finished = False
+        # We need to use try/finally here to ensure that cancelled jobs do
+        # not keep the pool busy.
         try:
             # Beware: we may not return "pool.imap" or "pool.imap_unordered"
             # directly. It would somehow loose the focus and just hang infinitely.
             # Thus we wrap our own generator around it.
-            for result in imap_func(func, args):
+            for result in imap_func(_run_local_task, tasks):
                 if callback and callback():
                     # cancel requested
                     break
                 yield result
+            else:
+                finished = True
         finally:
-            pool.terminate()
+            if not finished:
+                # drop the remaining tasks of the cancelled job
+                _cleanup_local_pool()
+            _finish_local_job(handles)
     else:
         for arg in args:
             if callback and callback():